@@ -0,0 +1,33 @@
+"""
+Benchmarks for converting raw Gem files to miniSEED.
+"""
+import os
+import shutil
+import tempfile
+import gemlog
+from .synthetic import cached_raw_files
+
+class Convert:
+    ## one day is 12 raw files
+    params = ([1, 4, 12], [1, 4])
+    param_names = ['num_files', 'num_processes']
+    timeout = 1200
+
+    def setup(self, num_files, num_processes):
+        files = cached_raw_files(num_files, '0.91', gps_gaps = [(1800, 2400)])
+        self.rawpath = os.path.dirname(files[0])
+        self.outdir = tempfile.mkdtemp()
+        shutil.rmtree(os.path.join(self.rawpath, '.gemlog'), ignore_errors = True) # no saved raw index
+
+    def teardown(self, num_files, num_processes):
+        shutil.rmtree(self.outdir, ignore_errors = True)
+        shutil.rmtree(os.path.join(self.rawpath, '.gemlog'), ignore_errors = True)
+
+    def time_convert(self, num_files, num_processes):
+        gemlog.convert(self.rawpath, convertedpath = os.path.join(self.outdir, 'converted'),
+                       metadatapath = os.path.join(self.outdir, 'metadata'),
+                       gpspath = os.path.join(self.outdir, 'gps'), SN = '077',
+                       num_processes = num_processes)
+
+    def peakmem_convert(self, num_files, num_processes):
+        self.time_convert(num_files, num_processes)
@@ -0,0 +1,71 @@
+"""
+Benchmarks for network processing: cross-correlating stations and summarizing GPS
+data.
+"""
+import glob
+import os
+import shutil
+import numpy as np
+import obspy
+import gemlog
+from gemlog.xcorr import xcorr_all
+from .synthetic import cached_raw_files, data_dir
+
+STATIONS = ['000', '001', '002', '003']
+
+def _write_array_mseed(path, hours, seed = 0):
+    ## write hour-long miniSEED files for a small array recording a common signal with
+    ## station-dependent lags, plus independent noise
+    rng = np.random.default_rng(seed)
+    n = hours * 360000
+    signal = np.cumsum(rng.normal(0, 1, n + 100))
+    files = []
+    for i, station in enumerate(STATIONS):
+        data = signal[(5 * i):(5 * i + n)] + rng.normal(0, 1, n)
+        tr = obspy.Trace(data.astype('float32'), header = {'delta': 0.01, 'station': station,
+                                                            'channel': 'HDF', 'starttime': obspy.UTCDateTime('2022-01-01')})
+        for j in range(hours):
+            t = tr.stats.starttime + 3600 * j
+            fn = os.path.join(path, t.strftime('%Y-%m-%dT%H_%M_%S') + '.' + tr.id + '.mseed')
+            tr.slice(t, t + 3600 - 0.01).write(fn)
+            files.append(fn)
+    return sorted(files)
+
+class XcorrAll:
+    params = [1, 6]
+    param_names = ['hours']
+    timeout = 1200
+
+    def setup(self, hours):
+        path = os.path.join(data_dir(), f'mseed_array_{hours}h')
+        done_file = os.path.join(path, 'complete')
+        if not os.path.exists(done_file):
+            os.makedirs(path, exist_ok = True)
+            _write_array_mseed(path, hours)
+            open(done_file, 'w').close()
+        self.files = sorted(glob.glob(os.path.join(path, '*.mseed')))
+
+    def time_xcorr_all(self, hours):
+        xcorr_all(self.files, quiet = True)
+
+class SummarizeGps:
+    ## GPS tables for 3 Gems, each converted from num_files 2-hour raw files
+    params = [1, 4]
+    param_names = ['num_files']
+    timeout = 1200
+
+    def setup(self, num_files):
+        path = os.path.join(data_dir(), f'gps_{num_files}')
+        done_file = os.path.join(path, 'complete')
+        if not os.path.exists(done_file):
+            shutil.rmtree(path, ignore_errors = True)
+            for SN in ['077', '078', '079']:
+                rawpath = os.path.dirname(cached_raw_files(num_files, '0.91', SN = SN)[0])
+                gemlog.convert(rawpath, convertedpath = os.path.join(path, 'converted'),
+                               metadatapath = os.path.join(path, 'metadata'), gpspath = path,
+                               SN = SN)
+            open(done_file, 'w').close()
+        self.path = path
+
+    def time_summarize_gps(self, num_files):
+        gemlog.summarize_gps(self.path)
@@ -0,0 +1,68 @@
+"""
+Benchmarks for reading raw Gem files: parsing single files, reading and combining
+several files, and interpolating the data onto an even time grid.
+"""
+import numpy as np
+from gemlog.parsers import parse_gemfile
+from gemlog.core import _read_single, _read_several, _interp_time
+from .synthetic import cached_raw_files
+
+class ParseGemfile:
+    ## the cython parser only reads formats 0.85C and later
+    params = (['0.85C', '0.91', '1.10'], [600, 7200])
+    param_names = ['version', 'duration']
+    timeout = 300
+
+    def setup(self, version, duration):
+        self.fn = cached_raw_files(1, version, file_duration = duration)[0].encode('utf-8')
+
+    def time_parse_gemfile(self, version, duration):
+        parse_gemfile(self.fn)
+
+class ReadSingle:
+    params = (['0.8', '0.85C', '0.91', '1.10'], [600, 7200])
+    param_names = ['version', 'duration']
+    timeout = 300
+
+    def setup(self, version, duration):
+        self.fn = cached_raw_files(1, version, file_duration = duration)[0]
+        self.read_version = '0.8' if version == '0.8' else '0.9'
+
+    def time_read_single(self, version, duration):
+        _read_single(self.fn, version = self.read_version)
+
+    def peakmem_read_single(self, version, duration):
+        _read_single(self.fn, version = self.read_version)
+
+class ReadSeveral:
+    params = (['0.91', '1.10'], [1, 4, 12])
+    param_names = ['version', 'num_files']
+    timeout = 600
+
+    def setup(self, version, num_files):
+        self.files = cached_raw_files(num_files, version)
+
+    def time_read_several(self, version, num_files):
+        _read_several(self.files)
+
+    def peakmem_read_several(self, version, num_files):
+        _read_several(self.files)
+
+class InterpTime:
+    ## hours of 100 Hz data: 360k, 2.16M, and 8.64M samples
+    params = [1, 6, 24]
+    param_names = ['hours']
+    timeout = 600
+
+    def setup(self, hours):
+        ## columns as in _assign_times: Gem millis, pressure, and time. The time
+        ## steps jitter slightly around 0.01 s, as they do after drift correction.
+        rng = np.random.default_rng(0)
+        n = hours * 360000
+        self.D = np.empty((n, 3))
+        self.D[:,0] = np.arange(n) * 10
+        self.D[:,1] = np.cumsum(rng.integers(-5, 6, n))
+        self.D[:,2] = 1.6e9 + np.cumsum(0.01 + rng.normal(0, 1e-5, n))
+
+    def time_interp_time(self, hours):
+        _interp_time(self.D)
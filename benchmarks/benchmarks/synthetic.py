@@ -0,0 +1,203 @@
+"""
+Generator of synthetic raw Gem files, for benchmarking.
+
+The files imitate real Gem output: 100 Hz pressure data timed by the Gem's
+drifting millisecond clock (with its rollovers), GPS lines once per second
+(except during GPS gaps), and metadata lines once per second, interleaved in
+the order the Gem writes them.
+"""
+import glob
+import os
+import tempfile
+import numpy as np
+import obspy
+
+VERSIONS = ['0.8', '0.85C', '0.91', '1.10']
+
+_MS_PER_SECOND = 1/0.001024 # Gem "milliseconds" are 1024 microseconds
+_GPS_HEADER = '#G,msPPS,msLag,yr,mo,day,hr,min,sec,lat,lon'
+_M_HEADER = '#M,ms,batt(V),temp(C),A2,A3,maxLag,minFree,maxUsed,maxOver,gpsFlag,freeStack1,freeStackIdle'
+
+def write_raw_file(filename, version = '0.91', SN = '077', duration = 7200,
+                   start_time = '2022-01-01T00:00:00', start_millis = 0, drift_ppm = 20,
+                   gps_gaps = [], sample_rate = 100, start_value = 0, seed = 0):
+    """
+    Write a synthetic raw Gem file.
+
+    Parameters
+    ----------
+    filename : str
+        File to write.
+    version : str, default '0.91'
+        Raw format version: '0.8', '0.85C', '0.91', or '1.10'.
+    SN : str, default '077'
+        Serial number.
+    duration : float, default 7200
+        Length of the file in seconds (real Gem files are 3600 s for 0.8, 7200 s after).
+    start_time : obspy.UTCDateTime or str
+        True time of the first sample.
+    start_millis : float, default 0
+        Gem millisecond count of the first sample (not wrapped).
+    drift_ppm : float, default 20
+        Gem clock drift in parts per million.
+    gps_gaps : list of (start, end) tuples, default []
+        Times (in seconds since start_time) when no GPS lines are written.
+    sample_rate : float, default 100
+        Nominal sample rate in Hz.
+    start_value : int, default 0
+        Pressure value (counts) before the first sample.
+    seed : int, default 0
+        Random seed for the pressure data, GPS lags, and metadata.
+
+    Returns
+    -------
+    dict with keys start_time, start_millis, and start_value, to pass to
+    write_raw_file to continue the series in the next file.
+    """
+    if version not in VERSIONS:
+        raise ValueError('version must be one of ' + str(VERSIONS))
+    rng = np.random.default_rng(seed)
+    start_time = obspy.UTCDateTime(start_time)
+    rollover = 2**16 if version == '0.8' else 2**13
+    millis_rate = _MS_PER_SECOND * (1 + drift_ppm * 1e-6) # Gem millis per true second
+
+    ## data: samples are evenly spaced on the Gem's own clock
+    num_samples = int(duration * sample_rate)
+    D_millis = start_millis + np.arange(num_samples) * _MS_PER_SECOND / sample_rate
+    end_millis = start_millis + num_samples * _MS_PER_SECOND / sample_rate
+    true_duration = (end_millis - start_millis) / millis_rate # shorter than duration if the clock is fast
+    noise = rng.normal(0, 3, num_samples) + 200 * np.sin(np.arange(num_samples) * 2 * np.pi / (30 * sample_rate))
+    values = start_value + np.round(noise).astype(int)
+    values[rng.integers(num_samples, size = num_samples // 1000)] += rng.integers(-500, 500, num_samples // 1000) # spikes
+    D_millis_int = np.floor(D_millis).astype(int)
+    if version == '0.8': # 0.8: absolute ADC values
+        D_lines = [f'D,{m % rollover},{v}' for m, v in zip(D_millis_int, values)]
+    else: # later versions: differences from the previous sample
+        diffs = np.diff(values, prepend = start_value)
+        if version == '1.10':
+            D_lines = _compact_lines(D_millis_int, diffs, rollover)
+        else:
+            D_lines = [f'D{m % rollover},{d}' for m, d in zip(D_millis_int, diffs)]
+
+    ## GPS: one line per second, written after the PPS with a lag
+    seconds = np.arange(np.ceil(float(start_time)), float(start_time) + true_duration)
+    for gap_start, gap_end in gps_gaps:
+        seconds = seconds[(seconds < float(start_time) + gap_start) | (seconds >= float(start_time) + gap_end)]
+    msPPS = start_millis + (seconds - float(start_time)) * millis_rate
+    msLag = rng.uniform(80, 300, len(seconds))
+    lat = 43.6 + rng.normal(0, 1e-5, len(seconds))
+    lon = -116.2 + rng.normal(0, 1e-5, len(seconds))
+    G_lines = []
+    for t, ms, lag, la, lo in zip(seconds, msPPS, msLag, lat, lon):
+        d = obspy.UTCDateTime(t)
+        ms_str = f'{int(ms) % rollover}' if version in ['0.8', '0.85C'] else f'{ms % rollover:.2f}'
+        G_lines.append(f'G,{ms_str},{lag:.2f},{d.year},{d.month},{d.day},{d.hour},{d.minute},{d.second:.1f},{la:.5f},{lo:.5f}')
+    G_millis = msPPS + msLag
+
+    ## metadata: one line per second
+    M_millis = start_millis + np.arange(0, true_duration - 1, 1) * millis_rate + 500
+    if version == '0.8':
+        M_lines = [f'M,{int(m) % rollover},3.75,{20 + rng.normal(0, 0.1):.1f},3,74,1,0,0,48,118' for m in M_millis]
+    else:
+        M_lines = [f'M,{int(m) % rollover},3.75,{20 + rng.normal(0, 0.1):.1f},0.9,1.0,3,74,1,0,0,48,118' for m in M_millis]
+
+    ## write the lines in the order the Gem writes them (by their unwrapped millis)
+    lines = np.array(D_lines + G_lines + M_lines, dtype = object)
+    order = np.argsort(np.concatenate([D_millis, G_millis, M_millis]), kind = 'stable')
+    header = _header(version, SN)
+    with open(filename, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        f.write('\n'.join(lines[order]) + '\n')
+    return {'start_time': start_time + true_duration, 'start_millis': end_millis, 'start_value': int(values[-1])}
+
+def write_raw_files(path, num_files, version = '0.91', SN = '077', file_duration = None,
+                    start_time = '2022-01-01T00:00:00', gps_gaps = [], drift_ppm = 20, seed = 0):
+    """
+    Write a continuous series of synthetic raw Gem files (FILE0000.SN, FILE0001.SN, ...;
+    FILE0000.TXT, ... for format 0.8).
+
+    Parameters
+    ----------
+    path : str
+        Directory to write the files in (created if necessary).
+    num_files : int
+        Number of files.
+    version, SN, start_time, drift_ppm : see write_raw_file
+    file_duration : float, default None
+        Length of each file in seconds. Default is 3600 for format 0.8, and 7200 otherwise.
+    gps_gaps : list of (start, end) tuples, default []
+        Times (in seconds since start_time, across all files) when no GPS lines are written.
+    seed : int, default 0
+        Random seed; each file uses seed + file number.
+
+    Returns
+    -------
+    list of file names
+    """
+    os.makedirs(path, exist_ok = True)
+    if file_duration is None:
+        file_duration = 3600 if version == '0.8' else 7200
+    state = {'start_time': obspy.UTCDateTime(start_time), 'start_millis': 0, 'start_value': 0}
+    files = []
+    for i in range(num_files):
+        extension = 'TXT' if version == '0.8' else SN
+        fn = os.path.join(path, f'FILE{i:04d}.{extension}')
+        offset = state['start_time'] - obspy.UTCDateTime(start_time)
+        gaps = [(start - offset, end - offset) for start, end in gps_gaps]
+        state = write_raw_file(fn, version, SN, file_duration, drift_ppm = drift_ppm, gps_gaps = gaps,
+                               seed = seed + i, **state)
+        files.append(fn)
+    return files
+
+def _header(version, SN):
+    ## header lines of a raw file
+    if version == '1.10':
+        lines = ['#GemCSV1.10', '#adcMSSAMP', '#DmsSamp,ADC', _GPS_HEADER, _M_HEADER, f'S,{SN}', '#Firmware0.962']
+    else:
+        lines = ['#GemCSV' + version, '#DmsSamp,ADC', _GPS_HEADER, _M_HEADER, f'S,{SN}', '#Firmware0.9']
+    if version in ['0.91', '1.10']:
+        lines.append('C,1,15,20,0,0,0')
+    return lines
+
+def _compact_lines(millis, diffs, rollover):
+    ## format 1.10 data lines: a pair of letters for the millis step and the pressure
+    ## difference when both are small, and otherwise a full D line (as in
+    ## gemlog.gemlog_aux._convert_raw_091_110)
+    dmillis = np.diff(millis, prepend = millis[0]) % rollover
+    compact = (np.abs(diffs) <= 12) & (np.abs(dmillis - 10) <= 12)
+    compact[0] = False
+    return [chr(dm + 99) + chr(d + 109) if c else f'D{m % rollover},{d}'
+            for m, dm, d, c in zip(millis, dmillis, diffs, compact)]
+
+def cached_raw_files(num_files, version = '0.91', SN = '077', file_duration = None, gps_gaps = []):
+    """
+    Return synthetic raw files from the benchmark data directory, writing them first
+    if they don't exist yet. Writing large files takes longer than reading them, so
+    they are kept between benchmark runs.
+
+    Parameters
+    ----------
+    num_files, version, SN, file_duration, gps_gaps : see write_raw_files
+
+    Returns
+    -------
+    list of file names
+    """
+    gaps = ''.join(f'_gap{start:g}-{end:g}' for start, end in gps_gaps)
+    name = f'{version}_{SN}_{num_files}x{file_duration}{gaps}'
+    path = os.path.join(data_dir(), 'raw', name)
+    done_file = os.path.join(path, 'complete')
+    if not os.path.exists(done_file): # not written yet, or interrupted while writing
+        write_raw_files(path, num_files, version, SN, file_duration, gps_gaps = gps_gaps)
+        open(done_file, 'w').close()
+    return sorted(glob.glob(os.path.join(path, 'FILE*')))
+
+def data_dir():
+    """
+    Directory where synthetic benchmark data are kept: $GEMLOG_BENCHMARK_DATA, or
+    gemlog_benchmarks in the system temporary directory.
+    """
+    path = os.environ.get('GEMLOG_BENCHMARK_DATA',
+                          os.path.join(tempfile.gettempdir(), 'gemlog_benchmarks'))
+    os.makedirs(path, exist_ok = True)
+    return path
@@ -1,8 +1,45 @@
-from gemlog import parsers # cython file
-from gemlog.core import Convert, ReadGem, convert, read_gem, get_gem_specs
-from gemlog.gem_network import summarize_gps, read_gps, SummarizeAllGPS, make_gem_inventory, rename_files, merge_files_day, get_gem_response, deconvolve_gem_response
-from gemlog.gemlog_aux import make_db, calc_channel_stats, gem_noise, ims_noise
-from gemlog.gem_cat import gem_cat
-from gemlog.huddle_test import verify_huddle_test
+## The public API is loaded lazily (PEP 562): 'import gemlog' only reads the version,
+## and each submodule (with its dependencies) is imported the first time one of its
+## names is used. This keeps command-line tools that need only part of gemlog fast
+## to start.
+import importlib, sys, types
 from gemlog.version import __version__
-from gemlog.huddle_test import verify_huddle_test
+
+_submodules = ['parsers', 'core', 'gem_network', 'gemlog_aux', 'gem_cat', 'huddle_test', 'xcorr',
+               'gemconvert', 'gemconvert_single']
+
+_public_names = {
+    'core': ['Convert', 'ReadGem', 'convert', 'convert_files', 'read_gem', 'get_gem_specs', 'RawIndex'],
+    'gem_network': ['summarize_gps', 'read_gps', 'SummarizeAllGPS', 'make_gem_inventory', 'rename_files',
+                    'merge_files_day', 'get_gem_response', 'deconvolve_gem_response'],
+    'gemlog_aux': ['make_db', 'calc_channel_stats', 'gem_noise', 'ims_noise'],
+    'gem_cat': ['gem_cat'],
+    'huddle_test': ['verify_huddle_test'],
+}
+_name_modules = {name: module for module, names in _public_names.items() for name in names}
+
+__all__ = ['parsers', '__version__'] + list(_name_modules)
+
+def __getattr__(name):
+    if name in _name_modules:
+        value = getattr(importlib.import_module('gemlog.' + _name_modules[name]), name)
+    elif name in _submodules:
+        value = importlib.import_module('gemlog.' + name)
+    else:
+        raise AttributeError(f"module 'gemlog' has no attribute '{name}'")
+    globals()[name] = value # later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_submodules))
+
+class _GemlogModule(types.ModuleType):
+    ## The import system binds each submodule to this package once it is loaded (e.g. by 
+    ## 'import gemlog.gem_cat' in the gem_cat console script). Where a public function has the
+    ## same name as its submodule, keep the function, as the eager imports used to.
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and (_name_modules.get(name) == name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _GemlogModule
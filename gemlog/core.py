@@ -2,14 +2,16 @@ import pdb
 import warnings
 import numpy as np
 from numpy import NaN, Inf
-import os, glob, csv, time, scipy
+import os, glob, csv, json, re, struct, time, datetime, contextlib, itertools, collections, queue, threading, zipfile, multiprocessing, scipy
 import pandas as pd
 with warnings.catch_warnings():
     warnings.simplefilter("ignore")
 import obspy
 import sys
-from scipy.io import wavfile
-import matplotlib.pyplot as plt
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+## matplotlib, scipy.io, and scipy.interpolate are imported in the functions that use them
+## so that importing gemlog.core stays fast
 
 _debug = False
 
@@ -41,7 +43,9 @@ def _breakpoint():
 def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata', \
             metadatafile = '', gpspath = 'gps', gpsfile = '', t1 = -Inf, t2 = Inf, nums = NaN, \
             SN = '', bitweight = NaN, units = 'Pa', time_adjustment = 0, blockdays = 1, \
-            file_length_hour = 24, station = '', network = '', location = '', output_format = 'MSEED'):
+            file_length_hour = 24, station = '', network = '', location = '', output_format = 'MSEED', \
+            raw_index = None, num_processes = 1, resume = False, scheduler = None, metrics = None, \
+            cache = False):
     """
     Read raw Gem files, interpolate them, and write output files in miniSEED or SAC format.
 
@@ -126,6 +130,52 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
         Output file format. Currently, formats 'MSEED' and 'SAC' are 
         supported; 'WAV' is partly supported.
 
+    raw_index : gemlog.RawIndex, default None
+        Index of the raw files in rawpath. If not provided, the raw files are
+        scanned; with resume=True, the index is also kept in convertedpath 
+        ('.gemlog/raw_index.json') for later conversions.
+
+    num_processes : int, default 1
+        Number of processes used to read blocks of raw files in parallel. Blocks are
+        joined in order, so the output is the same as with one process. Memory use
+        grows with the number of processes.
+
+    resume : bool, default False
+        If True, continue an earlier conversion of this Gem into convertedpath: only
+        raw files that are new or have changed since then are converted (starting from
+        the last block of files read before), and the existing gps and metadata files
+        are appended. If the earlier conversion cannot be continued (e.g. different 
+        settings), all files are converted again, overwriting the earlier gps and
+        metadata files. To make this possible, conversions with resume=True record
+        what they converted in convertedpath/.gemlog/<SN>_convert.json; the first
+        conversion must also use resume=True to be continued later.
+
+    scheduler : gemlog.core.BlockScheduler, default None
+        Pool of processes shared with conversions of other Gems running at the same 
+        time (in other threads). If provided, blocks of raw files are read by the 
+        scheduler's processes and num_processes is ignored.
+
+    metrics : function or str, default None
+        If provided, progress and performance metrics are reported as dicts: to this 
+        function if it is one, or else appended to this file name as JSON lines. Each 
+        dict has keys 'event', 'SN', and 'time' (epoch seconds), plus:
+
+        - 'block' events (each block of raw files read): files, bytes, samples, seconds, 
+          stage_seconds (time spent parsing ('parse'), fitting drift ('drift'), finding 
+          breaks ('breaks'), and interpolating ('interp')), rss_mb (memory of the process
+          that read the block, just after reading it; None if unknown), and 
+          process_peak_rss_mb (highest memory of that process so far, which never 
+          decreases)
+        - 'write' events (each output file written): file, samples, seconds
+        - 'done' event (end of conversion): totals of the above (max_rss_mb is the highest
+          rss_mb of any block), seconds, bytes_per_second, and samples_per_second
+
+    cache : bool, default False
+        If True, keep a cache of parsed raw files in rawpath ('.gemlog/parsed/'), so that
+        later conversions of the same files (e.g. with a different file_length_hour,
+        output_format, or station codes) don't need to parse them again. Cached files
+        are parsed again if they change or if gemlog is updated.
+
     Returns
     -------
     None, writes output files only (converted, metadata, and gps)
@@ -140,7 +190,9 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
     ## make sure the raw directory exists and has real data
     if not os.path.isdir(rawpath):
         raise MissingRawFiles('Raw directory ' + rawpath + ' does not exist')
-    if len(glob.glob(rawpath + '/FILE' +'[0-9]'*4 + '.???')) == 0:
+    if raw_index is None:
+        raw_index = RawIndex(rawpath, sidecar = _make_raw_index_filename(convertedpath) if resume else None)
+    if len(raw_index) == 0:
         raise MissingRawFiles('No data files found in directory ' + rawpath)
     try:
         SN = str(SN)
@@ -158,29 +210,28 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
     
     ## find a list of possibly eligible raw files 
     if (type(SN) is not str) or (len(SN) != 3): # check that SN is appropriately formatted...this should always happen
-        fn = glob.glob(rawpath + '/FILE' +'[0-9]'*4 + '.???')
+        fn = raw_index.names()
     else:
-        fn = glob.glob(rawpath + '/FILE' +'[0-9]'*4 + '.' + SN) + \
-            glob.glob(rawpath + '/FILE' +'[0-9]'*4 + '.TXT')
+        fn = [name for name in raw_index.names() if name[-3:] in (SN, 'TXT')]
     
     ## filter out raw files whose serial numbers don't match SN
     fn_new = []
     corrupt_files_flag = False
     for file in fn:
-        try:
-            if _read_SN(file) == SN:
-                fn_new.append(file)
-        except:
-            corrupt_files_flag = True
-            pass # if we can't read the file's SN, it's corrupt and should be skipped
+        file_SN = raw_index.record(file)['SN']
+        if file_SN is None:
+            corrupt_files_flag = True # if we can't read the file's SN, it's corrupt and should be skipped
+        elif file_SN == SN:
+            fn_new.append(os.path.join(rawpath, file))
     fn = fn_new
+    raw_index.save()
     
     ## narrow the list of raw files if nums is provided, or calculate nums if not
     nums_from_fn = np.array([int(x[-8:-4]) for x in fn]) 
     if((len(nums) == 0) or np.isnan(nums[0])):
         nums = nums_from_fn
     else: # find the intersection between the available nums and the user-defined nums
-        w = np.where([(i in nums) for i in nums_from_fn])[0]
+        w = np.where(np.isin(nums_from_fn, nums))[0]
         fn = [fn[i] for i in w]
         nums = nums_from_fn[w]
 
@@ -193,24 +244,55 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
 
     ## start at the first file in 'nums'
     nums.sort()
-    n1 = np.min(nums)
-  
-    ## read the first set of up to (24*blockdays) files
-    L = _new_gem_var()
-    while((L['data'].count() == 0) & (n1 <= max(nums))): ## read sets of files until we get one that isn't empty
-        nums_block = nums[(nums >= n1) & (nums < (n1 + (12*blockdays)))] # files are 2 hours, so 12 files is 24 hours
-        n1 = n1 + (12*blockdays) # increment file number counter
-        try:
-            L = read_gem(path = rawpath, nums = nums_block, SN = SN, network = network, station = station, location = location)
-        except MissingRawFiles: # if the block has no files, keep searching
-            continue
-        except CorruptRawFile: # if the block has no files, keep searching
-            continue
-        except: # if there's any other problem, raise it
-            raise
-    if L['data'].count() == 0:
-        raise MissingRawFiles(f'No non-corrupt raw files found in folder "{rawpath}"')
-    p = L['data']
+    raw_names = {int(x[-8:-4]): os.path.basename(x) for x in fn} # file number -> name, for the files to convert
+
+    ## if resuming, find the files that are new or have changed since the last conversion
+    settings = {'file_length_hour': float(file_length_hour), 'output_format': output_format.lower(),
+                'units': units, 'bitweight': float(bitweight), 'station': station, 'network': network,
+                'location': location, 't1': float(t1), 't2': float(t2), 'time_adjustment': time_adjustment,
+                'metadatapath': metadatapath, 'metadatafile': metadatafile, 'gpspath': gpspath, 'gpsfile': gpsfile}
+    manifest_file = _make_manifest_filename(convertedpath, SN)
+    manifest = None
+    telemetry = None if metrics is None else _ConvertMetrics(metrics, SN)
+    if resume:
+        manifest = _read_manifest(manifest_file, settings)
+        nums_new = np.array([n for n in nums if not _raw_file_converted(manifest, raw_names[n], raw_index)])
+        if len(nums_new) == 0:
+            print(f'No new raw files to convert for SN {SN}')
+            if telemetry is not None:
+                telemetry.done()
+            return
+        state = _resume_state(manifest, nums_new, convertedpath)
+    elif os.path.exists(manifest_file): # outputs are about to change, so the manifest is no longer valid
+        os.remove(manifest_file)
+    if (not resume) or (state is None):
+        if manifest is not None: # converting everything again: overwrite the old gps and metadata files
+            metadatafile = metadatafile or manifest['metadatafile']
+            gpsfile = gpsfile or manifest['gpsfile']
+        manifest = None
+        state = {'carry': [], 'hour_to_write': None}
+    state['written'] = []
+    
+    ## read blocks of (12*blockdays) files one at a time; the first non-empty one sets up the outputs
+    if manifest is None:
+        blocks = _iter_gem_blocks(rawpath, nums, SN, blockdays, raw_index, network = network, station = station, location = location, num_processes = num_processes, scheduler = scheduler, cache = cache)
+        if telemetry is not None:
+            blocks = telemetry.blocks(blocks)
+        L = next(blocks, None)
+        if L is None:
+            raise MissingRawFiles(f'No non-corrupt raw files found in folder "{rawpath}"')
+    else: # continue from the start of the last block read in the previous conversion
+        blockdays = manifest['blockdays']
+        block_start = manifest['checkpoint']['block_start']
+        print(f'Resuming conversion of SN {SN} from raw file {int(np.ceil(block_start))}')
+        blocks = _iter_gem_blocks(rawpath, nums[nums >= block_start], SN, blockdays, raw_index, network = network, station = station, location = location, num_processes = num_processes, n1 = block_start, scheduler = scheduler, cache = cache)
+        if telemetry is not None:
+            blocks = telemetry.blocks(blocks)
+        t1 = obspy.core.UTCDateTime(manifest['t1'])
+        bitweight = manifest['bitweight']
+        metadatafile = manifest['metadatafile']
+        gpsfile = manifest['gpsfile']
+        L = None
     
     ## if bitweight isn't set, use the default bitweight for the logger version, config, and units
     if(np.isnan(bitweight)):
@@ -223,18 +305,21 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
       
     ## if not specified, define t1 as the earliest integer-second time available
     if(np.isinf(float(t1))):
-        p = L['data']
-        p.merge()
-        t1 = p[0].stats.starttime
+        t1 = min([tr.stats.starttime for tr in L['data']])
         t1 = obspy.core.UTCDateTime(np.ceil(float(t1)))
+    else:
+        t1 = obspy.core.UTCDateTime(t1)
 
     if(np.isinf(float(t2))):
         t2 = obspy.core.UTCDateTime.strptime('9999-12-31 23:59:59', '%Y-%m-%d %H:%M:%S') # timekeeping apocalypse
+    else:
+        t2 = obspy.core.UTCDateTime(t2)
   
-    wsn = 0
-    while(len(SN) < 3): # take the first non-NA SN. This is important because there can be blank files in there.
-        wsn = wsn+1
-        SN = L['header']['SN'][wsn]
+    if L is not None:
+        wsn = 0
+        while(len(SN) < 3): # take the first non-NA SN. This is important because there can be blank files in there.
+            wsn = wsn+1
+            SN = L['header']['SN'][wsn]
   
     ## set up the gps and metadata files. create directories if necessary
     if(len(gpsfile) == 0):
@@ -264,89 +349,597 @@ def convert(rawpath = '.', convertedpath = 'converted', metadatapath = 'metadata
             print('Failed to make directory ' + convertedpath)
             sys.exit(2)
   
-    ## start metadata and gps files
-    metadata = L['metadata']   
-    gps = L['gps']
-    metadata.to_csv(metadatafile, index=False) ## change to metadata format. need to make ScanMnetadata compatible with both
+    if L is not None:
+        ## start metadata and gps files
+        state['checkpoint'] = _take_checkpoint(L['block_start'], state, metadatafile, gpsfile)
+        metadata = L['metadata']   
+        gps = L['gps']
+        metadata.to_csv(metadatafile, index=False) ## change to metadata format. need to make ScanMnetadata compatible with both
+
+        wgps = (gps['t'] > (t1 - 1)) 
+        if(len(wgps) > 0):
+            gps[wgps].to_csv(gpsfile, index=False)
+        streams = itertools.chain([L['data']], _append_block_metadata(blocks, metadatafile, gpsfile, state))
+        del L
+    else:
+        streams = _append_block_metadata(blocks, metadatafile, gpsfile, state)
+
+    ## pipeline: raw blocks -> timed data streams -> output-file-length chunks -> writer.
+    ## Only the data not yet written is held between blocks, so memory use does not grow
+    ## with the number of raw files. Files are written in a background thread while the
+    ## next raw files are read.
+    chunks = _iter_output_chunks(streams, t1, t2, file_length_sec, state)
+    _write_traces_background(chunks, bitweight, convertedpath, output_format, written = state['written'], metrics = telemetry)
+
+    ## record what was converted, so that a later conversion can resume from the last block
+    if resume and ('checkpoint' in state):
+        nums_read = nums[nums < (state['checkpoint']['block_start'] + 12*blockdays)]
+        raw_files = {} if manifest is None else manifest['raw_files']
+        for n in nums_read:
+            record = raw_index.record(raw_names[n])
+            raw_files[raw_names[n]] = [record['size'], record['mtime']]
+        output_files = [] if manifest is None else manifest['output_files']
+        output_files = list(dict.fromkeys(output_files + state['written']))
+        checkpoint = dict(state['checkpoint'])
+        checkpoint['rewrite_files'] = state['written'][checkpoint.pop('num_written'):]
+        _write_manifest(manifest_file, {'SN': SN, 'settings': settings, 'blockdays': blockdays,
+                                        't1': float(t1), 'bitweight': float(bitweight),
+                                        'metadatafile': metadatafile, 'gpsfile': gpsfile,
+                                        'raw_files': raw_files, 'output_files': output_files,
+                                        'checkpoint': checkpoint})
+    if telemetry is not None:
+        telemetry.done()
 
-    wgps = (gps['t'] > (t1 - 1)) 
-    if(len(wgps) > 0):
-        gps[wgps].to_csv(gpsfile, index=False)
+Convert = convert # alias; v1.0.0
 
-    hour_to_write = max(t1, p[0].stats.starttime)
-    
-    ## read sets of (12*blockdays) files until all the files are converted
-    while(True):
-        ## check to see if we're done
-        if(n1 > np.max(nums)):
-            break # out of raw data to convert
-        if((t1 > t2) & (not np.isnan(t1 > t2))):
-            break # already converted the requested data
-        ## load new data if necessary
-        tt2 = min(t2, _trunc_UTCDateTime(t1, 86400*blockdays) + 86400*blockdays)
-        while((p[-1].stats.endtime < tt2) & (n1 <= max(nums))):
-            try:
-                L = read_gem(path = rawpath, nums = nums[(nums >= n1) & (nums < (n1 + (12*blockdays)))], SN = SN)
-            except MissingRawFiles: # this can happen if a block of empty files is encountered
-                continue
-            except CorruptRawFile: # if the block has no files, keep searching
-                continue
-            except: # especially for KeyboardInterrupt!
-                raise
-            finally:
-                n1 = n1 + (12*blockdays) # increment file counter
-
-            if(len(L['data']) == 0):
-                continue # skip ahead if there aren't any readable data files here
-
-            ## process newly-read data
-            if(any(L['header'].SN != SN) | any(L['header'].SN.apply(len) == 0)):
-                #_breakpoint()
-                w = np.where((L['header'].SN != SN) | (L['header'].SN.apply(len) == 0))[0]
-                #print('Wrong or missing serial number(s): ' + L['header'].SN[w] + ' : numbers ' + str(nums[np.logical_and(nums >= n1, nums < (n1 + (12*blockdays)))][w]))
-                for i in w:
-                    print('Problem with files, skipping: ' + L['header'].file[i])
-
-            #breakpoint()
-            if(len(L['data']) > 0):
-                if (L['data'][0].stats.starttime - p[-1].stats.endtime) <= 0.031: # interpolate a gap up to 3 samples
-                    L['data'] += p[-1]
-                    L['data'].merge(fill_value = 'interpolate')
-                ## merge all the data, regardless of whether we interpolated a gap above
-                p = p + L['data']
-                p.merge()
-            #print(p)
-                
-            ## start metadata and gps files
-            metadata = L['metadata']   
-            gps = L['gps']
-            metadata.to_csv(metadatafile, index=False, mode='a', header=False)
-            wgps = (gps['t'] > (t1 - 1)) 
-            ## update the gps file
-            if(len(wgps) > 0):
-                gps.to_csv(gpsfile, index=False, mode='a', header=False)
-                
-        ## run the conversion and write new converted files
-        while((hour_to_write + file_length_sec) <= p[-1].stats.endtime):
-            hour_to_write = _write_hourlong_mseed(p, hour_to_write, file_length_sec, bitweight, convertedpath, output_format=output_format)
-            
-        ## update start time to convert
-        p.trim(hour_to_write, t2)
-        t1 = _trunc_UTCDateTime(tt2+(86400*blockdays) + 1, 86400*blockdays)
-    ## done reading new files. write what's left and end.
-    #breakpoint()
-    while((hour_to_write <= p[-1].stats.endtime) & (len(p) > 0)):
-        hour_to_write = _write_hourlong_mseed(p, hour_to_write, file_length_sec, bitweight, convertedpath, output_format=output_format)
-        p.trim(hour_to_write, t2)
-        p = p.split()
-        if(len(p) > 0):
-            hour_to_write = p[0].stats.starttime
+def _block_nums(nums, blockdays, n1 = None):
+    ## split sorted file numbers into blocks of (12*blockdays) numbers starting at n1 
+    ## (default: the first number), skipping empty blocks. Yields (block start, numbers).
+    if n1 is None:
+        n1 = nums[0]
+    while n1 <= nums[-1]:
+        nums_block = nums[(nums >= n1) & (nums < (n1 + (12*blockdays)))] # files are 2 hours, so 12 files is 24 hours
+        if len(nums_block) > 0:
+            yield n1, nums_block
+        n1 = n1 + (12*blockdays) # increment file number counter
+
+def _read_gem_block(n1, nums_block, kwargs):
+    ## read_gem for one block of files starting at number n1; None if the block has no
+    ## readable data. This is a module-level function so that it can run in a process pool.
+    ## The block's metrics (see _ConvertMetrics) are returned in L['metrics'].
+    start = time.perf_counter()
+    _telemetry.times = {}
+    try:
+        L = read_gem(nums = nums_block, **kwargs)
+    except MissingRawFiles: # this can happen if a block of empty files is encountered
+        return None
+    except CorruptRawFile: # if the block has no files, keep searching
+        return None
+    finally:
+        stage_seconds = _telemetry.times
+        _telemetry.times = None
+    if(len(L['data']) == 0):
+        return None # skip ahead if there aren't any readable data files here
+    L['block_start'] = float(n1)
+    L['metrics'] = {'block_start': float(n1), 'files': len(L['header']),
+                    'bytes': int(sum(_file_size(fn) for fn in L['header'].file)),
+                    'samples': int(sum(len(tr) for tr in L['data'])),
+                    'seconds': time.perf_counter() - start, 'stage_seconds': stage_seconds,
+                    'rss_mb': _rss_mb(), 'process_peak_rss_mb': _peak_rss_mb(), 'pid': os.getpid()}
+    return L
+
+_telemetry = threading.local() # stage timings for the block being read in this thread
+
+@contextlib.contextmanager
+def _timed_stage(stage):
+    ## add the time spent in the 'with' block to this thread's timing for 'stage', if a block's
+    ## stages are being timed (see _read_gem_block)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times = getattr(_telemetry, 'times', None)
+        if times is not None:
+            times[stage] = times.get(stage, 0) + time.perf_counter() - start
+
+def _rss_mb():
+    ## current resident memory of this process in MB, or None if unknown (only Linux has
+    ## /proc/self/statm)
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+def _peak_rss_mb():
+    ## highest resident memory of this process so far in MB (cumulative over its lifetime, so
+    ## it doesn't show which block used the memory), or None if unknown (the resource module
+    ## is not available on Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10 # bytes on mac, kB on linux
+
+_metrics_lock = threading.Lock() # for appending to metrics files from several threads
+
+class _ConvertMetrics:
+    ## Collects the metrics of one conversion and reports each event as a dict, either to a
+    ## callback function or as a line in a JSON-lines file. Events:
+    ## - 'block': a block of raw files was read (files, bytes, samples, seconds, 
+    ##   stage_seconds for parse/drift/breaks/interp, rss_mb of the reading process after
+    ##   reading the block, and process_peak_rss_mb, that process's cumulative peak)
+    ## - 'write': an output file was written (file, samples, seconds)
+    ## - 'done': totals for the conversion (the highest rss_mb as max_rss_mb), with
+    ##   bytes_per_second and samples_per_second
+    def __init__(self, metrics, SN):
+        self.metrics = metrics
+        self.SN = SN
+        self.start = time.perf_counter()
+        self.totals = {'blocks': 0, 'files': 0, 'bytes': 0, 'samples': 0, 'files_written': 0,
+                       'stage_seconds': {}, 'max_rss_mb': None, 'process_peak_rss_mb': None}
+
+    def emit(self, event):
+        event = {'event': event.pop('event'), 'SN': self.SN, 'time': time.time(), **event}
+        if callable(self.metrics):
+            self.metrics(event)
         else:
-            break
+            with _metrics_lock:
+                with open(self.metrics, 'a') as f:
+                    f.write(json.dumps(event) + '\n')
+
+    def _add_stages(self, stage_seconds):
+        for stage, seconds in stage_seconds.items():
+            self.totals['stage_seconds'][stage] = self.totals['stage_seconds'].get(stage, 0) + seconds
+
+    def blocks(self, blocks):
+        ## report each block from a generator of read_gem output, and pass it along
+        for L in blocks:
+            metrics = L.get('metrics', {})
+            for key in ['files', 'bytes', 'samples']:
+                self.totals[key] += metrics.get(key, 0)
+            self.totals['blocks'] += 1
+            self._add_stages(metrics.get('stage_seconds', {}))
+            for key, total in [('rss_mb', 'max_rss_mb'), ('process_peak_rss_mb', 'process_peak_rss_mb')]:
+                if metrics.get(key) is not None:
+                    self.totals[total] = max(self.totals[total] or 0, metrics[key])
+            self.emit({'event': 'block', **metrics})
+            yield L
+
+    def write(self, fn, samples, seconds):
+        self.totals['files_written'] += 1
+        self._add_stages({'write': seconds})
+        self.emit({'event': 'write', 'file': fn, 'samples': samples, 'seconds': seconds})
+
+    def done(self):
+        seconds = time.perf_counter() - self.start
+        self.emit({'event': 'done', **self.totals, 'seconds': seconds,
+                   'bytes_per_second': self.totals['bytes'] / seconds,
+                   'samples_per_second': self.totals['samples'] / seconds})
+
+def _map_ahead(pool, fun, args_list, ahead):
+    ## like pool.map, but keeps at most 'ahead' results waiting, so that memory use is bounded
+    pending = collections.deque()
+    try:
+        for args in args_list:
+            pending.append(pool.submit(fun, *args))
+            if len(pending) > ahead:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending: # e.g. if the caller stops early
+            future.cancel()
+
+def _timed_call(fun, args):
+    ## run fun(*args) in a worker process, and return the process ID and run time with the
+    ## result (for BlockScheduler's utilization report)
+    start = time.time()
+    result = fun(*args)
+    return os.getpid(), time.time() - start, result
+
+class BlockScheduler:
+    """
+    Pool of worker processes shared by conversions of several Gems that run at the
+    same time (each in its own thread), for reading blocks of raw files.
 
-Convert = convert # alias; v1.0.0
+    Each conversion submits its blocks with map(), weighted by their size. Blocks of
+    one Gem are read and returned in order, but the next block to read is always 
+    taken from the Gem with the most data left to read. The largest Gems therefore 
+    start first and keep running, while smaller Gems fill the idle processes; near 
+    the end, the remaining Gems get all the processes.
+
+    Parameters
+    ----------
+    num_processes : int
+        Number of worker processes.
+
+    ahead : int, default None
+        Maximum number of blocks being read or waiting to be used, which limits memory
+        use. Default is 2 * num_processes.
+    """
+    def __init__(self, num_processes, ahead = None):
+        self.num_processes = num_processes
+        self.ahead = 2 * num_processes if ahead is None else ahead
+        self._pool = ProcessPoolExecutor(max_workers = num_processes)
+        self._lock = threading.RLock() # reentrant: a done callback can run in _dispatch
+        self._queues = {} # key -> deque of blocks waiting to be read: [weight, fun, args, future]
+        self._remaining = {} # key -> total weight of blocks waiting to be read
+        self._outstanding = 0 # blocks being read, or read but not yet used
+        self._workers = {} # process ID -> [number of blocks, busy time]
+        self._start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def shutdown(self):
+        """Shut down the worker processes."""
+        self._pool.shutdown(wait = True)
+
+    def map(self, key, fun, args_list, weights):
+        """
+        Generator of fun(*args) for each args in args_list, in order.
+
+        Parameters
+        ----------
+        key : str
+            Name of the job (e.g. the serial number); blocks with the same key are 
+            returned in order.
+        fun : function
+            Module-level function to run in the worker processes.
+        args_list : list of tuples
+            Arguments for each call of fun.
+        weights : list of float
+            Relative cost of each call of fun (e.g. the size of the files to read).
+        """
+        futures = collections.deque()
+        with self._lock:
+            waiting = self._queues.setdefault(key, collections.deque())
+            for args, weight in zip(args_list, weights):
+                futures.append(concurrent.futures.Future())
+                waiting.append([weight, fun, args, futures[-1]])
+                self._remaining[key] = self._remaining.get(key, 0) + weight
+        self._dispatch()
+        try:
+            while len(futures) > 0:
+                result = futures[0].result()
+                futures.popleft()
+                with self._lock:
+                    self._outstanding -= 1
+                self._dispatch()
+                yield result
+        finally: # e.g. if the caller stops early, drop its remaining blocks
+            with self._lock:
+                dropped = [item[3] for item in self._queues.pop(key, [])]
+                self._remaining.pop(key, None)
+                self._outstanding -= len(futures) - len(dropped)
+            self._dispatch()
+
+    def _dispatch(self):
+        ## start reading blocks (the next block of the key with the most weight left) until
+        ## 'ahead' blocks are outstanding
+        with self._lock:
+            while self._outstanding < self.ahead:
+                keys = [key for key in self._queues if len(self._queues[key]) > 0]
+                if len(keys) == 0:
+                    return
+                key = max(keys, key = lambda k: self._remaining[k])
+                weight, fun, args, future = self._queues[key].popleft()
+                self._remaining[key] -= weight
+                self._outstanding += 1
+                self._pool.submit(_timed_call, fun, args).add_done_callback(
+                    lambda done, future = future: self._finish(done, future))
+
+    def _finish(self, done, future):
+        ## pass a worker's result (or error) to the waiting map() call, and note its run time
+        try:
+            pid, seconds, result = done.result()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        with self._lock:
+            worker = self._workers.setdefault(pid, [0, 0.0])
+            worker[0] += 1
+            worker[1] += seconds
+        future.set_result(result)
+
+    def utilization(self):
+        """
+        Summary of how busy the worker processes have been.
+
+        Returns
+        -------
+        pandas.DataFrame with one row per worker process and columns pid, blocks 
+        (number of blocks read), busy_seconds, and utilization (fraction of the time 
+        since the scheduler started that the worker was busy).
+        """
+        elapsed = time.time() - self._start
+        with self._lock:
+            rows = [[pid, n, busy, busy/elapsed] for pid, (n, busy) in sorted(self._workers.items())]
+        return pd.DataFrame(rows, columns = ['pid', 'blocks', 'busy_seconds', 'utilization'])
+
+def _iter_gem_blocks(rawpath, nums, SN, blockdays, raw_index, network = '', station = '', location = '', num_processes = 1, n1 = None, scheduler = None, cache = False):
+    ## Read sets of (12*blockdays) raw files in order and yield read_gem output for each set
+    ## that has data. Sets with only missing or corrupt files are skipped. Each set is read
+    ## independently, so with num_processes > 1, sets are read in a process pool (a few
+    ## sets ahead) and yielded in the same order. If a BlockScheduler is given, sets are read
+    ## by its processes instead, weighted by the size of their files.
+    kwargs = {'path': rawpath, 'SN': SN, 'network': network, 'station': station,
+              'location': location, 'raw_index': raw_index, 'cache': cache}
+    args_list = ((block_start, nums_block, kwargs) for block_start, nums_block in _block_nums(np.sort(nums), blockdays, n1))
+    if scheduler is not None:
+        sizes = {}
+        for file in raw_index.files(SN, min_size = 0):
+            record = raw_index.record(os.path.basename(file))
+            sizes[record['num']] = record['size']
+        args_list = list(args_list)
+        weights = [sum(sizes.get(n, 0) for n in nums_block) for _, nums_block, _ in args_list]
+        yield from _check_blocks(scheduler.map(SN, _read_gem_block, args_list, weights), SN)
+    elif num_processes > 1:
+        with ProcessPoolExecutor(max_workers = num_processes) as pool:
+            yield from _check_blocks(_map_ahead(pool, _read_gem_block, args_list, 2 * num_processes), SN)
+    else:
+        yield from _check_blocks(itertools.starmap(_read_gem_block, args_list), SN)
+
+def _check_blocks(blocks, SN):
+    ## skip empty blocks, and report files in a block that have the wrong SN
+    for L in blocks:
+        if L is None:
+            continue
+        if(any(L['header'].SN != SN) | any(L['header'].SN.apply(len) == 0)):
+            w = np.where((L['header'].SN != SN) | (L['header'].SN.apply(len) == 0))[0]
+            for i in w:
+                print('Problem with files, skipping: ' + L['header'].file[i])
+        yield L
+
+def _append_block_metadata(blocks, metadatafile, gpsfile, state = None):
+    ## append each block's metadata and gps to their output files, and pass its data along.
+    ## If given, state['checkpoint'] is updated at the start of each block.
+    for L in blocks:
+        if state is not None:
+            state['checkpoint'] = _take_checkpoint(L['block_start'], state, metadatafile, gpsfile)
+        L['metadata'].to_csv(metadatafile, index=False, mode='a', header=False)
+        if(len(L['gps']) > 0):
+            L['gps'].to_csv(gpsfile, index=False, mode='a', header=False)
+        yield L['data']
+
+def _join_traces(carry, tr, max_gap = 0.031, interpolate = False):
+    ## Add trace tr to the end of carry (a list of gap-free traces in time order), in place.
+    ## Within max_gap of the last trace, tr is joined to it; with interpolate=True, missing
+    ## samples between them are interpolated. Overlapping samples that disagree become a gap,
+    ## as in Stream.merge(). Otherwise, tr starts a new trace.
+    if (len(carry) == 0) or ((tr.stats.starttime - carry[-1].stats.endtime) > max_gap):
+        carry.append(tr)
+        return
+    last = carry.pop()
+    if interpolate and (tr.stats.starttime > last.stats.endtime):
+        joined = last.__add__(tr, fill_value = 'interpolate')
+    else:
+        joined = last.__add__(tr)
+    carry.extend(joined.split())
+
+def _iter_output_chunks(streams, t1, t2, file_length_sec, state = None):
+    ## Cut the data in 'streams' (an iterable of obspy.Streams in time order, e.g. one per
+    ## block of raw files) into traces to be written as output files, starting at t1 and
+    ## ending at t2. Files start at multiples of file_length_sec (except the first), and 
+    ## data gaps split files. A file is yielded once the data following it have been read;
+    ## data already yielded are dropped, so the data held at once are at most one block
+    ## plus one file length. If given, state['carry'] and state['hour_to_write'] are the 
+    ## data not yet written and the start of the next file; they are used to start, and
+    ## are kept up to date.
+    eps = 1e-6
+    if state is None:
+        state = {'carry': [], 'hour_to_write': None}
+    carry = state['carry']
+    hour_to_write = state['hour_to_write']
+    for st in streams:
+        traces = sorted(st, key = lambda tr: tr.stats.starttime)
+        for i, tr in enumerate(traces):
+            ## interpolate a gap up to 3 samples between blocks
+            _join_traces(carry, tr, interpolate = (i == 0))
+        if hour_to_write is None:
+            hour_to_write = max(t1, carry[0].stats.starttime)
+        _drop_before(carry, hour_to_write - 1e-6) # data before t1 are never written
+        while len(carry) > 0:
+            hour_end = _trunc_UTCDateTime(hour_to_write, file_length_sec) + file_length_sec
+            if (hour_end > carry[-1].stats.endtime) or (hour_to_write > t2):
+                break
+            yield from _cut_chunk(carry, hour_to_write, min(hour_end - eps, t2))
+            hour_to_write = max(hour_end, carry[0].stats.starttime) if len(carry) > 0 else hour_end
+        state['hour_to_write'] = hour_to_write
+        if hour_to_write > t2:
+            return
+    ## done reading new data. write what's left.
+    while (len(carry) > 0) and (hour_to_write <= t2):
+        hour_end = _trunc_UTCDateTime(hour_to_write, file_length_sec) + file_length_sec
+        yield from _cut_chunk(carry, hour_to_write, min(hour_end - eps, t2))
+        if len(carry) > 0:
+            hour_to_write = max(hour_end, carry[0].stats.starttime)
+    state['hour_to_write'] = hour_to_write
+
+def _cut_chunk(carry, t1, t2):
+    ## yield the non-empty parts of the traces in carry between t1 and t2, then drop data
+    ## before t2 from carry
+    for tr in carry:
+        if (tr.stats.starttime <= t2) and (tr.stats.endtime >= t1):
+            tr_out = tr.slice(t1, t2, nearest_sample = False)
+            if len(tr_out) > 0:
+                yield tr_out
+    _drop_before(carry, t2)
+
+def _drop_before(carry, t):
+    ## drop data up to time t from the traces in carry, in place
+    if (len(carry) == 0) or (carry[0].stats.starttime > t):
+        return
+    carry[:] = [tr.slice(t, nearest_sample = False) for tr in carry if tr.stats.endtime > t]
+    carry[:] = [tr for tr in carry if len(tr) > 0]
 ####################################
 
+def _write_converted_trace(tr, bitweight, convertedpath, output_format = 'mseed'):
+    ## write one trace of converted data to a file named for its start time and ID, and
+    ## return the file name
+    tr.stats.calib = bitweight
+    fn = _make_filename_converted(tr, output_format)
+    if(len(tr) > 0):
+        if _debug: # runs in the writer thread, so printing would interleave with the progress output
+            print(tr)
+        if(output_format.lower() == 'wav'):
+            write_wav(tr, filename = fn, path = convertedpath)
+        elif(output_format.lower() == 'mseed'):
+            write_mseed_steim1(tr, convertedpath +'/'+ fn)
+        else:
+            tr.write(convertedpath +'/'+ fn, format = output_format, encoding=10) # encoding 10 is Steim 1
+    return fn
+
+def _write_traces_background(traces, bitweight, convertedpath, output_format = 'mseed', written = None, queue_size = 4, metrics = None):
+    ## Write each trace from the iterable 'traces' with _write_converted_trace, in a background
+    ## thread so that encoding and writing overlap with producing the next traces. At most
+    ## queue_size traces wait to be written; producing more waits until the writer catches up.
+    ## Returns after all files are written. File names are appended to 'written' (if given)
+    ## as traces are queued. Errors in the writer are raised here. Each write is reported to
+    ## 'metrics' (a _ConvertMetrics), if given.
+    if written is None:
+        written = []
+    waiting = queue.Queue(maxsize = queue_size)
+    errors = []
+    def writer():
+        while True:
+            tr = waiting.get()
+            if tr is None:
+                return
+            if len(errors) == 0: # after an error, just empty the queue
+                try:
+                    start = time.perf_counter()
+                    fn = _write_converted_trace(tr, bitweight, convertedpath, output_format)
+                    if metrics is not None:
+                        metrics.write(fn, len(tr), time.perf_counter() - start)
+                except BaseException as e:
+                    errors.append(e)
+    thread = threading.Thread(target = writer, daemon = True)
+    thread.start()
+    try:
+        for tr in traces:
+            if len(errors) > 0:
+                break
+            written.append(_make_filename_converted(tr, output_format))
+            waiting.put(tr)
+    finally:
+        waiting.put(None) # flush: tell the writer to stop once the queue is empty, and wait
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return written
+
+def _make_manifest_filename(convertedpath, SN):
+    return os.path.join(convertedpath, '.gemlog', SN + '_convert.json')
+
+def _make_raw_index_filename(convertedpath):
+    ## the raw file index of resumable conversions is kept with the manifest, not in the raw
+    ## data directory
+    return os.path.join(convertedpath, '.gemlog', 'raw_index.json')
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+def _take_checkpoint(block_start, state, metadatafile, gpsfile):
+    ## conversion state at the start of a block of raw files: everything needed to start 
+    ## converting again from this block, given the output files written up to now
+    return {'block_start': float(block_start),
+            'hour_to_write': None if state['hour_to_write'] is None else float(state['hour_to_write']),
+            'carry': [[float(tr.stats.starttime), float(tr.stats.endtime), tr.id] for tr in state['carry']],
+            'num_written': len(state['written']),
+            'metadata_size': _file_size(metadatafile),
+            'gps_size': _file_size(gpsfile)}
+
+def _write_manifest(filename, manifest):
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok = True)
+        tmp = filename + '.' + str(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, filename)
+    except OSError: # e.g. read-only directory; the conversion just can't be resumed
+        pass
+
+def _read_manifest(filename, settings):
+    ## manifest of an earlier conversion, or None if there isn't one or it used different settings
+    try:
+        with open(filename, 'r') as f:
+            manifest = json.load(f)
+    except Exception:
+        return None
+    if json.dumps(manifest['settings'], sort_keys = True) != json.dumps(settings, sort_keys = True):
+        print('Conversion settings have changed; converting all files')
+        return None
+    return manifest
+
+def _raw_file_converted(manifest, name, raw_index):
+    ## whether a raw file was converted in the conversion described by manifest, and has
+    ## not changed since (e.g. the last file on an SD card may have grown)
+    if (manifest is None) or (name not in manifest['raw_files']):
+        return False
+    record = raw_index.record(name)
+    return manifest['raw_files'][name] == [record['size'], record['mtime']]
+
+def _resume_state(manifest, nums_new, convertedpath):
+    ## Undo the outputs of the last block read in the conversion described by manifest,
+    ## and return the state to continue converting from that block. Return None (changing
+    ## nothing) if that isn't possible.
+    if manifest is None:
+        return None
+    checkpoint = manifest['checkpoint']
+    if checkpoint['hour_to_write'] is None: # nothing was written before the last block
+        return None
+    if min(nums_new) < checkpoint['block_start']:
+        print('Raw files converted previously have changed; converting all files')
+        return None
+    if manifest['settings']['output_format'] not in ['mseed', 'sac']: # can't be read back
+        return None
+    ## the data not yet written at the checkpoint were written later, to the files that 
+    ## are about to be rewritten: read them back
+    st = obspy.Stream()
+    try:
+        for fn in checkpoint['rewrite_files']:
+            st += obspy.read(os.path.join(convertedpath, fn))
+        if not os.path.exists(manifest['metadatafile']):
+            raise FileNotFoundError(manifest['metadatafile'])
+    except Exception:
+        print('Previously converted files are missing; converting all files')
+        return None
+    carry = []
+    for start, end, id in checkpoint['carry']:
+        pieces = sorted(st.select(id = id).slice(obspy.UTCDateTime(start), obspy.UTCDateTime(end)),
+                        key = lambda tr: tr.stats.starttime)
+        if len(pieces) == 0:
+            return None
+        tr = obspy.Trace(np.round(np.concatenate([piece.data for piece in pieces])).astype('int32'))
+        tr.stats.starttime = start
+        tr.stats.delta = pieces[0].stats.delta
+        tr.stats.network, tr.stats.station, tr.stats.location, tr.stats.channel = id.split('.')
+        if abs(tr.stats.endtime - obspy.UTCDateTime(end)) > (tr.stats.delta/2): # samples are missing
+            return None
+        carry.append(tr)
+    ## remove the outputs from the last block, so they can be rewritten with new data
+    for fn in checkpoint['rewrite_files']:
+        if os.path.exists(os.path.join(convertedpath, fn)):
+            os.remove(os.path.join(convertedpath, fn))
+    os.truncate(manifest['metadatafile'], checkpoint['metadata_size'])
+    if os.path.exists(manifest['gpsfile']):
+        os.truncate(manifest['gpsfile'], checkpoint['gps_size'])
+    restored = dict(checkpoint)
+    restored.pop('rewrite_files')
+    restored['num_written'] = 0
+    return {'carry': carry, 'hour_to_write': obspy.UTCDateTime(checkpoint['hour_to_write']),
+            'checkpoint': restored}
+
 def _write_hourlong_mseed(p, hour_to_write, file_length_sec, bitweight, convertedpath, hour_end = np.nan, output_format='mseed'):
     eps = 1e-6
     if(np.isnan(hour_end)):
@@ -356,14 +949,7 @@ def _write_hourlong_mseed(p, hour_to_write, file_length_sec, bitweight, converte
     # a gap. Unfortunately, those fail to write, so we have to write multiple files instead.
     pp = pp.split() 
     for tr in pp:
-        tr.stats.calib = bitweight
-        fn = _make_filename_converted(tr, output_format)
-        if(len(tr) > 0):
-            print(tr)
-            if(output_format.lower() == 'wav'):
-                write_wav(tr, filename = fn, path = convertedpath)
-            else:
-                tr.write(convertedpath +'/'+ fn, format = output_format, encoding=10) # encoding 10 is Steim 1
+        _write_converted_trace(tr, bitweight, convertedpath, output_format)
     hour_to_write = hour_end
     return hour_to_write
 
@@ -399,8 +985,89 @@ def write_wav(tr, filename = None, path = '.', time_format = '%Y-%m-%dT%H_%M_%S'
     ## sample rate must be an int
     if int(tr.stats.sampling_rate) != tr.stats.sampling_rate:
         raise TypeError('sample rate must be an integer')
+    from scipy.io import wavfile
     wavfile.write(path + '/' + filename, int(tr.stats.sampling_rate), tr.data)
     
+def write_mseed_steim1(tr, filename, reclen = 4096):
+    """
+    Write a trace as a Steim-1 encoded miniSEED file, using gemlog's own encoder 
+    instead of obspy's. The output is identical to that of tr.write(filename, 
+    format = 'MSEED', encoding = 10, reclen = reclen), but faster for long traces.
+
+    Traces that the encoder does not handle (data that are not int32, sample rates 
+    that are not a factor of 10000 Hz, start times that are not a multiple of 100 
+    microseconds, traces with miniSEED-specific stats, or if gemlog's C-extensions 
+    are not available) are written by obspy instead.
+
+    Parameters
+    ----------
+    tr : obspy.Trace()
+        Trace containing data to be written.
+    filename : str or file-like object
+        Name of the file to write, or open binary file or buffer to write to.
+    reclen : int, default 4096
+        Length of miniSEED records in bytes; must be a power of 2 between 256 and 
+        65536.
+    """
+    try:
+        from gemlog.steim import encode_steim1
+    except ImportError:
+        encode_steim1 = None
+    if (encode_steim1 is None) or (not _steim1_writable(tr, reclen)):
+        tr.write(filename, format = 'MSEED', encoding = 10, reclen = reclen)
+        return
+    records = _encode_mseed_steim1(tr, reclen, encode_steim1)
+    if hasattr(filename, 'write'):
+        filename.write(records)
+    else:
+        with open(filename, 'wb') as file:
+            file.write(records)
+
+def _steim1_writable(tr, reclen):
+    ## check whether write_mseed_steim1 can encode the trace itself with output identical
+    ## to obspy's: otherwise, it falls back to obspy
+    s = tr.stats
+    if (not isinstance(tr.data, np.ndarray)) or np.ma.isMaskedArray(tr.data) or \
+       (tr.data.dtype != np.int32) or (len(tr.data) == 0) or ('mseed' in s):
+        return False
+    if (reclen not in [2**i for i in range(8, 17)]):
+        return False
+    ## sample times must all be multiples of 100 us, so no blockette 1001 is needed
+    sr = s.sampling_rate
+    if (sr != int(sr)) or (sr < 1) or (10000 % int(sr) != 0) or (s.starttime.ns % 100000 != 0):
+        return False
+    for code, length in [(s.network, 2), (s.station, 5), (s.location, 2), (s.channel, 3)]:
+        if (len(code) > length) or (not code.isascii()):
+            return False
+    return True
+
+def _encode_mseed_steim1(tr, reclen, encode_steim1):
+    ## Encode a trace as big-endian miniSEED records, laid out as obspy (libmseed) writes
+    ## them: 48-byte fixed header, blockette 1000, data from byte 64, and Steim-1 frames
+    ## packed as full as possible. Returns the records as bytes.
+    data = np.ascontiguousarray(tr.data, dtype = np.int32)
+    s = tr.stats
+    sr = int(s.sampling_rate)
+    codes = (s.station.ljust(5) + s.location.ljust(2) + s.channel.ljust(3) + s.network.ljust(2)).encode('ascii')
+    frames = np.zeros(reclen - 64, dtype = np.uint8)
+    blockette_1000 = struct.pack('>HHBBBB8x', 1000, 0, 10, 1, reclen.bit_length() - 1, 0)
+    start = s.starttime.datetime
+    records = []
+    i = 0
+    seq = 0
+    while i < len(data):
+        d0 = 0 if i == 0 else (int(data[i]) - int(data[i-1]) + 2**31) % 2**32 - 2**31 # int32 wrap
+        n = encode_steim1(data, i, d0, frames)
+        t = start + datetime.timedelta(microseconds = i * 1000000 // sr)
+        doy = t.toordinal() - datetime.date(t.year, 1, 1).toordinal() + 1
+        seq = seq % 999999 + 1
+        records.append(struct.pack('>6scc12sHHBBBBHHhhBBBBiHH', b'%06d' % seq,
+                                   b'D', b' ', codes, t.year, doy, t.hour, t.minute, t.second, 0,
+                                   t.microsecond // 100, n, sr, 1, 0, 0, 0, 1, 0, 64, 48))
+        records.append(blockette_1000)
+        records.append(frames.tobytes())
+        i += n
+    return b''.join(records)
 
 def _trunc_UTCDateTime(x, n=86400):
     return obspy.core.UTCDateTime(int(float(x)/n)*n)#, origin='1970-01-01')
@@ -422,7 +1089,7 @@ def _make_filename_converted(pp, output_format):
 
 ##############################################################
 ##############################################################
-def read_gem(path = 'raw', nums = np.arange(10000), SN = '', units = 'Pa', bitweight = np.NaN, bitweight_V = np.NaN, bitweight_Pa = np.NaN, verbose = True, network = '', station = '', location = '', return_debug_output = False, require_gps = True, gps_strict_level = 1):
+def read_gem(path = 'raw', nums = np.arange(10000), SN = '', units = 'Pa', bitweight = np.NaN, bitweight_V = np.NaN, bitweight_Pa = np.NaN, verbose = True, network = '', station = '', location = '', return_debug_output = False, require_gps = True, gps_strict_level = 1, raw_index = None, cache = False):
     """
     Read raw Gem files.
 
@@ -485,6 +1152,15 @@ def read_gem(path = 'raw', nums = np.arange(10000), SN = '', units = 'Pa', bitwe
         If True, read files whether or not they have GPS data. Sample times will not be
         precise enough for array processing.
 
+    raw_index : gemlog.RawIndex, default None
+        Index of the raw files in 'path'. If not provided, the files are 
+        scanned, and nothing is saved. Passing an index avoids checking the 
+        directory again when reading many blocks of files.
+
+    cache : bool, default False
+        If True, use and update the cache of parsed raw files in 'path' 
+        ('.gemlog/parsed/'); see convert.
+
     Returns
     -------
     dict with keys:
@@ -503,7 +1179,9 @@ def read_gem(path = 'raw', nums = np.arange(10000), SN = '', units = 'Pa', bitwe
         nums = np.array([nums])
     if(len(station) == 0):
         station = SN
-    fnList = _find_nonmissing_files(path, SN, nums)
+    if raw_index is None:
+        raw_index = RawIndex(path)
+    fnList = _find_nonmissing_files(path, SN, nums, raw_index)
 
     ## at this point, if we don't have any files, raise a missing file exception
     if len(fnList) == 0:
@@ -511,17 +1189,17 @@ def read_gem(path = 'raw', nums = np.arange(10000), SN = '', units = 'Pa', bitwe
     while True:
         if len(fnList) == 0: # at this point, if we have no files, they're all corrupt. 
             raise CorruptRawFile(str(path) + ': ' + str(nums))
-        try:
-            version = _read_format_version(fnList[0])
-            config = _read_config(fnList[0])
-        except: # if we can't read the config for the first file here, drop it and try the next one
+        raw_header = raw_index.record(os.path.basename(fnList[0]))
+        if raw_header['error'] is not None: # if we can't read the config for the first file here, drop it and try the next one
             fnList = fnList[1:] # 
         else:
+            version = raw_header['version']
+            config = raw_header['config']
             break
     if version in ['0.85C', '0.9', '0.91', '1.10']:
-        L = _read_several(fnList, require_gps = require_gps)# same function works for all
+        L = _read_several(fnList, require_gps = require_gps, cache = cache, raw_index = raw_index)# same function works for all
     elif (version == '0.85') | (version == '0.8') :
-        L = _read_several(fnList, version = version, require_gps = require_gps) # same function works for both
+        L = _read_several(fnList, version = version, require_gps = require_gps, cache = cache, raw_index = raw_index) # same function works for both
     else:
         raise Exception(fnList[0] + ': Invalid or missing data format')
 
@@ -576,12 +1254,82 @@ def _new_gem_var():
     return output
 
 
+## default config: it's fairly safe to use this as the default because any other configuration would require ...
+_DEFAULT_CONFIG = {'gps_mode': 1,
+                   'gps_cycle' : 15,
+                   'gps_quota' : 20,
+                   'adc_range' : 0,
+                   'led_shutoff' : 0,
+                   'serial_output' : 0}
+
+def _read_raw_header(fn):
+    """
+    Read the format version, serial number, and config of a raw file.
+
+    Only the first few lines of the file are read, once, so this is much
+    faster than reading each item separately with pd.read_csv.
+
+    Parameters
+    ----------
+    fn : str or pathlib.Path
+        Raw file to read.
+
+    Returns
+    -------
+    dict with keys:
+
+        - version : str, raw format version from the first line
+        - SN : str, serial number from the S line, or None if missing
+        - config : dict, settings from the C line (default config if missing)
+
+    Raises
+    ------
+    EmptyRawFile
+        If the file is empty.
+    """
+    with open(fn, 'rb') as f:
+        ## the C line, the last item needed, is within the first 11 lines
+        text = f.read(4096).decode('utf-8', errors = 'ignore')
+    lines = re.split('\r\n|\r|\n', text)[:11]
+    lines_nonblank = [line for line in lines if len(line) > 0]
+    if len(lines_nonblank) == 0:
+        raise EmptyRawFile(fn)
+
+    ## version: first line, e.g. '#GemCSV0.91'
+    version = lines_nonblank[0].split(',')[0]
+    if len(version) == 0:
+        raise CorruptRawFile(str(fn) + ': missing format version')
+    version = version[7:]
+
+    ## SN: first S line after the first three lines. Other records (e.g. config lines, or
+    ## the first data lines) can come before it, so keep scanning the whole header block.
+    SN = None
+    for line in lines[3:]:
+        fields = line.split('#')[0].split(',')
+        if (fields[0] == 'S') and (len(fields) == 2) and (len(fields[1]) > 0):
+            SN = fields[1]
+            break
+
+    ## config: first complete C line in lines 2-11
+    config = dict(_DEFAULT_CONFIG)
+    for line in lines[1:]:
+        fields = line.split(',')
+        if (fields[0] != 'C') or (len(fields) != 7):
+            continue
+        try:
+            config = {key:int(value) for key, value in zip(_DEFAULT_CONFIG.keys(), fields[1:])}
+        except ValueError:
+            continue
+        break
+    return {'version': version, 'SN': SN, 'config': config}
+
 def _read_SN(fn):
     try:
-        SN_lines = pd.read_csv(fn, delimiter = ',', skiprows = 3, nrows=4, dtype = 'str', names=['linetype', 'SN'], encoding_errors='ignore', comment = '#', on_bad_lines = 'skip')
-        SN = SN_lines['SN'][SN_lines['linetype'] == 'S'][0]
+        SN = _read_raw_header(fn)['SN']
     except:
-        raise CorruptRawFile(fn + ': missing serial number')
+        SN = None
+    if SN is None:
+        raise CorruptRawFile(str(fn) + ': missing serial number')
     return SN
 
 def _read_format_version(fn):
@@ -592,61 +1340,284 @@ def _read_format_version(fn):
     #0.85: ser. num. as extension, added A2 and A3 to metadata, otherwise same as 0.8
     #0.8: file extension .TXT, 1-hour files
     #"""
-    versionLine = pd.read_csv(fn, delimiter = ',', nrows=1, dtype = 'str', names=['s'], encoding_errors='ignore', on_bad_lines = 'skip')
-    version = versionLine['s'][0][7:]
-    return version
+    return _read_raw_header(fn)['version']
     
 def _read_config(fn):
-    config = pd.Series({'gps_mode': 1,
-                    'gps_cycle' : 15,
-                    'gps_quota' : 20,
-                    'adc_range' : 0,
-                    'led_shutoff' : 0,
-                    'serial_output' : 0}) ## default config: it's fairly safe to use this as the default because any other configuration would require ...
-    ## this is ugly but functional. pd.read_csv raises an exception when the number of columns is
-    ## wrong, and the number of columns will be wrong for all rows except the C rows
-    for j in range(10):
-        try:
-            line = pd.read_csv(fn, skiprows = j+1, nrows=1, delimiter = ',', dtype = 'str', names = ['na', 'gps_mode','gps_cycle','gps_quota','adc_range','led_shutoff','serial_output'], encoding_errors='ignore', on_bad_lines = 'skip')
-            if line.iloc[0,0] == 'C':
-                config = {key:int(line[key]) for key in list(line.keys())[1:]}
+    try:
+        return _read_raw_header(fn)['config']
+    except:
+        return dict(_DEFAULT_CONFIG)
+
+
+def _raw_line_millis(line, prev_D_millis):
+    ## millis value of a raw data line (bytes), or None if it's not a D, G, or M line or its
+    ## millis can't be determined. Compact lines and D lines without millis continue from
+    ## the previous D line, following the rules in gemlog.parsers.
+    if len(line) == 0:
+        return None
+    c = line[0]
+    if 97 <= c <= 122: # compact v1.10 data line
+        if prev_D_millis is None:
+            return None
+        if (len(line) > 1) and (97 <= line[1] <= 122):
+            return (prev_D_millis + 10 + c - 109) % 2**13
+        return (prev_D_millis + 10) % 2**13
+    try:
+        if c == 68: # D
+            fields = line[1:].split(b',')
+            if len(fields[0]) == 0: # format 0.8: D,millis,ADC
+                return float(fields[1])
+            if len(fields) == 1:
+                return None if prev_D_millis is None else (prev_D_millis + 10) % 2**13
+            return float(fields[0])
+        elif c in (71, 77): # G, M
+            return float(line[2:].split(b',')[0])
+    except (ValueError, IndexError):
+        return None
+    return None
+
+def _last_raw_millis(lines, prev_D_millis = None):
+    ## millis of the last D, G, or M line in a list of raw lines
+    millis = None
+    for line in lines:
+        line_millis = _raw_line_millis(line, prev_D_millis)
+        if line_millis is None:
+            continue
+        millis = line_millis
+        if (line[0] == 68) or (97 <= line[0] <= 122):
+            prev_D_millis = line_millis
+    return millis, prev_D_millis
+
+def _scan_raw_file(fn):
+    ## Read what RawIndex needs to know about a raw file: header info, first and last millis
+    ## (as written in the file, i.e. not unwrapped), and whether it has any GPS lines.
+    import mmap
+    record = {'SN': None, 'version': None, 'config': None, 'first_millis': None,
+              'last_millis': None, 'has_gps': False, 'error': None}
+    try:
+        record.update(_read_raw_header(fn))
+    except Exception as e:
+        record['error'] = type(e).__name__
+        return record
+    with open(fn, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+        record['has_gps'] = (mm[:2] == b'G,') or (mm.find(b'\nG,') >= 0)
+        ## first millis: the first line with a millis value (the parser starts with millis 0)
+        for line in mm[:65536].splitlines():
+            millis = _raw_line_millis(line, 0)
+            if millis is not None:
+                record['first_millis'] = millis
                 break
-        except:
-            pass
-    return config
+        ## last millis: replay the end of the file, starting far enough back to find a D line
+        ## with a full millis value
+        size = len(mm)
+        window = 65536
+        while True:
+            start = max(0, size - window)
+            lines = mm[start:].splitlines()
+            if start > 0:
+                lines = lines[1:] # first line is probably incomplete
+            millis, prev_D_millis = _last_raw_millis(lines, 0 if start == 0 else None)
+            if (prev_D_millis is not None) or (start == 0):
+                break
+            window *= 4
+        record['last_millis'] = millis
+    return record
+
+class RawIndex:
+    """
+    Index of the raw Gem files in a directory.
 
+    Records each raw file's serial number, format version, config, file
+    number, size, first and last millis, and whether it has GPS data. The
+    index can be saved to a sidecar file so that later calls only need to 
+    check each file's size and modification time; files are only read again
+    if they change.
 
-def _find_nonmissing_files(path, SN, nums):
-    ## list all Gem files in the path
-    #fnList = glob.glob(path + '/' + 'FILE[0-9][0-9][0-9][0-9].[0-9][0-9][0-9]')
-    fnList = glob.glob(path + '/' + 'FILE[0-9][0-9][0-9][0-9].???')
-    fnList.sort()
-    fnList = np.array(fnList)
+    Parameters
+    ----------
+    path : str, default 'raw'
+        Raw data directory.
+
+    sidecar : str, default None
+        File to load the index from and save it to (if writable). By default,
+        the index is not saved. Resumable conversions (convert with 
+        resume=True) keep it in '<convertedpath>/.gemlog/raw_index.json', so
+        nothing is written to the raw data directory. A sidecar made for a 
+        different raw data directory is ignored.
+
+    Note
+    ----
+    Files are only scanned when their records are needed, so indexing a few
+    files in a large directory is fast.
+    """
+    _fields = ['SN', 'version', 'config', 'num', 'size', 'mtime', 'first_millis',
+               'last_millis', 'has_gps', 'error']
     
-    ## find out what all the files' SNs are
-    ext = np.array([x[-3:] for x in fnList])
-    for i in range(len(ext)):
-        if ext[i] == 'TXT':
+    def __init__(self, path = 'raw', sidecar = None):
+        self.path = str(path)
+        self.sidecar = sidecar
+        self._records = {}
+        self._changed = False
+        if sidecar is not None:
             try:
-                ext[i] = _read_SN(fnList[i])
-            except: # if we're here, it's a corrupt/empty file
-                pass # do nothing--it won't make it into goodFnList
-            ## check the files for SN and num
-    goodFnList = []
-    for i, fn in enumerate(fnList):
-        fnNum = int(fn[-8:-4])
-        fnSN = ext[i]
-        if (fnNum in nums) & (fnSN == SN):
-            goodFnList.append(fn)
+                with open(sidecar, 'r') as f:
+                    saved = json.load(f)
+                if saved['path'] == os.path.abspath(self.path):
+                    self._records = saved['files']
+            except Exception: # missing or unreadable sidecar: start over
+                pass
+        self.refresh()
+
+    def refresh(self):
+        """Check the directory for new, changed, and deleted raw files."""
+        self._files = {}
+        if os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if re.fullmatch('FILE[0-9]{4}\\....', entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    self._files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        for name in list(self._records.keys()):
+            record = self._records[name]
+            if self._files.get(name) != (record['size'], record['mtime']):
+                del self._records[name]
+                self._changed = True
+
+    def __len__(self):
+        return len(self._files)
+
+    def names(self):
+        """Sorted names of all raw files in the directory."""
+        return sorted(self._files.keys())
+
+    def record(self, name):
+        """
+        Get the record for one raw file, scanning it if necessary.
+
+        Parameters
+        ----------
+        name : str
+            Raw file name (without directory).
+
+        Returns
+        -------
+        dict with keys SN, version, config, num, size, mtime, first_millis,
+        last_millis, has_gps, and error (None, or the name of the exception
+        raised when reading the file header).
+        """
+        if name not in self._records:
+            self._add_record(name, _scan_raw_file(os.path.join(self.path, name)))
+        return self._records[name]
+
+    def _add_record(self, name, record):
+        size, mtime = self._files[name]
+        record.update({'num': int(name[4:8]), 'size': size, 'mtime': mtime})
+        self._records[name] = record
+        self._changed = True
+
+    def scan(self, num_processes = 1):
+        """
+        Scan all raw files that are not indexed yet, reading each file once.
+
+        Parameters
+        ----------
+        num_processes : int, default 1
+            Number of processes used to scan files in parallel.
+        """
+        names = [name for name in self.names() if name not in self._records]
+        paths = [os.path.join(self.path, name) for name in names]
+        if (num_processes > 1) and (len(names) > 1):
+            with ProcessPoolExecutor(max_workers = num_processes) as pool:
+                chunksize = max(1, len(names) // (4 * num_processes))
+                records = list(pool.map(_scan_raw_file, paths, chunksize = chunksize))
+        else:
+            records = [_scan_raw_file(path) for path in paths]
+        for name, record in zip(names, records):
+            self._add_record(name, record)
+
+    def SN_nums(self):
+        """
+        File numbers of each serial number's raw files, as found by gemlog.convert:
+        files whose header has the serial number, and whose extension is the serial
+        number or 'TXT'. Files are scanned if necessary (see scan()).
+
+        Returns
+        -------
+        dict of serial number: sorted list of file numbers
+        """
+        SN_nums = {}
+        for name in self.names():
+            SN = self.record(name)['SN']
+            if (SN is not None) and (name[-3:] in (SN, 'TXT')):
+                SN_nums.setdefault(SN, []).append(int(name[4:8]))
+        return {SN: sorted(nums) for SN, nums in SN_nums.items()}
+
+    def file_SN(self, name):
+        """
+        Serial number of a raw file: its extension, or for old files with
+        extension 'TXT', the serial number in the file header.
+        """
+        ext = name[-3:]
+        if ext == 'TXT':
+            ext = self.record(name)['SN']
+        return ext
+
+    def serial_numbers(self):
+        """Sorted list of the serial numbers in the directory."""
+        SNs = set(self.file_SN(name) for name in self.names())
+        return sorted(SN for SN in SNs if SN is not None)
+
+    def files(self, SN, nums = None, min_size = 11):
+        """
+        Paths of the raw files for a serial number.
+
+        Parameters
+        ----------
+        SN : str
+            Serial number.
+
+        nums : list or np.array of integers, default None
+            File numbers to include; by default, all of them.
+
+        min_size : int, default 11
+            Skip files smaller than this (bytes); these are effectively
+            empty.
+
+        Returns
+        -------
+        Sorted list of file paths.
+        """
+        names = [name for name in self.names() if name[-3:] in (SN, 'TXT')]
+        if nums is not None:
+            nums = set(int(num) for num in nums)
+            names = [name for name in names if int(name[4:8]) in nums]
+        return [os.path.join(self.path, name) for name in names
+                if (self._files[name][0] >= min_size) and (self.file_SN(name) == SN)]
+
+    def save(self):
+        """Save the index to its sidecar file, if anything has changed."""
+        if (self.sidecar is None) or not self._changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.sidecar), exist_ok = True)
+            tmp = self.sidecar + '.' + str(os.getpid()) + '.' + str(threading.get_ident())
+            with open(tmp, 'w') as f:
+                json.dump({'path': os.path.abspath(self.path), 'files': self._records}, f)
+            os.replace(tmp, self.sidecar) # atomic, in case of parallel processes or threads
+            self._changed = False
+        except OSError: # e.g. read-only directory; the index just won't persist
+            pass
+
+def _find_nonmissing_files(path, SN, nums, raw_index = None):
+    ## list the Gem files in the path with the right SN and nums
+    if raw_index is None:
+        raw_index = RawIndex(path)
+    goodFnList = raw_index.files(SN, nums, min_size = 0)
     if len(goodFnList) == 0:
         print('No good data files found for specified nums and SN ' + SN)
         return []
         ## fix this to be an exception or warning?
     ## make sure they aren't empty
-    goodNonemptyFnList = []
-    for fn in goodFnList:
-        if os.path.getsize(fn) > 10: # to be safe, anything under 10 bytes is treated as empty 
-            goodNonemptyFnList.append(fn)
+    goodNonemptyFnList = raw_index.files(SN, nums) # to be safe, anything under 10 bytes is treated as empty 
     if(len(goodNonemptyFnList) == 0):
         ## warning
         print('No non-empty files')
@@ -720,6 +1691,51 @@ def _read_with_cython(filename, require_gps = True):
     #return _process_gemlog_data(df, offset)
     return df
 
+def _read_with_cython_columns(filename, require_gps = True, columns = None, offset = None):
+    """
+    Read a Gem logfile into separate arrays for each line type, with the
+    final sample times and values calculated while parsing.
+
+    Parameters
+    ----------
+    filename : str or pathlib.Path
+        Filepath of a file containing data to read.
+
+    require_gps : bool, default True
+        If True and the file has no GPS lines, raise CorruptRawFileNoGPS.
+
+    columns : dict or Exception, default None
+        Output of gemlog.parsers.parse_gemfiles(..., integrate = True) for
+        this file, if it has already been parsed. An exception is re-raised
+        here.
+
+    offset : float, default None
+        Timing offset to align the millis values to while parsing. If None,
+        _process_gemlog_columns aligns them afterwards.
+
+    Returns
+    -------
+    dict of arrays (see gemlog.parsers.parse_gemfile_columns); process with
+    _process_gemlog_columns
+    """
+    if columns is None:
+        try:
+            from gemlog.parsers import parse_gemfile_columns
+        except ImportError:
+            raise ImportError(
+                "gemlog's C-extensions are not available. Reinstall gemlog with "
+                "C-extensions to use this function."
+            )
+        columns = parse_gemfile_columns(str(filename).encode('utf-8'),
+                                        offset = offset, integrate = True)
+    elif isinstance(columns, Exception):
+        raise columns
+    if columns['num_rows'] == 0:
+        raise EmptyRawFile(filename)
+    if (len(columns['G']) == 0) and require_gps:
+        raise CorruptRawFileNoGPS(filename)
+    return columns
+
 
 def _read_0_8_with_pandas(filename, require_gps = True):
     ## This procedure is different enough from read_with_pandas that they are not interchangeable.
@@ -779,7 +1795,7 @@ def _read_with_pandas(filename, require_gps = True):
     df['millis-sawtooth'] = np.where(df['linetype'] == 'D',df[0].str[1:],df[1]).astype(int)
     return df
 
-def _read_single(filename, offset=0, require_gps = True, version = '0.9'):
+def _read_single(filename, offset=0, require_gps = True, version = '0.9', columns = None, cache = False):
     """
     Read a Gem logfile.
 
@@ -797,6 +1813,14 @@ def _read_single(filename, offset=0, require_gps = True, version = '0.9'):
     require_gps : bool, default True
         Indicator of whether gps tags are required for reading the file. If True and gps tags are
         missing, raise a CorruptRawFileNoGPS exception.
+
+    columns : dict or Exception, default None
+        Output of gemlog.parsers.parse_gemfiles for this file, if it has already been parsed.
+
+    cache : bool, default False
+        If True, use the parsed-file cache in the file's directory ('.gemlog/parsed/'):
+        return the cached output if the file hasn't changed, and otherwise read the file
+        and save its output to the cache.
     
     Returns
     -------
@@ -806,19 +1830,34 @@ def _read_single(filename, offset=0, require_gps = True, version = '0.9'):
         - metadata: datalogger metadata
         - gps: GPS timing and location values
     """
+    if cache:
+        output = _load_parsed(filename, version, require_gps)
+        if output is not None:
+            _align_millis(output, offset)
+            output['data'][:,0] += _time_corrections[version]
+            return output
+        ## read the file without aligning its millis to the offset, so that the cached
+        ## output can be used with any offset
+        read_offset = None
+    else:
+        read_offset = offset
+
     # Try each of the three file readers in order of decreasing speed but
     # probably increasing likelihood of success.
 
+    # Each reader is paired with the function that processes its output.
     if version in ['1.1', '0.91', '0.9', '0.85C']:
-        readers = [ _read_with_cython, _read_with_pandas]#, _slow__read_single_v0_9 ]
+        readers = [(lambda fn, rg: _read_with_cython_columns(fn, rg, columns, read_offset), _process_gemlog_columns),
+                   (_read_with_cython, _process_gemlog_data),
+                   (_read_with_pandas, _process_gemlog_data)]#, _slow__read_single_v0_9 ]
     else:
-        readers = [_read_0_8_with_pandas]
+        readers = [(_read_0_8_with_pandas, _process_gemlog_data)]
 
-    for reader in readers:
+    for reader, process in readers:
         try:
             df = reader(filename, require_gps)
             
-            output = _process_gemlog_data(df, offset, version = version, require_gps = require_gps)
+            output = process(df, read_offset, version = version, require_gps = require_gps)
         except (EmptyRawFile, FileNotFoundError, CorruptRawFileNoGPS, KeyboardInterrupt):
             # If the file is definitely not going to work, exit early and
             # re-raise the exception that caused the problem
@@ -829,6 +1868,10 @@ def _read_single(filename, offset=0, require_gps = True, version = '0.9'):
             if (len(output['gps'].lat) == 0) and require_gps:
                 raise CorruptRawFile(filename)
 
+            if cache:
+                _save_parsed(filename, version, require_gps, output)
+                _align_millis(output, offset)
+
             # implement a small timing correction (depends on the raw format version)
             output['data'][:,0] += _time_corrections[version] 
             return output
@@ -836,6 +1879,90 @@ def _read_single(filename, offset=0, require_gps = True, version = '0.9'):
 
     raise CorruptRawFile(filename)
 
+## Parsed-file cache: the output of _read_single (before its millis are aligned to the previous
+## file and time-corrected) is saved as a compressed npz file in <raw directory>/.gemlog/parsed/,
+## along with the raw file's size and modification time, the gemlog version, and the read
+## settings. The cached output is only used if all of these still match.
+def _parsed_filename(filename):
+    filename = str(filename)
+    return os.path.join(os.path.dirname(filename), '.gemlog', 'parsed', os.path.basename(filename) + '.npz')
+
+def _parsed_key(filename, version, require_gps):
+    from gemlog.version import __version__
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'gemlog_version': __version__,
+            'version': str(version), 'require_gps': bool(require_gps)}
+
+def _parsed_cache_valid(filename, version, require_gps):
+    ## whether the cache has an up-to-date output for this file (reads only the key)
+    try:
+        with np.load(_parsed_filename(filename)) as f:
+            return json.loads(str(f['key'])) == _parsed_key(filename, version, require_gps)
+    except Exception: # missing or unreadable cache file
+        return False
+
+def _load_parsed(filename, version, require_gps):
+    ## cached _read_single output for this file, or None if it isn't cached or is out of date
+    try:
+        with np.load(_parsed_filename(filename)) as f:
+            if json.loads(str(f['key'])) != _parsed_key(filename, version, require_gps):
+                return None
+            info = json.loads(str(f['info']))
+            output = {'data': _decode_parsed_array(f, 'data'), 'first_millis': info['first_millis'],
+                      'rollover': info['rollover']}
+            for table in ['metadata', 'gps']:
+                if info[table + '_object']: # empty table with object columns (no GPS data)
+                    output[table] = pd.DataFrame(columns = info[table + '_columns'])
+                else:
+                    output[table] = pd.DataFrame(_decode_parsed_array(f, table), columns = info[table + '_columns'])
+    except Exception:
+        return None
+    return output
+
+def _save_parsed(filename, version, require_gps, output):
+    ## save _read_single output to the cache, as an npz file written with fast compression
+    try:
+        info = {'first_millis': float(output['first_millis']), 'rollover': int(output['rollover'])}
+        arrays = {'key': np.array(json.dumps(_parsed_key(filename, version, require_gps)))}
+        arrays.update(_encode_parsed_array('data', output['data']))
+        for table in ['metadata', 'gps']:
+            df = output[table]
+            info[table + '_columns'] = [str(col) for col in df.columns]
+            info[table + '_object'] = bool(any(df.dtypes == object))
+            if not info[table + '_object']:
+                arrays.update(_encode_parsed_array(table, df.to_numpy(dtype = float)))
+        arrays['info'] = np.array(json.dumps(info))
+        cache_file = _parsed_filename(filename)
+        os.makedirs(os.path.dirname(cache_file), exist_ok = True)
+        tmp = cache_file + '.' + str(os.getpid()) + '.' + str(threading.get_ident())
+        with zipfile.ZipFile(tmp, 'w', compression = zipfile.ZIP_DEFLATED, compresslevel = 1) as zf:
+            for name, array in arrays.items():
+                with zf.open(name + '.npy', 'w', force_zip64 = True) as f:
+                    np.lib.format.write_array(f, array, allow_pickle = False)
+        os.replace(tmp, cache_file) # atomic, in case of parallel processes or threads
+    except OSError: # e.g. read-only directory; the file will just be parsed again next time
+        pass
+
+def _encode_parsed_array(name, x):
+    ## Arrays whose values are all whole numbers (like millis and pressure) are stored as their
+    ## first row and the differences between rows, in the smallest integer type that holds
+    ## them. These compress far better than floats, and decode to exactly the same values.
+    x = np.asarray(x, dtype = float)
+    if (x.shape[0] == 0) or not (np.all(np.isfinite(x)) and np.all(x == np.round(x)) and np.all(np.abs(x) < 2**52)):
+        return {name: x}
+    x = x.astype(np.int64)
+    diffs = np.diff(x, axis = 0)
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        if (diffs.size == 0) or ((diffs.min() >= np.iinfo(dtype).min) and (diffs.max() <= np.iinfo(dtype).max)):
+            break
+    return {name + '_start': x[:1], name + '_diffs': diffs.astype(dtype)}
+
+def _decode_parsed_array(f, name):
+    ## inverse of _encode_parsed_array, for the npz file f
+    if name in f.files:
+        return f[name]
+    return np.cumsum(np.concatenate([f[name + '_start'], f[name + '_diffs']]), axis = 0, dtype = np.int64).astype(float)
+
 def _process_gemlog_data(df, offset=0, version = '0.9', require_gps = True):
     ## figure out what settings to used according to the raw file format version
     if version in ['0.9', '0.85C']:
@@ -861,11 +1988,7 @@ def _process_gemlog_data(df, offset=0, version = '0.9', require_gps = True):
     df['millis-stairstep'] *= rollover
     df['millis-corrected'] = df['millis-stairstep'] + df['millis-sawtooth']
     first_millis = df['millis-corrected'].iloc[0]
-    df['millis-corrected'] += (
-        (offset-first_millis)
-        + ((first_millis-(offset % rollover)+rollover/2) % rollover)
-        - rollover/2
-    )
+    df['millis-corrected'] += _millis_shift(first_millis, offset, rollover)
     # groupby is somewhat faster than repeated subsetting like
     # df.loc[df['linetype'] == 'D', :], ...
     grouper = df.groupby('linetype')
@@ -905,28 +2028,112 @@ def _process_gemlog_data(df, offset=0, version = '0.9', require_gps = True):
 
     ## gps stuff
     G_cols = ['msPPS', 'msLag', 'year', 'month', 'day', 'hour', 'minute', 'second', 'lat', 'lon']
-    def make_gps_time(row):
-        try:
-            return obspy.UTCDateTime(*row)
-        except Exception:
-            return np.NaN
     try:
         G = grouper.get_group(Gkey)
         G = G[['millis-corrected'] + list(range(2, len(G_cols)+1))]
         G.columns = G_cols
         G = G.apply(pd.to_numeric)
-        # filter bad GPS data and combine into datetimes
+    except:
+        G = None
+    G = _process_gps(G, require_gps)
+        
+    return {'data': np.array(D), 'metadata': M.reset_index().astype('float'), 'gps': G,
+            'first_millis': first_millis, 'rollover': rollover}
+
+def _millis_shift(first_millis, offset, rollover):
+    ## amount to add to the unwrapped millis values of a file (starting with first_millis) so
+    ## that they continue from offset, the last millis of the previous file. If offset is
+    ## None, the millis are left as they are.
+    if offset is None:
+        return 0
+    return ((offset-first_millis)
+            + ((first_millis-(offset % rollover)+rollover/2) % rollover)
+            - rollover/2)
+
+def _align_millis(output, offset):
+    ## align the millis of a file read with offset None (as in the parsed-file cache) to
+    ## offset; the result is identical to reading the file with offset
+    shift = _millis_shift(output['first_millis'], offset, output['rollover'])
+    if shift != 0:
+        output['data'][:,0] += shift
+        output['metadata']['millis'] += shift
+        if output['gps'].shape[0] > 0:
+            output['gps']['msPPS'] += shift
+
+def _gps_epoch_seconds(year, month, day, hour, minute, second):
+    ## Vectorized equivalent of float(obspy.UTCDateTime(year, month, day, hour, minute, second))
+    ## for integer arrays, with NaN where UTCDateTime would raise an exception (invalid dates).
+    year, month, day, hour, minute, second = [np.asarray(x, dtype = np.int64) for x in
+                                              [year, month, day, hour, minute, second]]
+    valid = ((year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12) & (day >= 1) &
+             (hour >= 0) & (hour <= 23) & (minute >= 0) & (minute <= 59) &
+             (second >= 0) & (second <= 59))
+    ## days since the epoch for the first of each month, and the length of the month
+    month_start = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    day0 = month_start.astype('datetime64[D]').astype(np.int64)
+    month_length = (month_start + 1).astype('datetime64[D]').astype(np.int64) - day0
+    valid &= day <= month_length
+    t = (day0 + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    return np.where(valid, t.astype('float'), np.nan)
+
+def _process_gps(G, require_gps = True):
+    ## filter bad GPS data and combine into times (epoch seconds). G is a numeric dataframe of
+    ## GPS lines indexed by row number, or None if the file has no GPS lines.
+    G_cols = ['msPPS', 'msLag', 'year', 'month', 'day', 'hour', 'minute', 'second', 'lat', 'lon']
+    try:
+        if G is None:
+            raise CorruptRawFileNoGPS()
         valid_gps = _valid_gps(G)
         G = G.loc[valid_gps, :]
-        G['t'] = G.iloc[:, 2:8].astype(int).apply(make_gps_time, axis=1)
+        G['t'] = _gps_epoch_seconds(*[G[key].to_numpy().astype(int) for key in
+                                      ['year', 'month', 'day', 'hour', 'minute', 'second']])
         G = G.reset_index().astype('float')
     except:
         if require_gps:
             raise CorruptRawFileNoGPS()
         else:
             G = pd.DataFrame(columns = G_cols)
-        
-    return {'data': np.array(D), 'metadata': M.reset_index().astype('float'), 'gps': G}
+    return G
+
+def _process_gemlog_columns(columns, offset=0, version = '0.9', require_gps = True):
+    ## Equivalent of _process_gemlog_data for the output of _read_with_cython_columns. The
+    ## parser has already unwrapped the millis rollover and integrated the ADC values; the
+    ## millis values only need to be shifted here if they weren't aligned to this offset
+    ## while parsing.
+    if version in ['0.9', '0.85C']:
+        rollover = 2**13
+    else:
+        raise CorruptRawFile('Invalid raw format version')
+    M_in = columns['M']
+    D = columns['data']
+    if (len(D) == 0) or (len(M_in) == 0):
+        raise CorruptRawFile('Raw file is missing data or metadata lines')
+
+    first_millis = np.float64(columns['first_millis'])
+    shift = _millis_shift(first_millis, offset, rollover) - columns['shift']
+    if shift != 0:
+        D[:,0] += shift
+
+    M_cols = ['millis', 'batt', 'temp', 'A2', 'A3',
+              'maxWriteTime', 'minFifoFree', 'maxFifoUsed',
+              'maxOverruns', 'gpsOnFlag', 'unusedStack1', 'unusedStackIdle']
+    M = pd.DataFrame({key: M_in[key].astype(float) for key in M_cols},
+                     index = pd.Index(M_in['row'], name = 'index'))
+    if shift != 0:
+        M['millis'] += shift
+
+    G_in = columns['G']
+    if len(G_in) == 0:
+        G = None
+    else:
+        G_cols = ['msPPS', 'msLag', 'year', 'month', 'day', 'hour', 'minute', 'second', 'lat', 'lon']
+        G = pd.DataFrame({key: G_in[key].astype(float) for key in G_cols},
+                         index = pd.Index(G_in['row'], name = 'index'))
+        if shift != 0:
+            G['msPPS'] += shift
+    G = _process_gps(G, require_gps)
+    return {'data': D, 'metadata': M.reset_index().astype('float'), 'gps': G,
+            'first_millis': first_millis, 'rollover': rollover}
 
 def _valid_gps(G):
     # vectorized GPS data validation
@@ -1015,25 +2222,47 @@ def _slow__read_single_v0_9(filename, offset=0, require_gps = True):
     D[:,1] = D[:,1].cumsum()
     return {'data': D, 'metadata': M, 'gps': G}
 
-def _read_several(fnList, version = 0.9, require_gps = True):
-    ## initialize the output variables
-    D = np.ndarray([0,2]) # expected number 7.2e5
+def _read_several(fnList, version = 0.9, require_gps = True, cache = False, raw_index = None):
+    ## initialize the output variables. Each file's output is collected in lists and
+    ## concatenated once at the end; growing the outputs file by file would copy them
+    ## repeatedly.
+    D_list = []
+    G_list = []
+    M_list = []
     header = _make_empty_header(fnList)
-    G = _make_empty_gps()
-    M = _make_empty_metadata()
+    header_values = {} # key: {file index: value}
+    
+    ## parse the files in parallel threads first; the rest of the processing depends on the
+    ## previous file, so it stays sequential
+    columns = [None] * len(fnList)
+    if str(version) in ['1.10', '0.91', '0.9', '0.85C']:
+        try:
+            from gemlog.parsers import parse_gemfiles
+        except ImportError:
+            pass
+        else:
+            ## files with up-to-date cached output don't need to be parsed
+            to_parse = [i for i, fn in enumerate(fnList) if not (cache and _parsed_cache_valid(fn, '0.9', require_gps))]
+            with _timed_stage('parse'):
+                parsed = parse_gemfiles([str(fnList[i]).encode('utf-8') for i in to_parse], n_threads = _parse_threads(), integrate = True)
+            for i, file_columns in zip(to_parse, parsed):
+                columns[i] = file_columns
     
     ## loop through the files
     startMillis = 0
+    previous_reg = None # drift fit of the previous file, to warm-start the next one
     for i,fn in enumerate(fnList):
         print('File ' + str(i+1) + ' of ' + str(len(fnList)) + ': ' + fn)
+        file_columns, columns[i] = columns[i], None # drop the reference once the file is used
         try:
             ## read the data file (using reader for this format version)
-            if str(version) in ['1.10', '0.91', '0.9', '0.85C']:
-                L = _read_single(fn, startMillis, require_gps = require_gps)
-            elif str(version) in ['0.8', '0.85']:
-                L = _read_single(fn, startMillis, require_gps = require_gps, version = version)
-            else:
-                raise CorruptRawFile('Invalid raw file format version: ' + str(version))
+            with _timed_stage('parse'):
+                if str(version) in ['1.10', '0.91', '0.9', '0.85C']:
+                    L = _read_single(fn, startMillis, require_gps = require_gps, columns = file_columns, cache = cache)
+                elif str(version) in ['0.8', '0.85']:
+                    L = _read_single(fn, startMillis, require_gps = require_gps, version = version, cache = cache)
+                else:
+                    raise CorruptRawFile('Invalid raw file format version: ' + str(version))
             ## make sure the first millis is > startMillis
             if(L['data'][0,0] < startMillis):
                 L['metadata'].millis += 2**13
@@ -1044,19 +2273,23 @@ def _read_several(fnList, version = 0.9, require_gps = True):
             if any(dMillis < 0) or any(dMillis > 1000):
                 raise CorruptRawFile(f'{fn} sample times are discontinuous, skipping this file')
 
-            header_info = _calculate_drift(L, fn, require_gps)
+            with _timed_stage('drift'):
+                header_info = _calculate_drift(L, fn, require_gps, initial_reg = previous_reg)
+            previous_reg = [header_info['drift_deg' + str(j)] for j in [3, 2, 1, 0]]
 
             if (not require_gps) or (L['gps'].shape[0] > 0) :
                 for key in header_info.keys():
-                    header.loc[i, key] = header_info[key]
+                    header_values.setdefault(key, {})[i] = header_info[key]
                 
-            header.loc[i, 'num_data_pts'] = L['data'].shape[0]
-            header.loc[i, 'SN'] = _read_SN(fn)
-
-            M = pd.concat((M, L['metadata']))
-            G = pd.concat((G, L['gps']))
-            D = np.vstack((D, L['data']))
-            startMillis = D[-1,0]
+            header_values.setdefault('num_data_pts', {})[i] = L['data'].shape[0]
+            ## use the serial number from the raw file index if there is one; otherwise read it
+            SN = None if raw_index is None else raw_index.record(os.path.basename(fn))['SN']
+            header_values.setdefault('SN', {})[i] = _read_SN(fn) if SN is None else SN
+
+            M_list.append(L['metadata'])
+            G_list.append(L['gps'])
+            D_list.append(L['data'])
+            startMillis = L['data'][-1,0]
             
         except KeyboardInterrupt:
             raise
@@ -1071,16 +2304,27 @@ def _read_several(fnList, version = 0.9, require_gps = True):
             pass
         ## end of fn loop
     #_breakpoint()
+    M = pd.concat([_make_empty_metadata()] + M_list)
+    G = pd.concat([_make_empty_gps()] + G_list)
+    D = np.concatenate([np.ndarray([0,2])] + D_list)
+    for key, values in header_values.items():
+        header.loc[list(values.keys()), key] = list(values.values())
     return {'metadata':M, 'gps':G, 'data': D, 'header': header}
 
+def _parse_threads():
+    ## threads for parse_gemfiles: the default (one per file, up to the number of CPUs), except in
+    ## a worker process (e.g. convert with num_processes > 1), where the pool already uses the CPUs
+    return 1 if multiprocessing.parent_process() is not None else None
+
 ##########
-def _calculate_drift(L, fn, require_gps):
+def _calculate_drift(L, fn, require_gps, initial_reg = None):
     ## require_gps levels:
     ## 0 & frequent valid GPS: use GPS data to estimate start time and drift
     ## 0 & at least one valid GPS: use GPS to estimate start time only, assume zero drift
     ## 0 & no valid GPS: use end of previous file + 0.01 sec as start time, assume zero drift
     ## 1 & frequent valid GPS: use GPS data to estimate start time and drift
     ## 1, otherwise: exception
+    ## initial_reg: optional warm start for the regression (the previous file's drift fit)
     default_deg1 = 0.001024 # 1024 microseconds per gem "millisecond"
     _breakpoint()
     if ('t' not in L['gps'].keys()) or (len(L['gps'].t) == 0):
@@ -1099,7 +2343,7 @@ def _calculate_drift(L, fn, require_gps):
     if sufficient_gps:
         try:
             ## run the GPS time vs millis regression
-            reg, num_gps_nonoutliers, MAD_nonoutliers, resid, xx, yy = _robust_regress(L['gps'].msPPS, L['gps'].t)
+            reg, num_gps_nonoutliers, MAD_nonoutliers, resid, xx, yy = _robust_regress(L['gps'].msPPS, L['gps'].t, initial_reg = initial_reg)
             ## ensure that the regression was successful
             if ((0.001024*(L['data'][-1,0] - L['data'][0,0]) / (xx.iloc[-1] - xx.iloc[0])) > 2) \
                or (num_gps_nonoutliers < 10) \
@@ -1151,8 +2395,9 @@ def _calculate_drift(L, fn, require_gps):
 
 ########
 
-def _robust_regress(x, y, z = 4, recursive_depth = np.inf, verbose = False):
-    # goal: a quadratic regression that is robust to RARE outliers, especially for GPS data
+def _robust_regress(x, y, z = 4, recursive_depth = 20, verbose = False, initial_reg = None,
+                    warm_start_tolerance = 1):
+    # goal: a cubic regression that is robust to RARE outliers, especially for GPS data
     # scipy.stats.theilslopes (median-based) looks problematic because the median is only affected
     # by the central data point and doesn't benefit from the other samples' information. Also, GPS
     # data slopes are weirdly distributed.
@@ -1160,32 +2405,106 @@ def _robust_regress(x, y, z = 4, recursive_depth = np.inf, verbose = False):
 
     ### z < 3 has an off-chance of repeated trimming with few data points remaining! don't do that.
 
-    ## Calculate regression line and residuals.
-    with warnings.catch_warnings():
-        warnings.simplefilter("error")
-        reg = np.polynomial.polynomial.polyfit(x, y, 3)[::-1]
-        #linreg = scipy.stats.linregress(x, y)
-        #resid = y - (linreg.intercept + x * linreg.slope)
-        #reg = np.polyfit(x, y, 3)
+    ## The fit is solved from the normal equations, which are updated by subtracting the outliers'
+    ## terms after each round of outlier removal instead of being rebuilt (formerly, the fit was
+    ## redone with polyfit recursively). x is scaled to [-1, 1] and y is centered so that
+    ## the equations are well conditioned. The final fit is always solved from scratch on the
+    ## remaining points, so the subtractions don't leave rounding error in the result.
+    ## recursive_depth caps the rounds of outlier removal.
+    ## initial_reg is an optional warm start (e.g., the previous file's fit, [deg3, deg2, deg1, deg0]):
+    ## points more than warm_start_tolerance seconds from it (after removing its median offset) are
+    ## dropped before the first fit, so gross outliers don't take several rounds to remove. If that
+    ## drops half of the points (e.g., after a restart) or drops any that the final fit would keep,
+    ## the warm start is abandoned and the fit starts over from all points.
+    ## Raises np.linalg.LinAlgError if the cubic is undetermined: fewer than 4 points, or points
+    ## too close to fewer than 4 distinct millis (e.g., repeated msPPS). polyfit raised RankWarning
+    ## (as an error here) only for exactly singular fits, so some nearly singular GPS sets that
+    ## used to get an arbitrary cubic are now rejected. _calculate_drift handles the error like
+    ## any failed regression: it assumes zero drift, or skips the file if require_gps is set.
+    xa = np.asarray(x, dtype = 'float')
+    ya = np.asarray(y, dtype = 'float')
+    keep = np.ones(len(xa), dtype = bool)
+    warm = False
+    if initial_reg is not None:
+        warm_resid = ya - _eval_cubic(initial_reg, xa)
+        warm_keep = np.abs(warm_resid - np.median(warm_resid)) <= warm_start_tolerance
+        if np.sum(warm_keep) > (len(xa) / 2):
+            keep = warm_keep.copy()
+            warm = True
+    V, A, b, shift = _normal_equations(xa, ya, keep)
+    fresh = True
+    depth = 0
+    while True:
+        reg = _solve_normal_equations(A, b, shift, np.sum(keep))
+        resid = ya[keep] - _eval_cubic(reg, xa[keep])
+        outliers = np.abs(resid) > (z*np.std(resid))
+        if any(outliers) and (depth < recursive_depth):
+            if verbose:
+                print(f'round {depth}, num_outliers {np.sum(outliers)}')
+            ## remove the outliers' terms from the normal equations
+            w = np.where(keep)[0][outliers]
+            A -= V[w].T @ V[w]
+            b -= V[w].T @ (ya[w] - shift[2])
+            keep[w] = False
+            fresh = False
+            depth += 1
+        elif not fresh: # converged: refit from scratch to check
+            V, A, b, shift = _normal_equations(xa, ya, keep)
+            fresh = True
+        elif warm and np.any(np.abs(ya[~warm_keep] - _eval_cubic(reg, xa[~warm_keep])) <= (z*np.std(resid))):
+            if verbose:
+                print('warm start dropped good points, starting over')
+            keep[:] = True
+            V, A, b, shift = _normal_equations(xa, ya, keep)
+            warm = False
+            depth = 0
+        else:
+            break
+    x = x[keep]
+    y = y[keep]
     resid = y - (reg[3] + x * reg[2] + x**2 * reg[1] + x**3 * reg[0])
-    #resid = y - _apply_fit(x, reg) # doesn't work because reg is not dict
-
-    ## If any are found to be outliers, remove them and recalculate recursively.
-    outliers = np.abs(resid) > (z*np.std(resid))
-    if any(outliers) and (recursive_depth > 0):
-        if verbose:
-            print(f'depth {recursive_depth}, num_outliers {np.sum(outliers)}')
-        return _robust_regress(x[~outliers], y[~outliers], z, recursive_depth = recursive_depth - 1, verbose = verbose)
-    else:
-        return (reg, len(x), np.max(np.abs(resid)), resid, x, y)
+    return (reg, len(x), np.max(np.abs(resid)), resid, x, y)
+
+def _eval_cubic(reg, x):
+    ## evaluate a cubic with coefficients [deg3, deg2, deg1, deg0] as _robust_regress does
+    return reg[3] + x * reg[2] + x**2 * reg[1] + x**3 * reg[0]
+
+def _normal_equations(x, y, keep):
+    ## normal equations of a cubic fit to the kept points, with x scaled to [-1, 1] and y centered.
+    ## Returns the scaled Vandermonde matrix of all points, the equations, and the scaling.
+    xk = x[keep]
+    x0 = (xk.max() + xk.min()) / 2
+    xs = (xk.max() - xk.min()) / 2
+    if xs == 0:
+        xs = 1
+    y0 = np.mean(y[keep])
+    V = np.polynomial.polynomial.polyvander((x - x0) / xs, 3)
+    A = V[keep].T @ V[keep]
+    b = V[keep].T @ (y[keep] - y0)
+    return V, A, b, (x0, xs, y0)
+
+def _solve_normal_equations(A, b, shift, num_points):
+    ## solve scaled normal equations and return the coefficients [deg3, deg2, deg1, deg0] for
+    ## unscaled x and y. Reject fits that are underdetermined or nearly singular; rounding when
+    ## forming A is relative to its largest singular value, so that is the tolerance.
+    x0, xs, y0 = shift
+    s = np.linalg.svd(A, compute_uv = False)
+    if (num_points < 4) or (s[-1] <= s[0] * num_points * np.finfo(float).eps):
+        raise np.linalg.LinAlgError('robust regression is poorly conditioned')
+    coefs = np.linalg.solve(A, b)
+    coefs = np.polynomial.Polynomial(coefs, domain = [x0 - xs, x0 + xs], window = [-1, 1]).convert().coef
+    coefs = np.concatenate([coefs, np.zeros(4 - len(coefs))]) # convert() trims zero terms
+    coefs[0] += y0
+    return coefs[::-1]
 
 def _no_drift(x):
     return x * 0.001024
 
-def _plot_drift(file_list, z = 4, recursive_depth = np.inf):
+def _plot_drift(file_list, z = 4, recursive_depth = np.inf, cache = False):
+    import matplotlib.pyplot as plt
     if type(file_list) is str:
         file_list = [file_list]
-    output = _read_several(file_list)
+    output = _read_several(file_list, cache = cache)
     g = output['gps']
     xg = np.array(g['msPPS'])
     yg = np.array(g['t']) # GPS time
@@ -1204,13 +2523,40 @@ def _plot_drift(file_list, z = 4, recursive_depth = np.inf):
 def _apply_fit(x, model):
     return model['drift_deg0'] + model['drift_deg1'] * x + model['drift_deg2'] * x**2 + model['drift_deg3'] * x**3
              
-def _apply_segments(x, model):
-    y = np.zeros(len(x))
+def _apply_segments(x, model, out = None):
+    ## Evaluate the piecewise drift fit in 'model' (header) at millis x. Samples outside all
+    ## segments are NaN; where segments overlap, the later one wins. Each segment's cubic is
+    ## evaluated in place on just the slice of sorted x that it covers. The terms are summed
+    ## in the same order as _apply_fit (not Horner form) so that sample times are rounded
+    ## identically. 'out' is an optional float array to write the result in.
+    x = np.asarray(x, dtype = 'float')
+    y = np.empty(len(x)) if out is None else out
     y[:] = np.nan
-    for i in range(len(model['start_ms'])):
-        w = (x >= model['start_ms'][i]) & (x <= model['end_ms'][i])
-        #y[w] = model['drift_deg0'][i] + model['drift_deg1'][i] * x[w] + model['drift_deg2'][i] * x[w]**2 + model['drift_deg3'][i] * x[w]**3
-        y[w] = _apply_fit(x[w], model.iloc[i,:])
+    if not np.all(x[1:] >= x[:-1]): # unsorted (or NaN): evaluate in sorted order and put back
+        order = np.argsort(x, kind = 'stable')
+        order = order[:np.count_nonzero(~np.isnan(x))] # NaNs are sorted last and stay NaN
+        y[order] = _apply_segments(x[order], model)
+        return y
+    start = np.asarray(model['start_ms'], dtype = 'float')
+    end = np.asarray(model['end_ms'], dtype = 'float')
+    coefs = [np.asarray(model['drift_deg' + str(i)], dtype = 'float') for i in range(4)]
+    first = np.searchsorted(x, start, side = 'left') # first sample >= start
+    last = np.searchsorted(x, end, side = 'right') # after the last sample <= end
+    tmp = np.empty(np.max(last - first, initial = 0))
+    for i in range(len(start)):
+        if np.isnan(start[i]) or np.isnan(end[i]):
+            continue
+        xs = x[first[i]:last[i]]
+        ys = y[first[i]:last[i]]
+        ts = tmp[:len(xs)]
+        np.multiply(xs, coefs[1][i], out = ys)
+        ys += coefs[0][i]
+        np.square(xs, out = ts)
+        ts *= coefs[2][i]
+        ys += ts
+        np.power(xs, 3, out = ts)
+        ts *= coefs[3][i]
+        ys += ts
     return y
     
 def _assign_times(L):
@@ -1221,7 +2567,8 @@ def _assign_times(L):
     
     G = _reformat_GPS(L['gps'])
     try:
-        breaks = _find_breaks(L)
+        with _timed_stage('breaks'):
+            breaks = _find_breaks(L)
     except:
         raise CorruptRawFile('Problem between ' + fnList[0] + '-' + fnList[-1] + '; stopping before this interval. Break between recording periods? Corrupt files?')
     piecewiseTimeFit = L['header']
@@ -1233,16 +2580,42 @@ def _assign_times(L):
     
     ## Interpolate data to equal spacing to make obspy trace.
     ## Note that data gaps just get interpolated through as a straight line. Not ideal.
-    D = L['data']
-    D = np.hstack((D, _apply_segments(D[:,0], piecewiseTimeFit).reshape([D.shape[0],1])))
+    D = np.empty((L['data'].shape[0], 3))
+    D[:,:2] = L['data']
+    _apply_segments(D[:,0], piecewiseTimeFit, out = D[:,2])
     timing_info = [L['gps'], L['data'], breaks, piecewiseTimeFit]
-    L['data'] = _interp_time(D) # returns stream, populates known fields: channel, delta, and starttime
+    with _timed_stage('interp'):
+        L['data'] = _interp_time(D) # returns stream, populates known fields: channel, delta, and starttime
     L['gps'] = G
     return (L, timing_info)
     
 
 
 #########################################################
+def _spline_interp(t, p, t_out, block = 50000, overlap = 200):
+    ## Evaluate the cubic spline through (t, p) at sorted times t_out, fitting it in blocks of
+    ## 'block' samples so that time and memory stay bounded for long chunks of data. Each block's
+    ## spline is fit with 'overlap' extra samples on each side. A cubic spline's dependence on
+    ## distant samples decays by a factor of 2-sqrt(3) (~0.27) per sample, so beyond about 30
+    ## samples the block edges make no difference at double precision: the result matches a
+    ## single CubicSpline over all of t to within rounding error (~1e-9 counts).
+    if np.any(np.diff(t) <= 0):
+        raise ValueError('`t` must be strictly increasing')
+    import scipy.interpolate
+    n = len(t)
+    if n <= (block + 2 * overlap):
+        return scipy.interpolate.CubicSpline(t, p)(t_out)
+    p_out = np.empty(len(t_out))
+    for i0 in range(0, n, block):
+        i1 = min(i0 + block, n)
+        f = scipy.interpolate.CubicSpline(t[max(0, i0 - overlap):min(n, i1 + overlap)],
+                                          p[max(0, i0 - overlap):min(n, i1 + overlap)])
+        ## this block's spline is used for output times from t[i0] to t[i1]
+        j0 = np.searchsorted(t_out, t[i0]) if i0 > 0 else 0
+        j1 = np.searchsorted(t_out, t[i1]) if i1 < n else len(t_out)
+        p_out[j0:j1] = f(t_out[j0:j1])
+    return p_out
+
 def _interp_time(data, t1 = -np.Inf, t2 = np.Inf, min_step = 0, max_step = 0.025):
     ## min_step, max_step are min/max interval allowed before a break is identified
     eps = 0.001 # this might need some adjusting to prevent short data gaps
@@ -1267,8 +2640,9 @@ def _interp_time(data, t1 = -np.Inf, t2 = np.Inf, min_step = 0, max_step = 0.025
     output = obspy.Stream()
     for i in range(len(starts)):
         w = (t_in >= (starts[i] - 0.01 - eps)) & (t_in <= (ends[i] + 0.01 - eps))
+        t_interp = np.round(starts[i] + np.arange(np.trunc((ends-starts)[i]/0.01)) * 0.01, 2)
         try:
-            f = scipy.interpolate.CubicSpline(t_in[w], p_in[w])
+            p_interp = np.array(_spline_interp(t_in[w], p_in[w], t_interp).round(), dtype = 'int32')
         except:
             _breakpoint()
             continue
@@ -1276,8 +2650,6 @@ def _interp_time(data, t1 = -np.Inf, t2 = np.Inf, min_step = 0, max_step = 0.025
             ##    raise(Exception('_interp_time failed between ' +str(obspy.UTCDateTime(starts[i])) +\
             ##                    ' and ' + str(obspy.UTCDateTime(ends[i]))))
         #t_interp = np.arange(starts[i], ends[i] + eps, 0.01) # this is a bug in np.arange--intervals can be inconsistent when delta is float. This can result in significant timing errors, especially for long traces.
-        t_interp = np.round(starts[i] + np.arange(np.trunc((ends-starts)[i]/0.01)) * 0.01, 2)
-        p_interp = np.array(f(t_interp).round(), dtype = 'int32')
         tr = obspy.Trace(p_interp)
         tr.stats.starttime = t_interp[0]
         tr.stats.delta = 0.01
@@ -1379,24 +2751,37 @@ def get_bitweight_info(SN, config, units = 'Pa'):
     return specs
 
 def _reformat_GPS(G_in):
-    t = [obspy.UTCDateTime(tt) for tt in G_in['t']]
-    date = [tt.julday + tt.hour/24.0 + tt.minute/1440.0 + tt.second/86400.0 for tt in t]
-    G_dict = {'year': np.array([int(year) for year in G_in.year]),
-              'date': np.array(date),
+    ## 'date' is the fractional day of year. Times are handled as epoch seconds; UTCDateTime
+    ## objects are only made for the 't' column of the output.
+    t = np.asarray(G_in['t'], dtype = 'float')
+    seconds = np.floor(t).astype(np.int64)
+    day = seconds // 86400
+    day_of_year = (day.astype('datetime64[D]') - day.astype('datetime64[D]').astype('datetime64[Y]')).astype(np.int64)
+    second_of_day = seconds - day * 86400
+    date = ((day_of_year + 1) + (second_of_day // 3600)/24.0 + (second_of_day % 3600 // 60)/1440.0
+            + (second_of_day % 60)/86400.0)
+    G_dict = {'year': np.asarray(G_in.year).astype(int),
+              'date': date,
               'lat': np.array(G_in.lat),
               'lon': np.array(G_in.lon),
-              't': np.array(t)}
+              't': np.array([obspy.UTCDateTime(tt) for tt in t])}
     return pd.DataFrame.from_dict(G_dict)
 
 
 def _find_breaks(L):
+    ## Find breaks in the data (gaps or backward steps in the millis) and in the GPS timing
+    ## (unexpected jumps between millis and GPS time), and return the millis where each
+    ## break starts and ends. Data breaks are found all at once, and the GPS fixes before and
+    ## after each GPS break are looked up with searchsorted instead of searching the whole GPS
+    ## table for each break. GPS breaks are then merged into the list of breaks in order, as each one can extend the breaks that
+    ## later ones are compared with.
     _breakpoint()
     ## breaks are specified as their millis for comparison between GPS and data
     ## sanity check: exclude suspect GPS tags
-    t = np.array([obspy.UTCDateTime(tt) for tt in L['gps'].t])
-    tPad = np.array([t[0]] + list(t) + [t[-1]])
+    t = np.asarray(L['gps'].t, dtype = 'float')
+    tPad = np.concatenate([t[:1], t, t[-1:]])
     try:
-        badTags = ((t > obspy.UTCDateTime.now()) | # no future dates 
+        badTags = ((t > time.time()) | # no future dates 
                    (L['gps'].year < 2015) | # no years before the Gem existed
                    ((np.abs(t - tPad[:-2]) > 86400) & (np.abs(t - tPad[2:]) > 86400)) | # exclude outliers
                    (L['gps'].lat == 0) | # exclude points within ~1m of the equator
@@ -1405,9 +2790,9 @@ def _find_breaks(L):
     except:
         _breakpoint()
     mD = np.array(L['data'][:,0]) # data millis
+    if len(mD) == 0:
+        raise EmptyRawFile('No data samples to find breaks in')
     dmD = np.diff(mD)
-    starts = np.array([])
-    ends = np.array([])
     dataBreaks = np.where((dmD > 25) | (dmD < 0))[0]
     if 0 in dataBreaks:
         mD = mD[1:]
@@ -1417,46 +2802,65 @@ def _find_breaks(L):
         mD = mD[:-1]
         dmD = dmD[:-1]
         dataBreaks = dataBreaks[dataBreaks != len(dmD)]
-    #_breakpoint()
-    for i in dataBreaks:
-        starts = np.append(starts, np.max(mD[(i-1):(i+2)]))
-        ends = np.append(ends, np.min(mD[(i-1):(i+2)]))
+    ## data breaks: the data restart at the latest and stop at the earliest of the samples
+    ## around the break
+    if (len(dataBreaks) > 0) and (dataBreaks[0] == 0):
+        raise CorruptRawFile('data breaks at the first two samples')
+    window = np.stack([mD[dataBreaks - 1], mD[dataBreaks], mD[dataBreaks + 1]])
+    num_breaks = len(dataBreaks)
     tG = np.array(L['gps'].t).astype('float') # gps times
     mG = np.array(L['gps'].msPPS).astype('float') # gps millis
     dmG_dtG = np.diff(mG)/np.diff(tG) * 1.024 # correction for custom millis in gem firmware (1024 us/ms)
-    gpsBreaks = np.argwhere(np.isnan(dmG_dtG) | # missing data...unlikely
-                            ((np.diff(tG) > 50) & ((dmG_dtG > 1000.1) | (dmG_dtG < 999.9))) | # 100 ppm drift between cycles
-                            ((np.diff(tG) <= 50) & ((dmG_dtG > 1002) | (dmG_dtG < 998))) # most likely: jumps within a cycle (possibly due to leap second)
-    )
+    gpsBreaks = np.where(np.isnan(dmG_dtG) | # missing data...unlikely
+                         ((np.diff(tG) > 50) & ((dmG_dtG > 1000.1) | (dmG_dtG < 999.9))) | # 100 ppm drift between cycles
+                         ((np.diff(tG) <= 50) & ((dmG_dtG > 1002) | (dmG_dtG < 998))) # most likely: jumps within a cycle (possibly due to leap second)
+    )[0]
+    ## starts and ends are filled in place (data breaks first, then GPS breaks)
+    starts = np.empty(num_breaks + len(gpsBreaks))
+    ends = np.empty(num_breaks + len(gpsBreaks))
+    starts[:num_breaks] = window.max(axis = 0)
+    ends[:num_breaks] = window.min(axis = 0)
+    num_starts = num_ends = num_breaks
+
+    ## for each GPS break, the first fix after it (i.e., with the lowest GPS time greater than
+    ## the fix before the break) and the last fix before it (the highest GPS time less than
+    ## the fix after the break); the last fix is used where several have the same time
+    valid = np.where(~np.isnan(tG))[0]
+    order = valid[np.argsort(tG[valid], kind = 'stable')]
+    tG_sorted = tG[order]
+    after = np.searchsorted(tG_sorted, tG[gpsBreaks], side = 'right')
+    after_last = np.searchsorted(tG_sorted, tG_sorted[np.minimum(after, len(order) - 1)], side = 'right') - 1
+    has_after = (after < len(order)) & ~np.isnan(tG[gpsBreaks])
+    before = np.searchsorted(tG_sorted, tG[gpsBreaks + 1], side = 'left') - 1
+    has_before = (before >= 0) & ~np.isnan(tG[gpsBreaks + 1])
+    start_after = mG[order[np.maximum(after_last, 0)]] if len(order) > 0 else np.zeros(len(gpsBreaks))
+    end_before = mG[order[np.maximum(before, 0)]] if len(order) > 0 else np.zeros(len(gpsBreaks))
+
     min_possible_start = mD.min() # this only changes if a GPS break around the first GPS sample invalidates preceding D samples
-    for i in gpsBreaks:
-        i = int(i)
+    for k, i in enumerate(gpsBreaks):
         ## This part is tricky: what if a gpsEnd happens between a dataEnd and dataStart?
         ## Let's be conservative: if either the gpsEnd or gpsStart is within a bad data interval, or what if they bracket a bad data interval?
         ## choose them so that they exclude the most data
-        #breakpoint()
-        overlaps = (mG[i] <= starts) & (mG[i+1] >= ends)
+        overlaps = (mG[i] <= starts[:num_starts]) & (mG[i+1] >= ends[:num_ends])
         if(np.any(overlaps)):
             w = np.argwhere(overlaps)
-            starts[w] = max(np.append(starts[w], mG[(i-1):(i+2)].max()))
-            ends[w] = max(np.append(ends[w], mG[(i-1):(i+2)].min()))
+            starts[:num_starts][w] = max(np.append(starts[:num_starts][w], mG[(i-1):(i+2)].max()))
+            ends[:num_ends][w] = max(np.append(ends[:num_ends][w], mG[(i-1):(i+2)].min()))
         else:
-            wmin = np.argwhere(tG > tG[i])
-            ## If a file's very last gps fix triggered a break, an exception would be raised here.
-            ## This is unlikely and it's not clear now what the right thing to do is. So not implemented.
-            try:
-                starts = np.append(starts, mG[wmin][tG[wmin] == tG[wmin].min()][-1]) # [-1] just in case tG values are repeated
-            except:
-                _breakpoint()
-            wmax = np.argwhere(tG < tG[i+1])
+            ## If a file's very last gps fix triggered a break, there is no fix after it. This is
+            ## unlikely and it's not clear now what the right thing to do is, so no start is added.
+            if has_after[k]:
+                starts[num_starts] = start_after[k]
+                num_starts += 1
             ## It's possible for a gps break to occur so early that no good fixes occur before the
             ## break (e.g., leap second change). In that case, pre-break data are unrecoverable.
-            if len(wmax) == 0: # empty wmax means no fixes before break
+            if not has_before[k]: # no fixes before break
                 min_possible_start = tG[i+1]
             else: # normal: add an end at this break
-                ends = np.append(ends, mG[wmax][tG[wmax] == tG[wmax].max()][-1]) # [-1] in case tG values are repeated
-    starts = np.append(min_possible_start, starts)
-    ends = np.append(ends, mD.max())
+                ends[num_ends] = end_before[k]
+                num_ends += 1
+    starts = np.append(min_possible_start, starts[:num_starts])
+    ends = np.append(ends[:num_ends], mD.max())
     return {'starts':starts, 'ends':ends}
 
 def _make_empty_header(fnList):
@@ -1530,4 +2934,71 @@ def _convert_one_file(input_filename, output_filename = None, require_gps = True
     if output_filename is None:
         output_filename = os.path.split(input_filename)[-1] + '.mseed'
     L['data'].write(output_filename)
-    
+    return L['data']
+
+def convert_files(input_filenames, outputdir = '.', require_gps = True, num_processes = 1, output_filenames = None):
+    """
+    Convert individual raw files to miniSEED, each file independently of the others.
+
+    Parameters
+    ----------
+    input_filenames : list of str
+        Raw files to convert.
+    outputdir : str, default '.'
+        Directory to write converted files in (created if necessary). Each output file is
+        named after its input file plus '.mseed'; if several inputs have the same name, the
+        name of the directory containing each is prepended.
+    require_gps : bool, default True
+        If False, convert files even if they don't have enough GPS data for accurate timing.
+    num_processes : int, default 1
+        Number of files to convert in parallel processes.
+    output_filenames : list of str, default None
+        Output file for each input file; overrides outputdir.
+
+    Returns
+    -------
+    pandas.DataFrame with one row per input file, with the following columns:
+
+        - input: input file name (str)
+        - output: output file name (str)
+        - status: 'converted' or 'failed' (str)
+        - samples: number of samples written (int)
+        - seconds: conversion time (float)
+        - error: error message if the conversion failed, otherwise '' (str)
+    """
+    input_filenames = list(input_filenames)
+    if output_filenames is None:
+        output_filenames = _batch_output_filenames(input_filenames, outputdir)
+        os.makedirs(outputdir, exist_ok = True)
+    args_list = [(fn_in, fn_out, require_gps) for fn_in, fn_out in zip(input_filenames, output_filenames)]
+    if (num_processes > 1) and (len(args_list) > 1):
+        with ProcessPoolExecutor(max_workers = num_processes) as pool:
+            chunksize = max(1, len(args_list) // (4 * num_processes))
+            results = list(pool.map(_convert_file_summary, args_list, chunksize = chunksize))
+    else:
+        results = [_convert_file_summary(args) for args in args_list]
+    return pd.DataFrame(results, columns = ['input', 'output', 'status', 'samples', 'seconds', 'error'])
+
+def _batch_output_filenames(input_filenames, outputdir):
+    ## output file names for convert_files: the input file name plus '.mseed', with the input's
+    ## directory name prepended where several inputs share a name (e.g. FILE0000.TXT)
+    names = [os.path.basename(fn) for fn in input_filenames]
+    counts = collections.Counter(names)
+    output_filenames = []
+    for fn, name in zip(input_filenames, names):
+        if counts[name] > 1:
+            name = os.path.basename(os.path.dirname(os.path.abspath(fn))) + '_' + name
+        output_filenames.append(os.path.join(outputdir, name + '.mseed'))
+    return output_filenames
+
+def _convert_file_summary(args):
+    ## convert one file for convert_files, returning a summary instead of raising errors
+    input_filename, output_filename, require_gps = args
+    t0 = time.perf_counter()
+    try:
+        st = _convert_one_file(input_filename, output_filename, require_gps = require_gps)
+        status, samples, error = 'converted', sum(tr.stats.npts for tr in st), ''
+    except Exception as e:
+        status, samples, error = 'failed', 0, str(e)
+    return {'input': input_filename, 'output': output_filename, 'status': status, 'samples': samples,
+            'seconds': time.perf_counter() - t0, 'error': error}
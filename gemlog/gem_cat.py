@@ -12,7 +12,7 @@ import sys
 import shutil
 from gemlog.core import _read_single, EmptyRawFile, CorruptRawFile
 
-def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
+def gem_cat(input_dir, output_dir, ext = '', cat_all = False, cache = False):
     """
     gem_cat
     Merge raw data files so that all contain GPS data.
@@ -24,6 +24,7 @@ def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
     input_dir: raw gem directory
     output_dir: path for renumbered and concatenated files
     ext: extension of raw files to convert (normally the serial number; sometimes TXT for old Gems)
+    cache: if True, use the cache of parsed raw files in input_dir (see gemlog.convert)
     
     Returns
     -------
@@ -58,7 +59,7 @@ def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
                 out_file = output_dir + '/FILE9999.' + SN
                 shutil.copy(gem_files[k], out_file)
             else:
-                AppendFile(gem_files[k], out_file, gem_files[k-1])
+                AppendFile(gem_files[k], out_file, gem_files[k-1], cache)
             continue
 
         try:
@@ -86,7 +87,7 @@ def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
             has_gps[k] = 1
             if has_gps[k - 1] == 0:
                 ## if this isn't the first file being processed and it does have GPS data but the previous file didn't, append it to the current outfile
-                AppendFile(gem_files[k], out_file, gem_files[k-1])
+                AppendFile(gem_files[k], out_file, gem_files[k-1], cache)
             else:
                 ## if this isn't the first file being processed and it has gps data and the previous file did too, start a new outfile
                 #out_file = output_dir + "/FILE" + sprintf("%04d", counter) + "." + SN
@@ -100,7 +101,7 @@ def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
             #    next
             #else:
                 ##system(paste0("cat ", gem_files[k], " >> ",    out_file))
-            AppendFile(gem_files[k], out_file, gem_files[k-1])
+            AppendFile(gem_files[k], out_file, gem_files[k-1], cache)
     return 
 
 #%%
@@ -108,7 +109,7 @@ def gem_cat(input_dir, output_dir, ext = '', cat_all = False):
 #outfile = out_file
 #prev_infile = gem_files[0]
 #if True:
-def AppendFile(infile, outfile, prev_infile):
+def AppendFile(infile, outfile, prev_infile, cache = False):
     # ensure that the output path exists
     outpath = os.path.dirname(outfile)
     if not os.path.exists(outpath):
@@ -126,7 +127,7 @@ def AppendFile(infile, outfile, prev_infile):
         ###########################################
         #L = suppressWarnings(ReadGem(nums = num, path = path, units = 'counts')) # suppressWarnings because it'll warn that there's no GPS issue (which is kind of the point) or SN (which doesn't matter)
         #p_start = L$p[length(L$p)]
-        p_start = int(_read_single(prev_infile, require_gps = False, version = format)['data'][-1,1])
+        p_start = int(_read_single(prev_infile, require_gps = False, version = format, cache = cache)['data'][-1,1])
         ########################################
 
         ## read the first data line of the infile and convert it to an ADC reading difference
@@ -171,10 +172,11 @@ def AppendFile(infile, outfile, prev_infile):
     return
 
 def print_call():
-    print('gem_cat -i <input_dir> -o <output_dir> -e <ext>')
+    print('gem_cat -i <input_dir> -o <output_dir> -e <ext> -c')
     print('input_dir: raw gem directory')
     print('output_dir: path for renumbered and concatenated files')
     print('ext: extension of raw files to convert (normally the serial number; sometimes TXT for old Gems)')
+    print('-c: if used, cache parsed raw files in input_dir/.gemlog/parsed to speed up later runs')
     
 
 def main(argv = None):
@@ -183,8 +185,9 @@ def main(argv = None):
     inputdir = 'raw'
     outputdir = 'raw_merged'
     ext = ''
+    cache = False
     try:
-        opts, args = getopt.getopt(argv,"hi:o:e:")
+        opts, args = getopt.getopt(argv,"hci:o:e:")
     except getopt.GetoptError:
         print_call()
         sys.exit(2)
@@ -198,6 +201,8 @@ def main(argv = None):
             outputdir = arg
         elif opt in ("-e", "--ext"):
             ext = arg
+        elif opt in ("-c", "--cache"):
+            cache = True
     try:
         fn = os.listdir(inputdir)
     except:
@@ -209,7 +214,7 @@ def main(argv = None):
         print('Data folder ' + inputdir + ' does not contain any data files.')
         sys.exit()
     try:
-        gem_cat(inputdir, outputdir, ext)
+        gem_cat(inputdir, outputdir, ext, cache = cache)
     except:
         print('gem_cat failed')
         sys.exit()
@@ -3,30 +3,27 @@
 import sys # should always be available, doesn't need to be in "try"
 try:
     import numpy as np
-    import os, getopt, logging, platform
+    import os, getopt, logging, platform, json, time
+    import pandas as pd
     #import glob, traceback # apparently not needed anymore
     import gemlog
-    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor
 except Exception as e:
     print('Either dependencies are missing, or the environment is not active')
     print('Error message:')
     print(e)
     sys.exit(2)
 
-def find_SN(x):
-    # find the serial number of a raw data file
-    return x[9:13]
-
 def unique(list1): 
     unique, index = np.unique(list1, return_index=True)
     return sorted(unique)
 
 def convert_single_SN(arg_list):
-    inputdir, SN, outputdir, output_format, output_length = arg_list
+    inputdir, SN, outputdir, output_format, output_length, resume, scheduler, nums, raw_index, metrics, cache = arg_list
     logging.info(f'Beginning {SN}')
     try:
         #print([inputdir, SN, outputdir, output_format, output_length])
-        gemlog.convert(inputdir, SN = SN, convertedpath = outputdir, output_format = output_format, file_length_hour = output_length)
+        gemlog.convert(inputdir, SN = SN, nums = nums, convertedpath = outputdir, output_format = output_format, file_length_hour = output_length, resume = resume, scheduler = scheduler, raw_index = raw_index, metrics = metrics, cache = cache)
         print(f'{SN} done')
     except KeyboardInterrupt:
         logging.info('Interrupted by user')
@@ -45,7 +42,7 @@ def convert_single_SN(arg_list):
     return 0
 
 def print_call():
-    print('gemconvert -i <inputdir> -s <serialnumbers> -x <exclude_serialnumbers> -o <outputdir> -f <format> -l <filelength_hours> -p <number_of_processes>')
+    print('gemconvert -i <inputdir> -s <serialnumbers> -x <exclude_serialnumbers> -o <outputdir> -f <format> -l <filelength_hours> -p <number_of_processes> -r -m <metrics_file> -c')
     print('-i --inputdir: default ./raw/')
     print('-s --serialnumbers: separate by commas (no spaces); default all')
     print('-x --exclude_serialnumbers: separate by commas (no spaces); default none')
@@ -54,6 +51,9 @@ def print_call():
     print('-l --length: length of output converted files in hours; default 24')
     print('-t --test: if used, print the files to convert, but do not actually run conversion')
     print('-p --parallel: number of processes to run in parallel (limited by your computer); default 1.')
+    print('-r --resume: if used, only convert raw files that are new or changed since the last conversion into outputdir (which must also have used -r)')
+    print('-m --metrics: if used, append timing and throughput metrics to this file (JSON lines), and print a summary at the end')
+    print('-c --cache: if used, cache parsed raw files in inputdir/.gemlog/parsed, so that converting them again (e.g. with different -f or -l) is faster')
     print('-h --help: print this message')
     print('Problems: check/raise issues at https://github.com/ajakef/gemlog/issues/')
     print('alias: gem2ms. gemlog version: ' + gemlog.__version__)
@@ -80,11 +80,14 @@ def main(argv = None):
     output_format = 'MSEED'
     output_length = 24 # hours
     num_processes = 1
+    resume = False
+    metrics_file = None
+    cache = False
     gemlog._debug = True
 
     ## parse options selected by user
     try:
-        opts, args = getopt.getopt(argv,"hdti:s:x:o:f:l:p:",["inputdir=","serialnumber="])
+        opts, args = getopt.getopt(argv,"hdtrci:s:x:o:f:l:p:m:",["inputdir=","serialnumber=","resume","metrics=","cache"])
     except getopt.GetoptError:
         print_call()
         sys.exit(2)
@@ -108,6 +111,12 @@ def main(argv = None):
             exclude = arg
         elif opt in ("-t", "--test"):
             test = True
+        elif opt in ("-r", "--resume"):
+            resume = True
+        elif opt in ("-m", "--metrics"):
+            metrics_file = arg
+        elif opt in ("-c", "--cache"):
+            cache = True
         elif opt in ("-o", "--outputdir"):
             outputdir = arg
         elif opt in ("-f", "--format"):
@@ -140,9 +149,14 @@ def main(argv = None):
         print_call()
         sys.exit()
 
+    ## index the raw files, reading each new file's header once (in parallel); each conversion
+    ## gets its exact list of file numbers, so the files don't need to be checked again. With
+    ## -r, the index is kept in outputdir for the next run (never in inputdir).
+    raw_index = gemlog.RawIndex(inputdir, sidecar = gemlog.core._make_raw_index_filename(outputdir) if resume else None)
+    raw_index.scan(num_processes)
+    SN_nums = raw_index.SN_nums()
     if(len(SN_list) == 0): # if user does not provide SN_list, take unique SNs in order
-        SN_list = unique([find_SN(file_list[i]) for i in range(len(file_list))]) # set takes unique values
-        SN_list.sort()
+        SN_list = raw_index.serial_numbers()
     else: # if user provided SNs, keep the order, but take unique values
         SN_list = unique(SN_list)
 
@@ -169,12 +183,59 @@ def main(argv = None):
         logging.info(f'inputdir="{inputdir}"')
         logging.info(f'outputdir="{outputdir}"')
         logging.info(f'serial number list = {SN_list}')
-        logging.info(f'format="{output_format}", length_hours={output_length}, test={test}, parallel={num_processes}')
-
-        ## loop through serial numbers. 'pool' allows running different SNs in parallel.
-        with ProcessPoolExecutor(max_workers=num_processes) as pool:
-            args_list = [[inputdir, SN, outputdir, output_format, output_length] for SN in SN_list]
-            res = pool.map(convert_single_SN, args_list)
+        logging.info(f'format="{output_format}", length_hours={output_length}, test={test}, parallel={num_processes}, resume={resume}, metrics="{metrics_file}", cache={cache}')
+        raw_index.save()
+
+        start_time = time.time()
+        ## loop through serial numbers. With several processes, the SNs are converted at the
+        ## same time (in threads), sharing a pool of processes that read blocks of raw files.
+        ## The SNs with the most data start first, and their blocks are read first.
+        if num_processes <= 1:
+            for SN in SN_list:
+                convert_single_SN([inputdir, SN, outputdir, output_format, output_length, resume, None, SN_nums.get(SN, np.nan), raw_index, metrics_file, cache])
+        else:
+            SN_size = {SN: sum(raw_index.record(os.path.basename(file))['size'] for file in raw_index.files(SN, min_size = 0)) for SN in SN_list}
+            SN_order = sorted(SN_list, key = lambda SN: -SN_size[SN])
+            with gemlog.core.BlockScheduler(num_processes) as scheduler:
+                with ThreadPoolExecutor(max_workers = num_processes) as pool:
+                    args_list = [[inputdir, SN, outputdir, output_format, output_length, resume, scheduler, SN_nums.get(SN, np.nan), raw_index, metrics_file, cache] for SN in SN_order]
+                    res = list(pool.map(convert_single_SN, args_list))
+                report_utilization(scheduler)
+        if metrics_file is not None:
+            report_metrics(metrics_file, start_time)
+
+def report_metrics(metrics_file, start_time):
+    ## print and log a summary of the metrics of the conversions since start_time
+    try:
+        with open(metrics_file, 'r') as f:
+            events = [json.loads(line) for line in f]
+    except Exception as e:
+        print(f'Could not read metrics file {metrics_file}: {e}')
+        return
+    done = [e for e in events if (e['event'] == 'done') and (e['time'] >= start_time)]
+    if len(done) == 0:
+        return
+    summary = pd.DataFrame([{'SN': e['SN'], 'files': e['files'], 'MB': e['bytes'] / 1e6,
+                             'seconds': e['seconds'], 'MB_per_s': e['bytes_per_second'] / 1e6,
+                             'Msamples_per_s': e['samples_per_second'] / 1e6,
+                             'max_block_rss_MB': e['max_rss_mb'],
+                             'process_peak_rss_MB': e['process_peak_rss_mb']} for e in done])
+    stages = pd.DataFrame([e['stage_seconds'] for e in done]).sum()
+    print('Conversion metrics (details in ' + metrics_file + '):')
+    print(summary.to_string(index = False, float_format = lambda x: f'{x:.2f}'))
+    print('Total seconds per stage: ' + ', '.join(f'{stage} {seconds:.1f}' for stage, seconds in stages.items()))
+    logging.info('Conversion metrics:\n' + summary.to_string(index = False))
+    logging.info('Total seconds per stage: ' + stages.to_json())
+
+def report_utilization(scheduler):
+    ## print and log how busy each worker process was
+    u = scheduler.utilization()
+    print('Worker utilization:')
+    print(u.to_string(index = False, float_format = lambda x: f'{x:.2f}'))
+    logging.info('Worker utilization:\n' + u.to_string(index = False))
+    mean = u.utilization.sum() / scheduler.num_processes # processes that never ran count as idle
+    print(f'Mean utilization of {scheduler.num_processes} processes: {mean:.2f}')
+    logging.info(f'Mean utilization of {scheduler.num_processes} processes: {mean:.2f}')
 
 if __name__ == "__main__":
    main(sys.argv[1:])
@@ -2,9 +2,8 @@
 import sys # should always be available, doesn't need to be in "try"
 try:
     import numpy as np
-    import os, getopt, logging, platform
+    import os, getopt, logging, platform, glob, time
     import gemlog
-    from concurrent.futures import ProcessPoolExecutor
 except Exception as e:
     print('Either dependencies are missing, or the environment is not active')
     print('Error message:')
@@ -12,23 +11,42 @@ except Exception as e:
     sys.exit(2)
 
 def print_call():
-    print('gemconvert_single -i <input_file> -o <outputdir> -g <gps_required>')
-    print('-i --input_file')
-    print('-o --output_file: default ./<input_file>.mseed')
+    print('gemconvert_single -i <input_file> -o <output_file> -f')
+    print('gemconvert_single -i <input_file_or_pattern> [-i ...] [more input files] -d <outputdir> -p <number_of_processes> -s <summary_file> -f')
+    print('-i --input_file: raw file to convert; may be given several times, and may be a pattern')
+    print('   like "raw/FILE*" (quoted). Input files may also be listed after the options.')
+    print('-o --output_file: default ./<input_file>.mseed; only used with a single input file')
+    print('-d --outputdir: directory for converted files (named <input_file>.mseed); default .')
+    print('-p --parallel: number of files to convert in parallel processes; default 1')
+    print('-s --summary_file: if used, write the table of results for each file to this csv file')
     print('-f --force-conversion: convert file even if it doesn\'t have enough GPS points for')
     print('accurate sample timing. Results will NOT be suitable for array processing')
     print('-h --help: print this message')
     print('Problems: check/raise issues at https://github.com/ajakef/gemlog/issues/')
     print('gemlog version: ' + gemlog.__version__)
 
+def find_input_files(patterns):
+    ## expand input file patterns (for shells that don't, or quoted patterns), keeping the
+    ## given order and dropping repeats
+    input_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if len(matches) == 0:
+            print(f'No files match {pattern}')
+        input_files += [fn for fn in matches if fn not in input_files]
+    return input_files
+
 def main(argv = None):
     if argv is None:
         argv = sys.argv[1:]
-    input_file = ''
+    input_patterns = []
     output_file = None
+    outputdir = '.'
+    num_processes = 1
+    summary_file = None
     force_conversion = False
     try:
-        opts, args = getopt.getopt(argv,"hfi:o:")
+        opts, args = getopt.gnu_getopt(argv,"hfi:o:d:p:s:")
     except getopt.GetoptError:
         print_call()
         sys.exit(2)
@@ -39,24 +57,65 @@ def main(argv = None):
             print_call()
             sys.exit()
         elif opt in ("-i", "--input_file"):
-            input_file = arg
+            input_patterns.append(arg)
         elif opt in ("-o", "--output_file"):
             output_file = arg
+        elif opt in ("-d", "--outputdir"):
+            outputdir = arg
+        elif opt in ("-p", "--parallel"):
+            num_processes = int(arg)
+        elif opt in ("-s", "--summary_file"):
+            summary_file = arg
         elif opt in ("-f", "--force_conversion"):
             force_conversion = True
+    input_files = find_input_files(input_patterns + args)
 
     print(f'gemlog version {gemlog.__version__}')
-    print('input_file ', input_file)
+    if len(input_files) == 1:
+        print('input_file ', input_files[0])
+    else:
+        print(f'{len(input_files)} input files')
+    if (output_file is not None) and (len(input_files) > 1):
+        print('-o can only be used with a single input file; use -d to set the output directory')
+        sys.exit(2)
     if force_conversion:
         print(' ')
         print('WARNING: Forcing conversion, even if the file doesn\'t have enough GPS data for')
         print('accurate sample timing. Do not use the resulting data for array processing or')
         print('anything else that requires accurate times.')
         print(' ')
-    try:
-        gemlog.core._convert_one_file(input_file, output_filename = output_file, require_gps = not force_conversion)
-    except Exception as e:
-        print(e)
+    if len(input_files) == 0:
+        print('No input files')
+        sys.exit(2)
+    if len(input_files) == 1:
+        ## single file: same behavior as always, with errors printed rather than tabulated
+        if output_file is None:
+            os.makedirs(outputdir, exist_ok = True)
+            output_file = os.path.join(outputdir, os.path.basename(input_files[0]) + '.mseed')
+        try:
+            gemlog.core._convert_one_file(input_files[0], output_filename = output_file, require_gps = not force_conversion)
+        except Exception as e:
+            print(e)
+        return
+
+    start_time = time.time()
+    summary = gemlog.convert_files(input_files, outputdir = outputdir, require_gps = not force_conversion,
+                                   num_processes = num_processes)
+    report_summary(summary, time.time() - start_time, summary_file)
+
+def report_summary(summary, seconds, summary_file = None):
+    ## print a table of the files that failed and the overall results
+    failed = summary[summary.status == 'failed']
+    if failed.shape[0] > 0:
+        print('Failed files:')
+        print(failed[['input', 'seconds', 'error']].to_string(index = False, float_format = lambda x: f'{x:.2f}'))
+    totals = summary.groupby('status').agg(files = ('input', 'size'), samples = ('samples', 'sum'),
+                                           seconds = ('seconds', 'sum'), max_seconds = ('seconds', 'max'))
+    print(totals.to_string(float_format = lambda x: f'{x:.2f}'))
+    print(f'{summary.shape[0]} files in {seconds:.1f} s: {np.sum(summary.status == "converted")} converted, {failed.shape[0]} failed')
+    if summary_file is not None:
+        summary.to_csv(summary_file, index = False)
+        print('Results for each file written to ' + summary_file)
 
 if __name__ == "__main__":
    main(sys.argv[1:])
@@ -1,11 +1,9 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import obspy, glob, gemlog, os
-import scipy.integrate
-import scipy.interpolate
 #from gemlog import *
 def PlotAmp(DB):
+    import matplotlib.pyplot as plt
     allSta = DB.station.unique()
     allSta.sort()
     for sta in DB.station.unique():
@@ -312,6 +310,7 @@ def ims_noise(model = 'low', freq = None, spectype = 'power', freq_min = None, f
 def _noise_spectrum_helper(freq_in, power_in, freq_out, spectype, freq_min, freq_max):
     if freq_out is None:
         freq_out = freq_in
+    import scipy.integrate, scipy.interpolate
     spec_function = scipy.interpolate.CubicSpline(freq_in, power_in, extrapolate = False)
     power = spec_function(freq_out)
     if (freq_min is not None) and (freq_max is not None):
@@ -343,6 +342,7 @@ def _noise_spectrum_helper(freq_in, power_in, freq_out, spectype, freq_min, freq
 def _interpolate_stream(st, gap_limit_sec = 0.1):
     ## look for short data gaps and interpolate through them
     ## st must consist of data from just a single station
+    import scipy.interpolate
     st.merge()
     st = st.split()
 
@@ -1,9 +1,6 @@
 #/usr/bin/env python
 import pandas as pd
 import numpy as np
-import scipy.signal
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import os, glob, getopt, sys, shutil
 import obspy, gemlog
 import time
@@ -12,8 +9,7 @@ from gemlog.gemlog_aux import check_lags
 from gemlog.gemlog_aux import _interpolate_stream
 from io import StringIO 
 import pdb
-from fpdf import FPDF
-from matplotlib.backends.backend_pdf import PdfPages
+## matplotlib and fpdf are imported when a huddle test is verified, not when gemlog is imported
 
 fifo_soft_limit = 5
 fifo_hard_limit = 50
@@ -68,7 +64,8 @@ def unique(list1):
 
 cell_width = 16
 cell_height = 10
-class PDF(FPDF):
+class _ReportPages:
+    ## report layout, mixed into fpdf.FPDF by _make_pdf
     def footer(self):
         # Position at 1.5 cm from bottom
         self.set_y(-15)
@@ -136,6 +133,12 @@ class PDF(FPDF):
                 self.cell(cell_width, 5, '%s' % status_header[i][j]) # cell width, height
             self.ln() 
             
+def _make_pdf():
+    from fpdf import FPDF
+    class PDF(_ReportPages, FPDF):
+        pass
+    return PDF()
+
 def verify_huddle_test(path, SN_list = [], SN_to_exclude = [], individual_only = False, run_crosscorrelation_checks = False, generate_report = True):
     """Perform a battery of tests on converted data from a huddle test to ensure that no Gems are
     obviously malfunctioning. 
@@ -174,6 +177,8 @@ def verify_huddle_test(path, SN_list = [], SN_to_exclude = [], individual_only =
     --stats: data frame showing quantitative results for all tests
     --results: data frame showing qualitative results for all tests
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
     #%%
     if False: ## set default input values in development; set to True if running the code line-by-line
         if os.getlogin() == 'jake':
@@ -771,7 +776,7 @@ def verify_huddle_test(path, SN_list = [], SN_to_exclude = [], individual_only =
         report_date = datetime.datetime.today()
         report_date = report_date.strftime("%Y-%m-%d")
         filename = str("Huddle_test_output_" + report_date)
-        pdf = PDF()
+        pdf = _make_pdf()
         landscape = True
         if landscape:
             pdf.add_page(orientation = 'L')
@@ -2,8 +2,165 @@
 Cython-based file parsers.
 """
 
+import os
+import mmap
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+cimport cython
 from libc.stdio cimport fopen, fclose, fgets, FILE, sscanf
+from libc.string cimport memset, memcpy, memchr
+from libc.math cimport floor, fmod, copysign
+
+
+cdef struct _ParseState:
+    # values persist between lines, as in the original single-loop parser:
+    # fields that sscanf fails to match keep their previous values
+    char eof
+    double prev_dD_millis
+    # D outputs: the value stored in the data column and the sample millis
+    double D_value, D_millis
+    # D placeholders
+    int ADC
+    double DmsSamp
+    # G placeholders
+    int yr, mo, day, hr, mn
+    double msPPS, msLag, sec, lat, lon
+    # M placeholders
+    int maxLag, minFree, maxUsed, maxOver
+    int gpsFlag, freeStack1, freeStackIdle
+    double ms, batt, temp, A2, A3
+
+
+def _initial_row_count(filename, bytes_per_row = 8):
+    # Estimate the number of parsed rows from the file size. Format 0.91 data
+    # lines ("D2067,0") are the longest common case at ~8 bytes per row, so
+    # this rarely over-allocates; compact formats (1.10, ~4 bytes per row)
+    # need one or two doublings.
+    try:
+        file_size = os.path.getsize(filename)
+    except OSError:
+        file_size = 0
+    return file_size // bytes_per_row + 64
+
+
+cdef inline void _finish_D_line(_ParseState* st, int n_matched) noexcept nogil:
+    if n_matched == 1: # failed to read the 2-element format, try just 1 element
+        st.D_value = st.DmsSamp
+        st.DmsSamp = (st.prev_dD_millis + 10) % (2**13)
+    else: # n_matched == 2
+        st.D_value = st.ADC
+    st.D_millis = st.DmsSamp
+    st.prev_dD_millis = st.DmsSamp
+
+
+cdef char _parse_line(char* line, _ParseState* st) noexcept nogil:
+    # Parse one line into the parser state. Returns the line type (ord('D'),
+    # ord('G'), or ord('M')), or 0 if the line should be skipped. Compact
+    # (lowercase) data lines are reported as 'D'.
+    cdef char line_type = line[0]
+    cdef int n_matched = 0
+    cdef double current_dD_millis = 0
+
+    if (line_type >= 97) and (line_type <= 122): # ord('a'), ord('z')
+        if (line[1] < 97) or(line[1] > 122):
+            st.D_value = line[0] - 109 # diff_ADC
+            current_dD_millis = (st.prev_dD_millis + 10) % (2**13)
+        else:
+            current_dD_millis = (st.prev_dD_millis + 10 + line[0] - 109) % (2**13) # diff_millis
+            st.D_value = line[1] - 109 # diff_ADC
+        st.prev_dD_millis = current_dD_millis
+        st.D_millis = current_dD_millis
+        return 68 # ord('D')
+
+    elif line_type == 68:  # ord('D') == 68
+        # DmsSamp,ADC
+        # D7780,-1
+        n_matched = sscanf(line + 1, "%lf,%d", &st.DmsSamp, &st.ADC)
+        _finish_D_line(st, n_matched)
+        return line_type
+
+    elif line_type == 71:  # ord('G') == 71
+        # G,msPPS,msLag,yr,mo,day,hr,min,sec,lat,lon
+        # G,8171,70,2020,6,20,5,21,22.0,43.62226,-116.20594
+        n_matched = sscanf(line + 2,
+                           "%lf,%lf,%d,%d,%d,%d,%d,%lf,%lf,%lf",
+                           &st.msPPS, &st.msLag, &st.yr, &st.mo, &st.day,
+                           &st.hr, &st.mn, &st.sec, &st.lat, &st.lon)
+        return line_type
+
+    elif line_type == 77:  # ord('M') == 77
+        # M,ms,batt(V),temp(C),A2,A3,maxLag,minFree,maxUsed,maxOver,
+        # gpsFlag,freeStack1,freeStackIdle
+        # M,8001,3.02,22.1,1.412,2.052,94,66,9,0,0,57,86
+        n_matched = sscanf(line + 2,
+                           "%lf,%lf,%lf,%lf,%lf,%d,%d,%d,%d,%d,%d,%d",
+                           &st.ms, &st.batt, &st.temp, &st.A2, &st.A3,
+                           &st.maxLag, &st.minFree, &st.maxUsed,
+                           &st.maxOver, &st.gpsFlag, &st.freeStack1,
+                           &st.freeStackIdle)
+        return line_type
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _parse_lines(FILE* cfile, double[:, :] view, char[:] type_view,
+                             double[:] millis_view, Py_ssize_t line_number,
+                             _ParseState* st):
+    # Parse lines into the output buffers starting at row line_number. Returns
+    # the new row count; stops early (without setting st.eof) if the buffers
+    # are full so the caller can grow them and call again. The loop runs
+    # without the GIL so several files can be parsed in parallel threads.
+    cdef char line[256]
+    cdef char* read
+    cdef char line_type = 0
+    cdef Py_ssize_t n_row = view.shape[0]
+
+    with nogil:
+        # were this python 3.8 we could maybe use the walrus operator.  alas
+        while line_number < n_row:
+            read = fgets(line, sizeof(line), cfile);
+            if read == NULL:
+                # EOF
+                st.eof = 1
+                break
+
+            line_type = _parse_line(line, st)
+            if line_type == 68:  # ord('D') == 68
+                view[line_number, 0] = st.D_value
+                millis_view[line_number] = st.D_millis
+
+            elif line_type == 71:  # ord('G') == 71
+                view[line_number, 0] = st.msLag
+                view[line_number, 1] = st.yr
+                view[line_number, 2] = st.mo
+                view[line_number, 3] = st.day
+                view[line_number, 4] = st.hr
+                view[line_number, 5] = st.mn
+                view[line_number, 6] = st.sec
+                view[line_number, 7] = st.lat
+                view[line_number, 8] = st.lon
+                millis_view[line_number] = st.msPPS
+
+            elif line_type == 77:  # ord('M') == 77
+                view[line_number, 0] = st.batt
+                view[line_number, 1] = st.temp
+                view[line_number, 2] = st.A2
+                view[line_number, 3] = st.A3
+                view[line_number, 4] = st.maxLag
+                view[line_number, 5] = st.minFree
+                view[line_number, 6] = st.maxUsed
+                view[line_number, 7] = st.maxOver
+                view[line_number, 8] = st.gpsFlag
+                view[line_number, 9] = st.freeStack1
+                view[line_number, 10] = st.freeStackIdle
+                millis_view[line_number] = st.ms
+            else:
+                continue
+
+            type_view[line_number] = line_type
+            line_number += 1
+    return line_number
 
 
 def parse_gemfile(filename):
@@ -23,6 +180,12 @@ def parse_gemfile(filename):
         - 2-d array of numeric values read from the file
         - 1-d array of characters indicating the line type
         - 1-d array of the millisecond value of the row
+
+    Note
+    ----
+    Output buffers are sized from the file size and doubled whenever they
+    fill up, then trimmed in place to the number of rows actually read, so
+    memory use scales with the size of the file.
     """
     cdef char* fname = filename
 
@@ -32,121 +195,620 @@ def parse_gemfile(filename):
         msg = "No such file or directory: '{}'".format(filename)
         raise FileNotFoundError(2, msg)
 
-    cdef char line[256]
-    cdef char* read
-    cdef char line_type = 0
-
-    cdef int n_matched = 0
-    # D placeholders
-    cdef int ADC = 0
-    cdef double DmsSamp = 0
-    # G placeholders
-    cdef int yr = 0, mo = 0, day = 0, hr = 0, mn = 0
-    cdef double msPPS = 0, msLag = 0, sec = 0, lat = 0, lon = 0
-    # M placeholders
-    cdef int maxLag = 0, minFree = 0, maxUsed = 0, maxOver = 0
-    cdef int gpsFlag = 0, freeStack1 = 0, freeStackIdle = 0
-    cdef double ms = 0, batt = 0, temp = 0, A2 = 0, A3 = 0
+    cdef _ParseState state
+    memset(&state, 0, sizeof(state))
 
+    n_row = _initial_row_count(filename)
     # array to store parsed data
-    #n_row = 780000  # max number of rows to expect: 750000 + 15000 + 15000
-    n_row = 1560000  # max number of rows to expect: 2*(750000 + 15000 + 15000)
     result_array = np.zeros((n_row, 11), dtype=np.double)
-    # make a view for faster indexing.
-    # see https://cython.readthedocs.io/en/latest/src/userguide/numpy_tutorial.html#efficient-indexing-with-memoryviews
-    cdef double[:, :] view = result_array
-    cdef double prev_dD_millis = 0, current_dD_millis = 0
-
     # 1-D array to store linetype (single chars)
     result_linetypes = np.zeros(n_row, dtype='c')
-    cdef char[:] type_view = result_linetypes
     # 1-D array to store millis.
-    # range is 0 to 2**13, so choose short int
     result_millis = np.zeros(n_row, dtype=np.double)
-    # cdef short[:] millis_view = result_millis
-    cdef double[:] millis_view = result_millis
 
     cdef Py_ssize_t line_number = 0
-    # were this python 3.8 we could maybe use the walrus operator.  alas
+    try:
+        while True:
+            # the arrays are passed as memoryviews for fast indexing; see
+            # https://cython.readthedocs.io/en/latest/src/userguide/numpy_tutorial.html#efficient-indexing-with-memoryviews
+            # The views are released when _parse_lines returns, so the arrays
+            # can be resized in place below.
+            line_number = _parse_lines(cfile, result_array, result_linetypes,
+                                       result_millis, line_number, &state)
+            if state.eof:
+                break
+            n_row *= 2
+            result_array.resize((n_row, 11), refcheck=False)
+            result_linetypes.resize(n_row, refcheck=False)
+            result_millis.resize(n_row, refcheck=False)
+    finally:
+        fclose(cfile)
+
+    # shrinking in place returns the unused tail of the buffers without
+    # copying the rows that were read
+    result_array.resize((line_number, 11), refcheck=False)
+    result_linetypes.resize(line_number, refcheck=False)
+    result_millis.resize(line_number, refcheck=False)
+    return (
+        result_array,
+        result_linetypes,
+        result_millis,
+    )
+
+
+# dtypes of the record arrays returned by parse_gemfile_columns
+GPS_DTYPE = np.dtype([('row', np.int32), ('msPPS', np.float64), ('msLag', np.float64),
+                      ('year', np.int32), ('month', np.int32), ('day', np.int32),
+                      ('hour', np.int32), ('minute', np.int32), ('second', np.float64),
+                      ('lat', np.float64), ('lon', np.float64)])
+METADATA_DTYPE = np.dtype([('row', np.int32), ('millis', np.float64), ('batt', np.float64),
+                           ('temp', np.float64), ('A2', np.float64), ('A3', np.float64),
+                           ('maxWriteTime', np.int32), ('minFifoFree', np.int32),
+                           ('maxFifoUsed', np.int32), ('maxOverruns', np.int32),
+                           ('gpsOnFlag', np.int32), ('unusedStack1', np.int32),
+                           ('unusedStackIdle', np.int32)])
+
+
+cdef inline bint _is_int32(double x) noexcept nogil:
+    # NaN fails both comparisons
+    return (x >= -2147483648.0) and (x <= 2147483647.0) and (x == floor(x))
+
+
+cdef struct _ColumnState:
+    Py_ssize_t pos, n_rows, n_D, n_G, n_M
+    double prev_millis, stair, first_millis
+    char inexact
+    # options for writing final sample times and values (see parse_gembuffer)
+    char fused, aligned, integrated
+    double offset, shift, ADC_sum
+
+
+cdef inline double _floor_mod(double a, double b) noexcept nogil:
+    # a % b with the same result as Python and numpy floats
+    cdef double mod = fmod(a, b)
+    if mod != 0:
+        if (b < 0) != (mod < 0):
+            mod += b
+    else:
+        mod = copysign(0, b)
+    return mod
+
+
+#### Hand-written tokenizer for parsing lines in place in a buffer. It handles
+#### the plain decimal numbers that make up valid files and gives the same
+#### result as sscanf for them; for anything else (inf, nan, hex, very long
+#### numbers, embedded NULs...) the line is re-parsed with sscanf so that the
+#### two parsers always agree.
+
+cdef enum:
+    _TOKEN_OK = 0
+    _TOKEN_UNSURE = 1
+
+cdef double _POW10[23]
+for _i in range(23):
+    _POW10[_i] = 10.0 ** _i
+
+
+cdef inline bint _is_space(char c) noexcept nogil:
+    return (c == 32) or (c >= 9 and c <= 13) # ' ', \t, \n, \v, \f, \r
+
+
+cdef inline bint _is_digit(char c) noexcept nogil:
+    return (c >= 48) and (c <= 57)
+
+
+cdef inline int _scan_double(const char** pp, const char* end, double* out) noexcept nogil:
+    # Equivalent of sscanf's %lf for plain decimal numbers. Uses the exact
+    # fast path (mantissa <= 2**53, power of ten <= 22), where a single
+    # correctly rounded multiplication or division gives the same double as
+    # strtod.
+    cdef const char* p = pp[0]
+    cdef unsigned long long m = 0
+    cdef int n_digits = 0, n_frac = 0, e = 0, exp10 = 0
+    cdef bint neg = 0, neg_exp = 0
+    cdef double value
+    while (p < end) and _is_space(p[0]):
+        p += 1
+    if (p < end) and ((p[0] == 43) or (p[0] == 45)): # '+', '-'
+        neg = (p[0] == 45)
+        p += 1
+    while (p < end) and _is_digit(p[0]):
+        m = m * 10 + (p[0] - 48)
+        n_digits += 1
+        p += 1
+    if (p < end) and (p[0] == 46): # '.'
+        p += 1
+        while (p < end) and _is_digit(p[0]):
+            m = m * 10 + (p[0] - 48)
+            n_digits += 1
+            n_frac += 1
+            p += 1
+    if (n_digits == 0) or (n_digits > 19):
+        return _TOKEN_UNSURE
+    if (p < end) and ((p[0] == 101) or (p[0] == 69)): # 'e', 'E'
+        p += 1
+        if (p < end) and ((p[0] == 43) or (p[0] == 45)):
+            neg_exp = (p[0] == 45)
+            p += 1
+        if not ((p < end) and _is_digit(p[0])):
+            return _TOKEN_UNSURE
+        while (p < end) and _is_digit(p[0]):
+            if e < 1000:
+                e = e * 10 + (p[0] - 48)
+            p += 1
+        exp10 = -e if neg_exp else e
+    if (p < end) and ((p[0] == 46) or (p[0] == 120) or (p[0] == 88)): # '.', 'x', 'X'
+        return _TOKEN_UNSURE
+    exp10 -= n_frac
+    if m > 9007199254740992ULL: # 2**53
+        return _TOKEN_UNSURE
+    value = <double>m
+    if exp10 > 0:
+        if exp10 > 22:
+            return _TOKEN_UNSURE
+        value = value * _POW10[exp10]
+    elif exp10 < 0:
+        if exp10 < -22:
+            return _TOKEN_UNSURE
+        value = value / _POW10[-exp10]
+    out[0] = -value if neg else value
+    pp[0] = p
+    return _TOKEN_OK
+
+
+cdef inline int _scan_int(const char** pp, const char* end, int* out) noexcept nogil:
+    # Equivalent of sscanf's %d for numbers that fit easily in an int
+    cdef const char* p = pp[0]
+    cdef long long value = 0
+    cdef int n_digits = 0
+    cdef bint neg = 0
+    while (p < end) and _is_space(p[0]):
+        p += 1
+    if (p < end) and ((p[0] == 43) or (p[0] == 45)):
+        neg = (p[0] == 45)
+        p += 1
+    while (p < end) and _is_digit(p[0]):
+        value = value * 10 + (p[0] - 48)
+        n_digits += 1
+        p += 1
+    if (n_digits == 0) or (n_digits > 9):
+        return _TOKEN_UNSURE
+    out[0] = <int>(-value if neg else value)
+    pp[0] = p
+    return _TOKEN_OK
+
+
+cdef inline bint _scan_comma(const char** pp, const char* end) noexcept nogil:
+    if (pp[0] < end) and (pp[0][0] == 44): # ','
+        pp[0] += 1
+        return 1
+    return 0
+
+
+cdef int _scan_fields(const char* p, const char* end, const char* kinds,
+                      double* values) noexcept nogil:
+    # Scan comma-separated fields as described by kinds ('f' for %lf, 'd' for
+    # %d). Returns the number of fields matched, like sscanf, or -1 if the
+    # line needs the sscanf fallback.
+    cdef int n = 0, ivalue = 0
+    while kinds[n] != 0:
+        if (n > 0) and not _scan_comma(&p, end):
+            return n
+        if kinds[n] == 102: # 'f'
+            if _scan_double(&p, end, &values[n]) != _TOKEN_OK:
+                return -1
+        else:
+            if _scan_int(&p, end, &ivalue) != _TOKEN_OK:
+                return -1
+            values[n] = ivalue
+        n += 1
+    return n
+
+
+cdef char _parse_line_copy(const char* line, Py_ssize_t n, _ParseState* st) noexcept nogil:
+    # sscanf fallback: parse a NUL-terminated copy of the line, as fgets would
+    # have provided it
+    cdef char copy[256]
+    memcpy(copy, line, n)
+    copy[n] = 0
+    return _parse_line(copy, st)
+
+
+cdef char _parse_line_fast(const char* line, Py_ssize_t n, _ParseState* st) noexcept nogil:
+    # Same as _parse_line, but for a line of length n (at most 255) that is
+    # not NUL-terminated
+    cdef char line_type = line[0]
+    cdef char second = line[1] if n > 1 else 0
+    cdef double current_dD_millis = 0
+    cdef double values[12]
+    cdef int n_matched
+    cdef const char* end = line + n
+
+    if (line_type >= 97) and (line_type <= 122): # ord('a'), ord('z')
+        if (second < 97) or (second > 122):
+            st.D_value = line_type - 109 # diff_ADC
+            current_dD_millis = (st.prev_dD_millis + 10) % (2**13)
+        else:
+            current_dD_millis = (st.prev_dD_millis + 10 + line_type - 109) % (2**13) # diff_millis
+            st.D_value = second - 109 # diff_ADC
+        st.prev_dD_millis = current_dD_millis
+        st.D_millis = current_dD_millis
+        return 68 # ord('D')
+
+    elif line_type == 68:
+        n_matched = _scan_fields(line + 1, end, b"fd", values)
+        if n_matched < 0:
+            return _parse_line_copy(line, n, st)
+        if n_matched > 0:
+            st.DmsSamp = values[0]
+        if n_matched > 1:
+            st.ADC = <int>values[1]
+        _finish_D_line(st, n_matched)
+        return line_type
+
+    elif line_type == 71:
+        if n < 2:
+            return _parse_line_copy(line, n, st)
+        n_matched = _scan_fields(line + 2, end, b"ffdddddfff", values)
+        if n_matched < 0:
+            return _parse_line_copy(line, n, st)
+        if n_matched > 0: st.msPPS = values[0]
+        if n_matched > 1: st.msLag = values[1]
+        if n_matched > 2: st.yr = <int>values[2]
+        if n_matched > 3: st.mo = <int>values[3]
+        if n_matched > 4: st.day = <int>values[4]
+        if n_matched > 5: st.hr = <int>values[5]
+        if n_matched > 6: st.mn = <int>values[6]
+        if n_matched > 7: st.sec = values[7]
+        if n_matched > 8: st.lat = values[8]
+        if n_matched > 9: st.lon = values[9]
+        return line_type
+
+    elif line_type == 77:
+        if n < 2:
+            return _parse_line_copy(line, n, st)
+        n_matched = _scan_fields(line + 2, end, b"fffffddddddd", values)
+        if n_matched < 0:
+            return _parse_line_copy(line, n, st)
+        if n_matched > 0: st.ms = values[0]
+        if n_matched > 1: st.batt = values[1]
+        if n_matched > 2: st.temp = values[2]
+        if n_matched > 3: st.A2 = values[3]
+        if n_matched > 4: st.A3 = values[4]
+        if n_matched > 5: st.maxLag = <int>values[5]
+        if n_matched > 6: st.minFree = <int>values[6]
+        if n_matched > 7: st.maxUsed = <int>values[7]
+        if n_matched > 8: st.maxOver = <int>values[8]
+        if n_matched > 9: st.gpsFlag = <int>values[9]
+        if n_matched > 10: st.freeStack1 = <int>values[10]
+        if n_matched > 11: st.freeStackIdle = <int>values[11]
+        return line_type
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _parse_buffer_columns(const char* buf, Py_ssize_t size, int[:] D_millis,
+                                int[:] D_ADC, double[:, :] data, double[:, :] G,
+                                double[:, :] M, double rollover, _ParseState* st,
+                                _ColumnState* cs) noexcept:
+    # Parse lines from buf into separate D, G, and M buffers, unwrapping the
+    # millis rollover as we go (the row order across line types is needed for
+    # that). Lines are split the way fgets with a 256-byte buffer would split
+    # them, so results match parse_gemfile. Data samples go to D_millis and
+    # D_ADC, or to data if cs.fused is set (with values integrated if
+    # cs.integrated is set). Stops early (without setting st.eof) when any
+    # output buffer is full. The loop runs without the GIL.
+    cdef const char* line
+    cdef const char* newline
+    cdef Py_ssize_t n
+    cdef char line_type = 0
+    cdef double millis, diff, unwrapped, value
+    cdef Py_ssize_t i
+    cdef Py_ssize_t D_size = data.shape[0] if cs.fused else D_millis.shape[0]
+
+    with nogil:
+        while (cs.n_D < D_size) and (cs.n_G < G.shape[0]) and (cs.n_M < M.shape[0]):
+            if cs.pos >= size:
+                st.eof = 1
+                break
+            line = buf + cs.pos
+            n = min(size - cs.pos, 255)
+            newline = <const char*>memchr(line, 10, n) # '\n'
+            if newline != NULL:
+                n = newline - line + 1
+            cs.pos += n
+
+            line_type = _parse_line_fast(line, n, st)
+            if line_type == 68:
+                millis = st.D_millis
+            elif line_type == 71:
+                millis = st.msPPS
+            elif line_type == 77:
+                millis = st.ms
+            else:
+                continue
+
+            ## unroll the millis rollover sawtooth, exactly as _process_gemlog_data does
+            if cs.n_rows == 0:
+                cs.first_millis = millis
+                if cs.aligned:
+                    ## same alignment to the offset as in _process_gemlog_data
+                    cs.shift = (
+                        (cs.offset - millis)
+                        + _floor_mod(millis - _floor_mod(cs.offset, rollover) + rollover/2, rollover)
+                        - rollover/2
+                    )
+            else:
+                diff = millis - cs.prev_millis
+                if diff < -(rollover/2):
+                    cs.stair += rollover
+                elif diff > (rollover/2):
+                    cs.stair -= rollover
+            cs.prev_millis = millis
+            unwrapped = cs.stair + millis
+
+            if cs.aligned:
+                unwrapped += cs.shift
+
+            if (line_type == 68) and cs.fused:
+                data[cs.n_D, 0] = unwrapped
+                if cs.integrated:
+                    ## the ADC values in the file are differences; integrate them
+                    cs.ADC_sum += st.D_value
+                    data[cs.n_D, 1] = cs.ADC_sum
+                else:
+                    data[cs.n_D, 1] = st.D_value
+                cs.n_D += 1
+            elif line_type == 68:
+                # D values are integers in valid files; flag anything that isn't
+                # so the caller can fall back to a float reader
+                value = st.D_value
+                if _is_int32(unwrapped) and _is_int32(value):
+                    D_millis[cs.n_D] = <int>unwrapped
+                    D_ADC[cs.n_D] = <int>value
+                else:
+                    cs.inexact = 1
+                cs.n_D += 1
+            elif line_type == 71:
+                i = cs.n_G
+                G[i, 0] = cs.n_rows
+                G[i, 1] = unwrapped
+                G[i, 2] = st.msLag
+                G[i, 3] = st.yr
+                G[i, 4] = st.mo
+                G[i, 5] = st.day
+                G[i, 6] = st.hr
+                G[i, 7] = st.mn
+                G[i, 8] = st.sec
+                G[i, 9] = st.lat
+                G[i, 10] = st.lon
+                cs.n_G += 1
+            else:
+                i = cs.n_M
+                M[i, 0] = cs.n_rows
+                M[i, 1] = unwrapped
+                M[i, 2] = st.batt
+                M[i, 3] = st.temp
+                M[i, 4] = st.A2
+                M[i, 5] = st.A3
+                M[i, 6] = st.maxLag
+                M[i, 7] = st.minFree
+                M[i, 8] = st.maxUsed
+                M[i, 9] = st.maxOver
+                M[i, 10] = st.gpsFlag
+                M[i, 11] = st.freeStack1
+                M[i, 12] = st.freeStackIdle
+                cs.n_M += 1
+            cs.n_rows += 1
+
+
+def _to_records(values, dtype):
+    records = np.empty(values.shape[0], dtype=dtype)
+    for i, name in enumerate(dtype.names):
+        records[name] = values[:, i]
+    return records
+
+
+def parse_gembuffer(buffer, rollover = 2**13, offset = None, integrate = False):
+    """
+    Parse the contents of a gem logfile that is already in memory.
+
+    The buffer is parsed in place, without copying it or splitting it into
+    Python strings, so anything that supports the buffer protocol can be
+    parsed directly: bytes, bytearray, numpy uint8 arrays, or mmap objects.
+
+    Parameters
+    ----------
+    buffer : bytes-like object
+        Raw contents of a gem logfile.
+
+    rollover : int, default 2**13
+        Period of the millis counter in the raw file.
+
+    offset : float, default None
+        If given, align the unwrapped millis of all line types to this offset
+        the same way _process_gemlog_data does.
+
+    integrate : bool, default False
+        If True, integrate the data values (cumulative sum), as needed for
+        format 0.9 and later where D lines record differences.
+
+    Returns
+    -------
+    dict, as for parse_gemfile_columns. If offset or integrate is given,
+    'D_millis' and 'D_ADC' are replaced by 'data', a float array whose two
+    columns are the final sample times (msSamp) and values (ADC); the 'shift'
+    added to all millis values is also returned.
+
+    Raises
+    ------
+    ValueError
+        If a data line has a non-integer value or the unwrapped millis do not
+        fit in int32 (only when neither offset nor integrate is given).
+    """
+    cdef const unsigned char[::1] view = memoryview(buffer).cast('B')
+    cdef Py_ssize_t size = view.shape[0]
+    cdef const char* buf = b''
+    if size > 0:
+        buf = <const char*>&view[0]
+
+    cdef _ParseState state
+    memset(&state, 0, sizeof(state))
+    cdef _ColumnState cstate
+    memset(&cstate, 0, sizeof(cstate))
+    cstate.fused = (offset is not None) or integrate
+    cstate.aligned = offset is not None
+    cstate.integrated = integrate
+    if cstate.aligned:
+        cstate.offset = offset
+
+    ## D lines dominate; G and M lines are each at most a few percent of rows
+    n_D = size // 4 + 64
+    n_GM = size // 256 + 64
+    if cstate.fused:
+        data = np.zeros((n_D, 2), dtype=np.double)
+        D_millis = D_ADC = np.zeros(0, dtype=np.int32)
+    else:
+        data = np.zeros((0, 2), dtype=np.double)
+        D_millis = np.zeros(n_D, dtype=np.int32)
+        D_ADC = np.zeros(n_D, dtype=np.int32)
+    G = np.zeros((n_GM, len(GPS_DTYPE)), dtype=np.double)
+    M = np.zeros((n_GM, len(METADATA_DTYPE)), dtype=np.double)
+
     while True:
-        read = fgets(line, sizeof(line), cfile);
-        if read == NULL:
-            # EOF
+        # views are released when _parse_buffer_columns returns, so the
+        # output buffers can be grown in place below
+        _parse_buffer_columns(buf, size, D_millis, D_ADC, data, G, M, rollover,
+                              &state, &cstate)
+        if state.eof:
             break
+        if cstate.fused and (cstate.n_D == data.shape[0]):
+            data.resize((2 * data.shape[0], 2), refcheck=False)
+        elif (not cstate.fused) and (cstate.n_D == D_millis.shape[0]):
+            D_millis.resize(2 * D_millis.shape[0], refcheck=False)
+            D_ADC.resize(2 * D_ADC.shape[0], refcheck=False)
+        if cstate.n_G == G.shape[0]:
+            G.resize((2 * G.shape[0], G.shape[1]), refcheck=False)
+        if cstate.n_M == M.shape[0]:
+            M.resize((2 * M.shape[0], M.shape[1]), refcheck=False)
 
-        line_type = line[0]
-        if (line_type >= 97) and (line_type <= 122): # ord('a'), ord('z')
-            if (line[1] < 97) or(line[1] > 122):
-                view[line_number, 0] = line[0] - 109 # diff_ADC
-                current_dD_millis = (prev_dD_millis + 10) % (2**13)
-            else:
-                current_dD_millis = (prev_dD_millis + 10 + line[0] - 109) % (2**13) # diff_millis
-                view[line_number, 0] = line[1] - 109 # diff_ADC
-            prev_dD_millis = current_dD_millis
-            millis_view[line_number] = current_dD_millis
-            line_type = 68 # ord('D') # because the D line is in an elif block, this is safe and the D line code won't be invoked
-	    
-        elif line_type == 68:  # ord('D') == 68
-            # DmsSamp,ADC
-            # D7780,-1
-            n_matched = sscanf(line + 1, "%lf,%d", &DmsSamp, &ADC)
-            if n_matched == 1: # failed to read the 2-element format, try just 1 element
-                view[line_number, 0] = DmsSamp
-                DmsSamp = (prev_dD_millis + 10) % (2**13)
-            else: # n_matched == 2
-                view[line_number, 0] = ADC
-            millis_view[line_number] = DmsSamp
-            prev_dD_millis = DmsSamp
-
-        elif line_type == 71:  # ord('G') == 71
-            # G,msPPS,msLag,yr,mo,day,hr,min,sec,lat,lon
-            # G,8171,70,2020,6,20,5,21,22.0,43.62226,-116.20594
-            n_matched = sscanf(line + 2,
-                               "%lf,%lf,%d,%d,%d,%d,%d,%lf,%lf,%lf",
-                               &msPPS, &msLag, &yr, &mo, &day, &hr, &mn,
-                               &sec, &lat, &lon)
-            view[line_number, 0] = msLag
-            view[line_number, 1] = yr
-            view[line_number, 2] = mo
-            view[line_number, 3] = day
-            view[line_number, 4] = hr
-            view[line_number, 5] = mn
-            view[line_number, 6] = sec
-            view[line_number, 7] = lat
-            view[line_number, 8] = lon
-            millis_view[line_number] = msPPS
-
-        elif line_type == 77:  # ord('M') == 77
-            # M,ms,batt(V),temp(C),A2,A3,maxLag,minFree,maxUsed,maxOver,
-            # gpsFlag,freeStack1,freeStackIdle
-            # M,8001,3.02,22.1,1.412,2.052,94,66,9,0,0,57,86
-            n_matched = sscanf(line + 2,
-                               "%lf,%lf,%lf,%lf,%lf,%d,%d,%d,%d,%d,%d,%d",
-                               &ms, &batt, &temp, &A2, &A3, &maxLag,
-                               &minFree, &maxUsed, &maxOver, &gpsFlag,
-                               &freeStack1, &freeStackIdle)
-            view[line_number, 0] = batt
-            view[line_number, 1] = temp
-            view[line_number, 2] = A2
-            view[line_number, 3] = A3
-            view[line_number, 4] = maxLag
-            view[line_number, 5] = minFree
-            view[line_number, 6] = maxUsed
-            view[line_number, 7] = maxOver
-            view[line_number, 8] = gpsFlag
-            view[line_number, 9] = freeStack1
-            view[line_number, 10] = freeStackIdle
-            millis_view[line_number] = ms
-        else:
-            continue
+    if cstate.inexact:
+        raise ValueError('data values cannot be stored as int32')
 
-        type_view[line_number] = line_type
-        line_number += 1
+    output = {
+        'G': _to_records(G[:cstate.n_G], GPS_DTYPE),
+        'M': _to_records(M[:cstate.n_M], METADATA_DTYPE),
+        'first_millis': cstate.first_millis,
+        'num_rows': cstate.n_rows,
+    }
+    if cstate.fused:
+        data.resize((cstate.n_D, 2), refcheck=False)
+        output['data'] = data
+        output['shift'] = cstate.shift
+    else:
+        D_millis.resize(cstate.n_D, refcheck=False)
+        D_ADC.resize(cstate.n_D, refcheck=False)
+        output['D_millis'] = D_millis
+        output['D_ADC'] = D_ADC
+    return output
 
-    fclose(cfile)
 
-    return (
-        result_array[:line_number, :],
-        result_linetypes[:line_number],
-        result_millis[:line_number],
-    )
+def parse_gemfile_columns(filename, rollover = 2**13, offset = None, integrate = False):
+    """
+    Cythonized gem logfile parser with separate outputs for each line type.
+
+    Unlike parse_gemfile, which packs every row into one wide float matrix,
+    this writes data samples into compact integer arrays and GPS and
+    metadata lines into their own record arrays. The millis rollover is
+    unwrapped while reading, because the row order across line types is
+    lost once they are separated.
+
+    The file is memory-mapped and parsed in place by parse_gembuffer.
+
+    Parameters
+    ----------
+    filename : bytes
+        The filename to parse. Must be of type `bytes` -- use
+        filename.encode('utf-8') if needed.
+
+    rollover : int, default 2**13
+        Period of the millis counter in the raw file.
+
+    offset, integrate
+        Options for returning final sample times and values; see
+        parse_gembuffer.
+
+    Returns
+    -------
+    dict with keys:
+
+        - D_millis : int32 array, unwrapped millis of each data sample
+        - D_ADC : int32 array, data values as written in the file
+        - G : record array of GPS lines (dtype GPS_DTYPE)
+        - M : record array of metadata lines (dtype METADATA_DTYPE)
+        - first_millis : float, raw millis of the first parsed row
+        - num_rows : int, total number of D, G, and M rows
+
+    The 'row' field of G and M gives each line's position among all parsed
+    rows, matching the row index of parse_gemfile's output.
+
+    Raises
+    ------
+    ValueError
+        If a data line has a non-integer value or the unwrapped millis do not
+        fit in int32. Use parse_gemfile for such files.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            ## empty files can't be mapped
+            return parse_gembuffer(b'', rollover, offset, integrate)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            try:
+                return parse_gembuffer(buffer, rollover, offset, integrate)
+            except ValueError:
+                raise ValueError(f'{filename}: data values cannot be stored as int32')
+
+
+def parse_gemfiles(filenames, n_threads = None, **kwargs):
+    """
+    Parse several gem logfiles at once in a pool of threads.
+
+    parse_gemfile_columns does its parsing without holding the GIL, so
+    threads can read several files in parallel without the cost of
+    sending the results between processes.
+
+    Parameters
+    ----------
+    filenames : list of bytes
+        Filenames to parse. Each must be of type `bytes` -- use
+        filename.encode('utf-8') if needed.
+
+    n_threads : int, default None
+        Number of threads. By default, one per file, up to the number of
+        CPUs.
+
+    **kwargs
+        Other options passed to parse_gemfile_columns.
+
+    Returns
+    -------
+    list with one entry per file in filenames: the output of
+    parse_gemfile_columns, or the exception raised while parsing that file
+    so that errors can be handled file by file.
+    """
+    filenames = list(filenames)
+    if n_threads is None:
+        n_threads = min(len(filenames), os.cpu_count() or 1)
+    n_threads = max(1, n_threads)
+
+    def parse(filename):
+        try:
+            return parse_gemfile_columns(filename, **kwargs)
+        except Exception as e:
+            return e
+
+    if n_threads == 1:
+        return [parse(filename) for filename in filenames]
+    with ThreadPoolExecutor(max_workers = n_threads) as pool:
+        return list(pool.map(parse, filenames))
@@ -0,0 +1,90 @@
+"""
+Cython-based Steim-1 encoder for writing miniSEED records.
+"""
+
+cimport cython
+from libc.stdint cimport int32_t, uint32_t
+from libc.string cimport memset
+
+
+cdef inline bint _fits8(int32_t d) noexcept nogil:
+    return (<uint32_t>d + 128u) < 256u
+
+
+cdef inline bint _fits16(int32_t d) noexcept nogil:
+    return (<uint32_t>d + 32768u) < 65536u
+
+
+cdef inline int32_t _diff(const int32_t *x, Py_ssize_t j, Py_ssize_t start, int32_t d0) noexcept nogil:
+    # difference ending at sample j, wrapped to 32 bits
+    if j == start:
+        return d0
+    return <int32_t>(<uint32_t>x[j] - <uint32_t>x[j - 1])
+
+
+cdef inline void _put_word(unsigned char *p, uint32_t word) noexcept nogil:
+    # big-endian, the byte order used for gemlog's miniSEED files
+    p[0] = (word >> 24) & 0xff
+    p[1] = (word >> 16) & 0xff
+    p[2] = (word >> 8) & 0xff
+    p[3] = word & 0xff
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def encode_steim1(const int32_t[::1] data, Py_ssize_t start, int32_t d0, unsigned char[::1] out):
+    """
+    Steim-1 encode data[start:] into the 64-byte frames of 'out' (big-endian), until
+    the frames are full or the data run out, and return the number of samples encoded.
+
+    d0 is the first difference: data[start] minus the preceding sample, or 0 for the
+    first record of a trace. Differences are packed greedily (four 8-bit, else two
+    16-bit, else one 32-bit difference per word) as libmseed does, so the frames are
+    identical to those written by obspy. Unused frames are set to zero.
+    """
+    cdef Py_ssize_t n = data.shape[0]
+    cdef Py_ssize_t nframes = out.shape[0] // 64
+    cdef Py_ssize_t pos = start # index of the first sample not yet packed
+    cdef Py_ssize_t frame, w, first_word
+    cdef const int32_t *x = &data[0]
+    cdef int32_t a, b
+    cdef uint32_t control, word
+    cdef unsigned char *frame_ptr
+    if (start < 0) or (start >= n):
+        return 0
+    with nogil:
+        memset(&out[0], 0, out.shape[0])
+        for frame in range(nframes):
+            if pos >= n:
+                break
+            frame_ptr = &out[frame * 64]
+            control = 0
+            if frame == 0: # the first frame holds X0 and Xn (set at the end)
+                _put_word(frame_ptr + 4, <uint32_t>x[start])
+                first_word = 3
+            else:
+                first_word = 1
+            for w in range(first_word, 16):
+                if pos >= n:
+                    break
+                a = _diff(x, pos, start, d0)
+                b = _diff(x, pos + 1, start, d0) if n - pos >= 2 else 0
+                if (n - pos >= 4) and _fits8(a) and _fits8(b) and \
+                   _fits8(_diff(x, pos + 2, start, d0)) and _fits8(_diff(x, pos + 3, start, d0)):
+                    word = ((<uint32_t>a & 0xff) << 24) | ((<uint32_t>b & 0xff) << 16) | \
+                        ((<uint32_t>_diff(x, pos + 2, start, d0) & 0xff) << 8) | \
+                        (<uint32_t>_diff(x, pos + 3, start, d0) & 0xff)
+                    control |= (<uint32_t>1) << (30 - 2 * w)
+                    pos += 4
+                elif (n - pos >= 2) and _fits16(a) and _fits16(b):
+                    word = ((<uint32_t>a & 0xffff) << 16) | (<uint32_t>b & 0xffff)
+                    control |= (<uint32_t>2) << (30 - 2 * w)
+                    pos += 2
+                else:
+                    word = <uint32_t>a
+                    control |= (<uint32_t>3) << (30 - 2 * w)
+                    pos += 1
+                _put_word(frame_ptr + 4 * w, word)
+            _put_word(frame_ptr, control)
+        _put_word(&out[8], <uint32_t>x[pos - 1]) # Xn, the last sample in the record
+    return pos - start
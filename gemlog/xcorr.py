@@ -1,11 +1,9 @@
-from obspy.signal.cross_correlation import correlate, xcorr_max
 import obspy
 import numpy as np
 import pandas as pd
 import glob, os, traceback, sys, getopt, argparse, re
 from gemlog.gem_network import _unique
 import gemlog
-import scipy.interpolate
 
 def xcorr_all_terminal(input = sys.argv[1:]):
     examples_text = f'''
@@ -331,6 +329,7 @@ def xcorr_one_day(st, args = {}):
     return pd.DataFrame.from_dict(output)
 
 def xcorr_function(st, args):
+    from obspy.signal.cross_correlation import correlate, xcorr_max
     maxshift_seconds = args.get('maxshift_seconds')
     if maxshift_seconds is None:
         maxshift_seconds = 1
@@ -525,6 +524,7 @@ def get_coordinates(x, y = None):
 
 
 def upsample_stream(st, N):
+    import scipy.interpolate
     for tr in st:
         t_in = np.arange(tr.stats.npts)
         t_out = np.arange(N * (tr.stats.npts - 1)) / N
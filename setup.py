@@ -121,7 +121,8 @@ setup(name=DISTNAME,
       install_requires=INSTALL_REQUIRES,
       extras_require=EXTRAS_REQUIRE,
       tests_require=TESTS_REQUIRE,
-      ext_modules=[Extension('gemlog.parsers', sources=['gemlog/parsers.pyx'])],
+      ext_modules=[Extension('gemlog.parsers', sources=['gemlog/parsers.pyx']),
+                   Extension('gemlog.steim', sources=['gemlog/steim.pyx'])],
       description=DESCRIPTION,
       long_description=LONG_DESCRIPTION,
       author=AUTHOR,
@@ -9,6 +9,8 @@ from obspy.clients.nrl import NRL
 import sys
 import os
 import shutil
+import json
+import pandas as pd
 
 def setup_module():
     try:
@@ -23,8 +25,160 @@ def teardown_module():
     os.chdir('..')
     shutil.rmtree('tmp')
 
+@pytest.fixture(scope = 'module')
+def raw_v110(tmp_path_factory):
+    ## a copy of the v1.10 raw files to convert, so that the tests can't write into the repository
+    path = tmp_path_factory.mktemp('raw') / 'v1.10'
+    shutil.copytree(os.path.join(os.path.dirname(__file__), '..', 'data', 'v1.10'), path)
+    return str(path)
+
+def read_outputs(suffix):
+    ## contents of the files written by a conversion into mseed_<suffix>, metadata_<suffix>, and
+    ## gps_<suffix>, by directory/file name (skipping hidden entries like the resume manifest)
+    output = {}
+    for dirname in ['mseed', 'metadata', 'gps']:
+        for fn in sorted(os.listdir(f'{dirname}_{suffix}')):
+            if not fn.startswith('.'):
+                with open(f'{dirname}_{suffix}/{fn}', 'rb') as f:
+                    output[dirname + '/' + fn] = f.read()
+    return output
+
 ## test a large block of files so that the loop in gemconvert is definitely covered by tests
-def test_gemconvert_v110():
-    gemlog.convert(rawpath='../data/v1.10/', convertedpath = 'mseed', SN= '232')
+def test_gemconvert_v110(raw_v110):
+    gemlog.convert(rawpath=raw_v110, convertedpath = 'mseed', SN= '232')
     st = obspy.read('mseed/*232..HDF.mseed')
     assert len(st) == 4
+
+## reading blocks of raw files in parallel must give exactly the same output as reading them serially
+def test_convert_parallel_blocks(raw_v110):
+    output = {}
+    with gemlog.core.BlockScheduler(2) as scheduler:
+        for name, kwargs in [('1', {'num_processes': 1}), ('2', {'num_processes': 2}), ('scheduler', {'scheduler': scheduler})]:
+            gemlog.convert(rawpath=raw_v110, convertedpath = f'mseed_{name}', metadatapath = f'metadata_{name}',
+                           gpspath = f'gps_{name}', SN = '210', file_length_hour = 1, blockdays = 1/12, **kwargs)
+            output[name] = read_outputs(name)
+        utilization = scheduler.utilization()
+    assert len(output['1']) > 2
+    assert output['1'] == output['2']
+    assert output['1'] == output['scheduler']
+    assert '.gemlog' not in os.listdir(raw_v110) # nothing is written into the raw directory
+    assert utilization.blocks.sum() > 0
+    assert all((utilization.utilization > 0) & (utilization.utilization <= 1))
+
+## metrics: one event per block and output file, and totals at the end
+def test_convert_metrics(raw_v110):
+    events = []
+    gemlog.convert(rawpath=raw_v110, convertedpath = 'mseed_metrics', SN = '210', file_length_hour = 1,
+                   blockdays = 1/12, metrics = events.append)
+    blocks = [e for e in events if e['event'] == 'block']
+    writes = [e for e in events if e['event'] == 'write']
+    assert [e['event'] for e in events].count('done') == 1
+    done = events[-1]
+    assert done['event'] == 'done'
+    assert len(blocks) == done['blocks'] == 2
+    assert done['files_written'] == len(writes) == len(os.listdir('mseed_metrics')) # no manifest without resume
+    assert done['samples'] == sum(e['samples'] for e in blocks) > 0
+    assert set(done['stage_seconds']) == {'parse', 'drift', 'breaks', 'interp', 'write'}
+    ## memory: each block's current RSS, and the cumulative peak of the process
+    if sys.platform.startswith('linux'):
+        assert all((e['rss_mb'] > 0) and (e['process_peak_rss_mb'] > 0) for e in blocks)
+        assert done['max_rss_mb'] == max(e['rss_mb'] for e in blocks)
+    ## the same events can be written to a JSON-lines file
+    gemlog.convert(rawpath=raw_v110, convertedpath = 'mseed_metrics_file', SN = '210', file_length_hour = 1,
+                   blockdays = 1/12, metrics = 'metrics.jsonl')
+    with open('metrics.jsonl') as f:
+        assert sorted(json.loads(line)['event'] for line in f) == sorted(e['event'] for e in events)
+
+## resuming after more raw data are added must give the same output as converting everything at once
+def test_convert_resume():
+    os.makedirs('raw_resume')
+    with open('../data/v1.10/FILE0000.210', 'rb') as f:
+        file0 = f.read()
+    with open('../data/v1.10/FILE0001.210', 'rb') as f:
+        file1 = f.read()
+    half1 = b'\n'.join(file1.split(b'\n')[:20000]) + b'\n' # the last file may still be growing
+    output = {}
+    for name, steps in [('all', [file1]), ('resumed', [half1, file1])]:
+        with open('raw_resume/FILE0000.210', 'wb') as f:
+            f.write(file0)
+        for data in steps:
+            with open('raw_resume/FILE0001.210', 'wb') as f:
+                f.write(data)
+            gemlog.convert(rawpath='raw_resume', convertedpath = f'mseed_{name}', metadatapath = f'metadata_{name}',
+                           gpspath = f'gps_{name}', SN = '210', file_length_hour = 1, blockdays = 1/12, resume = True)
+        output[name] = read_outputs(name)
+    ## with nothing new to convert, the conversion stops early but still reports its totals
+    events = []
+    gemlog.convert(rawpath='raw_resume', convertedpath = 'mseed_resumed', metadatapath = 'metadata_resumed',
+                   gpspath = 'gps_resumed', SN = '210', file_length_hour = 1, blockdays = 1/12, resume = True,
+                   metrics = events.append)
+    assert [e['event'] for e in events] == ['done']
+    assert events[0]['files'] == 0
+    assert len(output['all']) > 2
+    assert output['all'] == output['resumed']
+
+## resuming with an explicit subset of file numbers: each conversion records (and later checks) the
+## raw files it converted, not the others in the directory
+def test_convert_resume_nums():
+    os.makedirs('raw_resume_nums')
+    for fn in ['FILE0000.210', 'FILE0001.210']:
+        shutil.copy('../data/v1.10/' + fn, 'raw_resume_nums/' + fn)
+    output = {}
+    for name, steps in [('nums_all', [[0, 1]]), ('nums_resumed', [[0], [0, 1]]), ('nums_last', [[1], [1]])]:
+        for nums in steps:
+            gemlog.convert(rawpath='raw_resume_nums', convertedpath = f'mseed_{name}', metadatapath = f'metadata_{name}',
+                           gpspath = f'gps_{name}', SN = '210', nums = nums, file_length_hour = 1, blockdays = 1/12,
+                           resume = True)
+            with open(f'mseed_{name}/.gemlog/210_convert.json') as f:
+                assert sorted(json.load(f)['raw_files']) == [f'FILE{n:04d}.210' for n in nums]
+        output[name] = read_outputs(name)
+    ## the raw file index is kept with the manifest, not in the raw directory
+    assert os.path.exists('mseed_nums_all/.gemlog/raw_index.json')
+    assert not os.path.exists('raw_resume_nums/.gemlog')
+    assert len(output['nums_all']) > 2
+    assert output['nums_all'] == output['nums_resumed']
+
+## batch conversion of single files: one output per input, failures reported rather than raised,
+## and parallel conversion gives the same files as serial conversion
+def test_convert_files():
+    import gemlog.gemconvert_single
+    input_files = ['../data/v1.10/FILE0000.210', '../data/v1.10/FILE0040.059', '../data/v0.91/FILE0040.059',
+                   '../data/v1.10/FILE9999.210']
+    output = {}
+    for num_processes in [1, 2]:
+        summary = gemlog.convert_files(input_files, outputdir = f'single_{num_processes}', num_processes = num_processes)
+        assert list(summary.input) == input_files
+        assert list(summary.status) == ['converted', 'converted', 'converted', 'failed']
+        assert 'not found' in summary.error[3]
+        assert all(summary.samples[:3] > 0)
+        output[num_processes] = {}
+        for fn in summary.output[:3]:
+            with open(fn, 'rb') as f:
+                output[num_processes][os.path.basename(fn)] = f.read()
+    ## inputs with the same name are told apart by their directories
+    assert sorted(output[1]) == ['FILE0000.210.mseed', 'v0.91_FILE0040.059.mseed', 'v1.10_FILE0040.059.mseed']
+    assert output[1] == output[2]
+    gemlog.core._convert_one_file('../data/v1.10/FILE0000.210', 'single.mseed')
+    with open('single.mseed', 'rb') as f:
+        assert f.read() == output[1]['FILE0000.210.mseed']
+
+    ## command line: patterns and file names, written to an output directory with a summary table
+    gemlog.gemconvert_single.main(['-i', '../data/v1.10/FILE000*', '../data/v0.91/FILE0040.059',
+                                   '-d', 'single_cli', '-p', '2', '-s', 'single_cli.csv'])
+    assert sorted(os.listdir('single_cli')) == ['FILE0000.210.mseed', 'FILE0001.210.mseed', 'FILE0040.059.mseed']
+    assert pd.read_csv('single_cli.csv').status.tolist() == ['converted'] * 3
+
+## conversions that use the parsed-file cache (when it is created and when it is used) must give
+## exactly the same output as conversions that parse the raw files
+def test_convert_cache():
+    os.makedirs('raw_cache')
+    for fn in ['FILE0000.210', 'FILE0001.210']:
+        shutil.copy('../data/v1.10/' + fn, 'raw_cache/' + fn)
+    output = {}
+    for name, cache in [('none', False), ('new', True), ('cached', True)]:
+        gemlog.convert(rawpath='raw_cache', convertedpath = f'mseed_cache_{name}', metadatapath = f'metadata_cache_{name}',
+                       gpspath = f'gps_cache_{name}', SN = '210', file_length_hour = 1, cache = cache)
+        output[name] = read_outputs('cache_' + name)
+    assert sorted(os.listdir('raw_cache/.gemlog/parsed')) == ['FILE0000.210.npz', 'FILE0001.210.npz']
+    assert len(output['none']) > 2
+    assert output['none'] == output['new'] == output['cached']
@@ -0,0 +1,50 @@
+import subprocess, sys, json
+import pytest
+import gemlog
+
+## budget for 'import gemlog' (seconds); the public API is loaded lazily, so this is
+## normally a few milliseconds even on slow machines
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ['matplotlib', 'fpdf', 'scipy.interpolate', 'scipy.io', 'obspy.signal.cross_correlation']
+
+def _run_fresh(code):
+    ## run code in a new interpreter (this one has already imported gemlog) and return its printed JSON
+    result = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True)
+    return json.loads(result.stdout)
+
+def test_import_time_budget():
+    code = 'import time; t0 = time.perf_counter(); import gemlog; print(time.perf_counter() - t0)'
+    seconds = min(_run_fresh(code) for i in range(3))
+    assert seconds < IMPORT_BUDGET
+
+def test_heavy_modules_not_imported():
+    ## the modules used by the command-line converters and gem_make_inventory should not load
+    ## plotting, pdf, or signal-processing dependencies
+    code = ('import sys, json, gemlog, gemlog.gemconvert, gemlog.gemconvert_single, gemlog.gem_network; '
+            'gemlog.convert; gemlog.read_gem; gemlog.summarize_gps; '
+            f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))')
+    assert _run_fresh(code) == []
+    code = 'import sys, json, gemlog; print(json.dumps([m for m in sys.modules if m.startswith("gemlog.") and m != "gemlog.version"]))'
+    assert _run_fresh(code) == []
+
+def test_lazy_public_api():
+    assert set(gemlog.__all__) <= set(dir(gemlog))
+    for name in gemlog.__all__:
+        assert getattr(gemlog, name) is not None
+    assert gemlog.convert is gemlog.core.convert
+    assert callable(gemlog.gem_cat)
+    with pytest.raises(AttributeError):
+        gemlog.not_a_gemlog_function
+
+def test_function_named_like_submodule():
+    ## gem_cat is both a submodule and its main function; importing the submodule must not
+    ## replace the function
+    import gemlog.gem_cat
+    assert callable(gemlog.gem_cat)
+    from gemlog import gem_cat
+    assert callable(gem_cat)
+    code = ('import json, importlib, gemlog.gem_cat, gemlog; from gemlog import gem_cat; '
+            'print(json.dumps([callable(gemlog.gem_cat), callable(gem_cat), '
+            'callable(importlib.import_module("gemlog.gem_cat").main)]))')
+    assert _run_fresh(code) == [True, True, True]
+
@@ -1,9 +1,12 @@
-from gemlog.core import EmptyRawFile, CorruptRawFileNoGPS, CorruptRawFile
+from gemlog.core import EmptyRawFile, CorruptRawFileNoGPS, CorruptRawFile, RawIndex
+from gemlog.parsers import parse_gemfile, parse_gemfile_columns, parse_gemfiles, parse_gembuffer
 from gemlog.core import (
-    _read_0_8_with_pandas, _read_with_pandas, _read_with_cython, read_gem, _read_single, _slow__read_single_v0_9, _process_gemlog_data, _read_SN, _read_format_version, _read_config
+    _read_0_8_with_pandas, _read_with_pandas, _read_with_cython, _read_with_cython_columns, _process_gemlog_columns, read_gem, _read_single, _slow__read_single_v0_9, _process_gemlog_data, _read_SN, _read_format_version, _read_config, _read_raw_header, _gps_epoch_seconds, _apply_fit, _apply_segments, _spline_interp,
+    _read_several, _parsed_cache_valid, _find_breaks,
+    _robust_regress, _calculate_drift
 )
 import numpy as np
-import pytest, shutil, os, obspy
+import pytest, shutil, os, obspy, time, warnings
 
 
 def setup_module():
@@ -38,6 +41,31 @@ def test_read_config():
     _read_config('../data/v0.91/FILE0040.059')
     _read_config('../data/v1.10/FILE0001.210')
 
+def test_read_raw_header():
+    header = _read_raw_header('../data/v1.10/FILE0001.210')
+    assert header['version'] == '1.10'
+    assert header['SN'] == '210'
+    assert header['config'] == {'gps_mode': 1, 'gps_cycle': 15, 'gps_quota': 20,
+                                'adc_range': 0, 'led_shutoff': 0, 'serial_output': 0}
+    assert _read_raw_header('../data/v0.91/FILE0040.059')['SN'] == '059'
+    with pytest.raises(EmptyRawFile):
+        _read_raw_header('../data/FILE0000.000')
+    with pytest.raises(CorruptRawFile):
+        _read_SN('../data/FILE0023.096')
+
+def test_read_raw_header_config_before_SN(tmp_path):
+    ## some firmware writes an extra config line ahead of the S line
+    with open('../data/v1.10/FILE0001.210', 'r') as f:
+        lines = f.read().splitlines()
+    S_index = lines.index('S,210')
+    lines.insert(S_index, 'C,1,15,20,0,0,0')
+    fn = tmp_path / 'FILE0001.210'
+    fn.write_text('\r\n'.join(lines) + '\r\n')
+    header = _read_raw_header(fn)
+    assert header['SN'] == '210'
+    assert header['config']['gps_cycle'] == 15
+    assert _read_SN(fn) == '210'
+
 @pytest.fixture(scope='session')
 def test_read_single_v0_8(inputs):
     # serves as an implicit check that the reference reader doesn't error, but
@@ -122,6 +150,19 @@ def test_file_readers(reader_function, inputs, reference_output):
     assert_gem_results_equal(reference_output, _process_gemlog_data(actual_output))
 
 
+## the columnar cython reader must give the same results as the dataframe-based reader
+@pytest.mark.parametrize('fn', ['../data/v0.91/FILE0040.059', '../data/v1.10/FILE0001.210'])
+def test_read_cython_columns(fn):
+    offset = 5787
+    x = _process_gemlog_data(_read_with_cython(fn), offset)
+    y = _process_gemlog_columns(_read_with_cython_columns(fn), offset)
+    assert_gem_results_equal(x, y)
+    assert list(x['metadata'].columns) == list(y['metadata'].columns)
+    assert list(x['gps'].columns) == list(y['gps'].columns)
+    ## aligning to the offset while parsing must give the same results
+    z = _process_gemlog_columns(_read_with_cython_columns(fn, offset = offset), offset)
+    assert_gem_results_equal(x, z)
+
 # These tests ensure that it raises an exception when reading bad raw
 # files. No need to classify the type of exception; any exception
 # should be interpreted as a bad file.
@@ -167,3 +208,464 @@ def test_read_cython_v1_1_v0_91(): # at this point, only supporting cython reade
     x = _read_with_cython('../data/v0.91/FILE0040.059')
     y = _read_with_cython('../data/v1.10/FILE0040.059')
     assert_gem_results_equal(_process_gemlog_data(x), _process_gemlog_data(y))
+
+## the cython parser sizes its buffers from the file size; compact v1.10 rows are shorter than the
+## initial estimate assumes, so this checks that the buffers grow and are trimmed correctly
+def test_parse_gemfile_buffer_growth():
+    fn = '../data/v1.10/FILE0000.210'
+    values, types, millis = parse_gemfile(fn.encode('utf-8'))
+    with open(fn, 'rb') as f:
+        n = sum(1 for line in f if (line[:1] in [b'D', b'G', b'M']) or (97 <= line[0] <= 122))
+    assert values.shape == (n, 11)
+    assert len(types) == n
+    assert len(millis) == n
+    assert set(types) == {b'D', b'G', b'M'}
+
+## threaded parsing must match sequential parsing, and report errors per file
+def test_parse_gemfiles_threads():
+    fn = [b'../data/v0.91/FILE0040.059', b'../data/FILE9999.999', b'../data/v1.10/FILE0001.210']
+    output = parse_gemfiles(fn, n_threads = 3)
+    assert isinstance(output[1], FileNotFoundError)
+    for i in [0, 2]:
+        reference = parse_gemfile_columns(fn[i])
+        for key in ['D_millis', 'D_ADC', 'G', 'M']:
+            assert np.array_equal(output[i][key], reference[key])
+
+def test_parse_threads_in_workers():
+    ## worker processes parse in one thread, so a pool of N processes doesn't run N*CPUs threads
+    from concurrent.futures import ProcessPoolExecutor
+    from gemlog.core import _parse_threads
+    assert _parse_threads() is None
+    with ProcessPoolExecutor(max_workers = 1) as pool:
+        assert pool.submit(_parse_threads).result() == 1
+
+def test_parse_gembuffer():
+    fn = b'../data/v1.10/FILE0001.210'
+    reference = parse_gemfile_columns(fn)
+    with open(fn, 'rb') as f:
+        raw = f.read()
+    for buffer in [raw, bytearray(raw), np.frombuffer(raw, dtype = np.uint8)]:
+        output = parse_gembuffer(buffer)
+        for key in ['D_millis', 'D_ADC', 'G', 'M']:
+            assert np.array_equal(output[key], reference[key])
+        assert output['num_rows'] == reference['num_rows']
+    ## unusual numbers fall back to sscanf and give the same result as parse_gemfile
+    raw = b'D1.5e1,+20\nD 30,-4\nM,1e1,3.00,20,0,0,1,2,3,4,5,6,7\nG,10,0.5,2022,1,2,3,4,5.5,inf,-100\nD40\n'
+    with open('buffer_test.txt', 'wb') as f:
+        f.write(raw)
+    values, line_types, millis = parse_gemfile(b'buffer_test.txt')
+    output = parse_gembuffer(raw)
+    assert np.array_equal(output['D_millis'], millis[line_types == b'D'])
+    assert np.array_equal(output['D_ADC'], values[line_types == b'D', 0])
+    assert np.isinf(output['G']['lat'][0])
+    assert output['num_rows'] == 5
+    assert parse_gembuffer(b'')['num_rows'] == 0
+    ## integrated data values
+    output = parse_gembuffer(raw, integrate = True)
+    assert np.array_equal(output['data'][:,0], [15, 30, 40])
+    assert np.array_equal(output['data'][:,1], [20, 16, 56])
+    ## aligned millis without integration: the data values are unchanged
+    output = parse_gembuffer(b'D10,5\nD20,7\nD30,1\n', offset = 0)
+    assert np.array_equal(output['data'], [[10, 5], [20, 7], [30, 1]])
+    output = parse_gembuffer(b'D10,5\nD20,7\nD30,1\n', offset = 8192 + 5, integrate = True)
+    assert np.array_equal(output['data'], [[8202, 5], [8212, 12], [8222, 13]])
+
+def test_raw_index():
+    shutil.rmtree('raw_index', ignore_errors = True)
+    os.makedirs('raw_index')
+    for fn in ['FILE0000.210', 'FILE0001.210']:
+        shutil.copy('../data/v1.10/' + fn, 'raw_index/' + fn)
+    shutil.copy('../data/FILE0000.000', 'raw_index/FILE0002.210')
+    read_gem('raw_index', nums = [0], SN = '210')
+    assert not os.path.exists('raw_index/.gemlog') # reading doesn't write into the raw directory
+    index = RawIndex('raw_index', sidecar = 'raw_index_sidecar/raw_index.json')
+    assert index.names() == ['FILE0000.210', 'FILE0001.210', 'FILE0002.210']
+    assert index.serial_numbers() == ['210']
+    assert index.files('210') == ['raw_index/FILE0000.210', 'raw_index/FILE0001.210']
+    assert index.files('210', nums = [1]) == ['raw_index/FILE0001.210']
+    record = index.record('FILE0001.210')
+    columns = parse_gemfile(b'raw_index/FILE0001.210')
+    assert (record['SN'], record['version'], record['num']) == ('210', '1.10', 1)
+    assert record['first_millis'] == columns[2][0]
+    assert record['last_millis'] == columns[2][-1]
+    assert record['has_gps']
+    assert index.record('FILE0002.210')['error'] == 'EmptyRawFile'
+    assert index.record('FILE0000.210')['first_millis'] == parse_gemfile(b'raw_index/FILE0000.210')[2][0]
+    index.save()
+    assert os.path.exists('raw_index_sidecar/raw_index.json')
+    assert not os.path.exists('raw_index/.gemlog')
+    RawIndex('raw_index').save() # without a sidecar, nothing is saved
+    assert not os.path.exists('raw_index/.gemlog')
+
+    ## saved records are reused, and changed files are scanned again
+    with open('raw_index/FILE0001.210', 'a') as f:
+        f.write('D1,1\n')
+    index = RawIndex('raw_index', sidecar = 'raw_index_sidecar/raw_index.json')
+    assert 'FILE0000.210' in index._records
+    assert 'FILE0001.210' not in index._records
+    assert index.record('FILE0001.210')['last_millis'] == 1
+    ## a sidecar made for another directory is ignored
+    assert len(RawIndex('parsed_cache', sidecar = 'raw_index_sidecar/raw_index.json')._records) == 0
+
+    ## scanning in parallel gives the same records; SN_nums uses the header SN of TXT files
+    shutil.copy('../data/v0.91/FILE0040.059', 'raw_index/FILE0040.TXT')
+    index = RawIndex('raw_index')
+    index.scan(num_processes = 2)
+    assert len(index._records) == 4
+    serial_index = RawIndex('raw_index')
+    assert all(index._records[name] == serial_index.record(name) for name in index.names())
+    assert index.SN_nums() == {'210': [0, 1], '059': [40]}
+
+## with a raw file index, read_gem takes serial numbers from the index instead of reading each file again
+def test_read_gem_SN_from_index(monkeypatch):
+    import gemlog.core
+    index = RawIndex('../data/v1.10')
+    expected = read_gem('../data/v1.10', nums = [0, 1], SN = '210', raw_index = index)
+    def fail(fn):
+        raise AssertionError('_read_SN called for ' + str(fn))
+    monkeypatch.setattr(gemlog.core, '_read_SN', fail)
+    actual = read_gem('../data/v1.10', nums = [0, 1], SN = '210', raw_index = index)
+    assert list(actual['header'].SN) == ['210', '210']
+    assert actual['header'].equals(expected['header'])
+
+## reading a file from the parsed-file cache must give exactly the same output as parsing it, for
+## any offset, and the cache must not be used once the file changes
+def test_parsed_cache():
+    shutil.rmtree('parsed_cache', ignore_errors = True)
+    os.makedirs('parsed_cache')
+    files = ['parsed_cache/FILE0000.210', 'parsed_cache/FILE0001.210', 'parsed_cache/FILE0040.059']
+    for fn, source in zip(files, ['../data/v1.10/FILE0000.210', '../data/v1.10/FILE0001.210', '../data/v0.91/FILE0040.059']):
+        shutil.copy(source, fn)
+    def assert_identical(x, y):
+        assert np.array_equal(x['data'], y['data'])
+        for table in ['metadata', 'gps']:
+            assert x[table].equals(y[table])
+            assert list(x[table].dtypes) == list(y[table].dtypes)
+    for fn in files:
+        for offset in [0, 5787, 72005263.93]:
+            expected = _read_single(fn, offset)
+            assert_identical(expected, _read_single(fn, offset, cache = True))
+            assert _parsed_cache_valid(fn, '0.9', True)
+            assert_identical(expected, _read_single(fn, offset, cache = True))
+    expected = _read_several(files[:2])
+    actual = _read_several(files[:2], cache = True)
+    assert_identical(expected, actual)
+    assert expected['header'].equals(actual['header'])
+
+    ## the cache is keyed by the read settings and the file's size and modification time
+    assert not _parsed_cache_valid(files[0], '0.9', False)
+    with open(files[0], 'ab') as f:
+        f.write(b'\n')
+    assert not _parsed_cache_valid(files[0], '0.9', True)
+
+def _slow_find_breaks(L):
+    ## the original loop-based gemlog.core._find_breaks, as a reference for the vectorized version
+    ## breaks are specified as their millis for comparison between GPS and data
+    ## sanity check: exclude suspect GPS tags
+    t = np.asarray(L['gps'].t, dtype = 'float')
+    tPad = np.concatenate([t[:1], t, t[-1:]])
+    try:
+        badTags = ((t > time.time()) | # no future dates 
+                   (L['gps'].year < 2015) | # no years before the Gem existed
+                   ((np.abs(t - tPad[:-2]) > 86400) & (np.abs(t - tPad[2:]) > 86400)) | # exclude outliers
+                   (L['gps'].lat == 0) | # exclude points within ~1m of the equator
+                   (L['gps'].lon == 0)) # exclude points within ~1m of the prime meridian
+        L['gps'] = L['gps'].iloc[np.where(~badTags)[0],:]
+    except:
+        pass
+    mD = np.array(L['data'][:,0]) # data millis
+    dmD = np.diff(mD)
+    starts = np.array([])
+    ends = np.array([])
+    dataBreaks = np.where((dmD > 25) | (dmD < 0))[0]
+    if 0 in dataBreaks:
+        mD = mD[1:]
+        dmD = dmD[1:]
+        dataBreaks = dataBreaks[dataBreaks != 0] - 1
+    if (len(dmD) - 1) in dataBreaks:
+        mD = mD[:-1]
+        dmD = dmD[:-1]
+        dataBreaks = dataBreaks[dataBreaks != len(dmD)]
+    for i in dataBreaks:
+        starts = np.append(starts, np.max(mD[(i-1):(i+2)]))
+        ends = np.append(ends, np.min(mD[(i-1):(i+2)]))
+    tG = np.array(L['gps'].t).astype('float') # gps times
+    mG = np.array(L['gps'].msPPS).astype('float') # gps millis
+    dmG_dtG = np.diff(mG)/np.diff(tG) * 1.024 # correction for custom millis in gem firmware (1024 us/ms)
+    gpsBreaks = np.argwhere(np.isnan(dmG_dtG) | # missing data...unlikely
+                            ((np.diff(tG) > 50) & ((dmG_dtG > 1000.1) | (dmG_dtG < 999.9))) | # 100 ppm drift between cycles
+                            ((np.diff(tG) <= 50) & ((dmG_dtG > 1002) | (dmG_dtG < 998))) # most likely: jumps within a cycle (possibly due to leap second)
+    )
+    min_possible_start = mD.min() # this only changes if a GPS break around the first GPS sample invalidates preceding D samples
+    for i in gpsBreaks:
+        i = int(i)
+        ## This part is tricky: what if a gpsEnd happens between a dataEnd and dataStart?
+        ## Let's be conservative: if either the gpsEnd or gpsStart is within a bad data interval, or what if they bracket a bad data interval?
+        ## choose them so that they exclude the most data
+        overlaps = (mG[i] <= starts) & (mG[i+1] >= ends)
+        if(np.any(overlaps)):
+            w = np.argwhere(overlaps)
+            starts[w] = max(np.append(starts[w], mG[(i-1):(i+2)].max()))
+            ends[w] = max(np.append(ends[w], mG[(i-1):(i+2)].min()))
+        else:
+            wmin = np.argwhere(tG > tG[i])
+            ## If a file's very last gps fix triggered a break, an exception would be raised here.
+            ## This is unlikely and it's not clear now what the right thing to do is. So not implemented.
+            try:
+                starts = np.append(starts, mG[wmin][tG[wmin] == tG[wmin].min()][-1]) # [-1] just in case tG values are repeated
+            except:
+                pass
+            wmax = np.argwhere(tG < tG[i+1])
+            ## It's possible for a gps break to occur so early that no good fixes occur before the
+            ## break (e.g., leap second change). In that case, pre-break data are unrecoverable.
+            if len(wmax) == 0: # empty wmax means no fixes before break
+                min_possible_start = tG[i+1]
+            else: # normal: add an end at this break
+                ends = np.append(ends, mG[wmax][tG[wmax] == tG[wmax].max()][-1]) # [-1] in case tG values are repeated
+    starts = np.append(min_possible_start, starts)
+    ends = np.append(ends, mD.max())
+    return {'starts':starts, 'ends':ends}
+
+def assert_same_breaks(L):
+    ## _find_breaks must find exactly the same breaks as the loop-based version
+    import copy
+    expected = _slow_find_breaks(copy.deepcopy(L))
+    actual = _find_breaks(copy.deepcopy(L))
+    for key in ['starts', 'ends']:
+        assert np.array_equal(actual[key], expected[key], equal_nan = True)
+
+@pytest.mark.parametrize('files', [['../data/v1.10/FILE0000.210', '../data/v1.10/FILE0001.210'],
+                                   ['../data/v0.91/FILE0040.059'],
+                                   ['../data/v1.10/FILE0001.210']])
+def test_find_breaks_raw(files):
+    L = _read_several(files, require_gps = False)
+    assert_same_breaks(L)
+    ## cut out some data and GPS fixes to add data and GPS breaks
+    L['data'] = np.delete(L['data'], np.r_[2000:3000, 10000:10100], axis = 0)
+    L['gps'] = L['gps'].drop(L['gps'].index[100:400])
+    assert_same_breaks(L)
+
+def test_find_breaks_no_data():
+    L = _read_several(['../data/v0.91/FILE0040.059'])
+    L['data'] = L['data'][:0]
+    with pytest.raises(EmptyRawFile):
+        _find_breaks(L)
+
+def test_find_breaks_huddle_test():
+    ## GPS fixes from the huddle test (cycling GPS), timed by a drifting millis clock, with
+    ## glitches of the kinds that cause GPS breaks
+    import pandas as pd
+    gps = pd.read_csv('../data/test_data/huddle_test/gps/182gps_000.txt')
+    t = np.array([float(obspy.UTCDateTime(tt)) for tt in gps.t])
+    gps = pd.DataFrame({'year': gps.year, 'lat': gps.lat, 'lon': gps.lon, 't': t,
+                        'msPPS': 5000 + (t - t[0]) * 1000/1.024 * (1 + 20e-6)})
+    mD = np.arange(0, gps.msPPS.max() + 10000, 10.24)
+    L = {'data': np.array([mD, np.zeros(len(mD))]).T, 'gps': gps}
+    assert_same_breaks(L)
+    rng = np.random.default_rng(3)
+    for i in range(10):
+        glitched = gps.copy()
+        w = np.sort(rng.choice(np.arange(5, len(gps) - 5), 4, replace = False))
+        glitched.loc[w[0]:, 't'] += 1 # leap second
+        glitched.loc[w[1], 'msPPS'] += 50 # bad msPPS
+        glitched.loc[w[2]:, 'msPPS'] -= 3000 # millis reset
+        glitched.loc[w[3], 't'] = glitched.t[w[3] - 1] # repeated time
+        data = np.delete(L['data'], np.r_[1000*i:1000*i+50], axis = 0)
+        assert_same_breaks({'data': data, 'gps': glitched})
+
+def _slow_robust_regress(x, y, z = 4, recursive_depth = np.inf, verbose = False):
+    ## the original recursive gemlog.core._robust_regress (refitting with polyfit after each round
+    ## of outlier removal), as a reference for the incremental version
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        reg = np.polynomial.polynomial.polyfit(x, y, 3)[::-1]
+    resid = y - (reg[3] + x * reg[2] + x**2 * reg[1] + x**3 * reg[0])
+    outliers = np.abs(resid) > (z*np.std(resid))
+    if any(outliers) and (recursive_depth > 0):
+        return _slow_robust_regress(x[~outliers], y[~outliers], z, recursive_depth = recursive_depth - 1, verbose = verbose)
+    else:
+        return (reg, len(x), np.max(np.abs(resid)), resid, x, y)
+
+def assert_same_regression(expected, actual, x):
+    ## same points kept, same fit (to well within GPS timing precision), same statistics
+    reg0, num0, MAD0, resid0, x0, y0 = expected
+    reg1, num1, MAD1, resid1, x1, y1 = actual
+    assert num0 == num1
+    assert np.array_equal(x0, x1) and np.array_equal(y0, y1)
+    fit = lambda reg: reg[3] + x * reg[2] + x**2 * reg[1] + x**3 * reg[0]
+    assert np.abs(fit(reg0) - fit(reg1)).max() < 1e-5
+    assert np.abs(MAD0 - MAD1) < 1e-5
+    assert np.abs(np.asarray(resid0) - np.asarray(resid1)).max() < 1e-5
+
+def test_robust_regress():
+    for fn in ['../data/v0.91/FILE0040.059', '../data/v1.10/FILE0001.210']:
+        L = _read_single(fn, 72005263)
+        x, y = L['gps'].msPPS, L['gps'].t
+        assert_same_regression(_slow_robust_regress(x, y), _robust_regress(x, y), x)
+    ## a drifting clock with GPS jitter and outliers of very different sizes, so that outliers
+    ## are removed over several rounds
+    rng = np.random.default_rng(4)
+    n = 7200
+    x = 72005263 + np.arange(n) * 1000/1.024 * (1 + 20e-6)
+    t = 1.65e9 + np.arange(n) + 1e-12 * np.arange(n)**3 + rng.normal(0, 1e-4, n)
+    previous = _slow_robust_regress(x, t)[0]
+    for i in range(5):
+        y = t.copy()
+        w = rng.choice(n, 40, replace = False)
+        y[w] += rng.choice([0.01, -1, 1, 3600, 86400, -1.6e9], 40)
+        expected = _slow_robust_regress(x, y)
+        assert expected[1] <= n - 40
+        assert_same_regression(expected, _robust_regress(x, y), x)
+        ## a warm start doesn't change the result, whether it's good or useless
+        assert_same_regression(expected, _robust_regress(x, y, initial_reg = previous), x)
+        assert_same_regression(expected, _robust_regress(x, y, initial_reg = [0, 0, 0.001024, 0]), x)
+        assert_same_regression(expected, _robust_regress(x, y, initial_reg = previous, warm_start_tolerance = 1e-4), x)
+    ## rounds of outlier removal are capped
+    assert _robust_regress(x, y, recursive_depth = 0)[1] == n
+    with pytest.raises(np.linalg.LinAlgError):
+        _robust_regress(x[:3], t[:3])
+
+def test_robust_regress_singular():
+    ## GPS fixes at only three distinct millis (e.g., a stuck msPPS) can't determine a cubic:
+    ## the regression fails, so the drift is assumed to be zero, or the file is skipped if GPS is
+    ## required
+    import pandas as pd
+    from gemlog.core import CorruptRawFileInadequateGPS
+    rng = np.random.default_rng(5)
+    for jitter in [0, 1e-3]:
+        msPPS = np.repeat([5000., 5e6, 1e7], 10) + rng.normal(0, jitter, 30)
+        t = 1.65e9 + msPPS * 0.001024 + rng.normal(0, 1e-5, 30)
+        with pytest.raises(np.linalg.LinAlgError):
+            _robust_regress(msPPS, t)
+        mD = np.arange(4000., 1.0001e7, 10)
+        L = {'gps': pd.DataFrame({'msPPS': msPPS, 't': t, 'lat': 43.6, 'lon': -116.2}),
+             'data': np.array([mD, np.zeros(len(mD))]).T}
+        header_info = _calculate_drift(L, 'FILE0000.077', require_gps = False)
+        assert [header_info['drift_deg' + str(i)] for i in [3, 2, 1]] == [0, 0, 0.001024]
+        assert header_info['drift_deg0'] == np.mean(t - 0.001024 * msPPS)
+        assert header_info['num_gps_nonoutliers'] == 30
+        with pytest.raises(CorruptRawFileInadequateGPS):
+            _calculate_drift(L, 'FILE0000.077', require_gps = True)
+
+def test_gps_epoch_seconds():
+    ## must match obspy.UTCDateTime, with NaN where UTCDateTime raises an exception
+    dates = [(2020, 2, 29, 23, 59, 59), (2021, 2, 29, 0, 0, 0), (2020, 4, 31, 1, 1, 1),
+             (2020, 1, 1, 24, 0, 0), (2020, 1, 1, 0, 60, 0), (2020, 1, 1, 0, 0, 60),
+             (2039, 12, 31, 12, 30, 15), (2014, 13, 1, 0, 0, 0)]
+    t = _gps_epoch_seconds(*np.array(dates).T)
+    for date, tt in zip(dates, t):
+        try:
+            reference = float(obspy.UTCDateTime(*date))
+        except Exception:
+            assert np.isnan(tt)
+        else:
+            assert tt == reference
+
+def test_apply_segments():
+    ## compare with evaluating each segment on a boolean mask
+    import pandas as pd
+    model = pd.DataFrame({'start_ms': [0, 1000, 1500, np.nan], 'end_ms': [1200, 2000, 1800, 3000],
+                          'drift_deg0': [1.5e9, 1.6e9, 1.7e9, 0], 'drift_deg1': [1e-3, 2e-3, 3e-3, 1],
+                          'drift_deg2': [1e-12, 2e-12, 0, 1], 'drift_deg3': [1e-20, 0, 3e-20, 1]})
+    rng = np.random.default_rng(1)
+    x = np.concatenate([np.sort(rng.uniform(-100, 2500, 1000)), [1000, 1200, 1500, 1800, 2000]])
+    for xx in [np.sort(x), x, np.append(x, np.nan)]:
+        reference = np.full(len(xx), np.nan)
+        for i in range(model.shape[0]):
+            w = (xx >= model['start_ms'][i]) & (xx <= model['end_ms'][i])
+            reference[w] = _apply_fit(xx[w], model.iloc[i,:])
+        assert np.array_equal(_apply_segments(xx, model), reference, equal_nan = True)
+
+def test_spline_interp_blocks():
+    ## fitting the spline in overlapping blocks must match a single spline over all the data
+    import scipy.interpolate
+    rng = np.random.default_rng(2)
+    t = 1.6e9 + np.cumsum(0.01 + rng.normal(0, 1e-4, 20000))
+    p = np.cumsum(rng.normal(0, 30, 20000))
+    t_out = np.round(t[0] + np.arange(np.trunc((t[-1] - t[0])/0.01)) * 0.01, 2)
+    reference = scipy.interpolate.CubicSpline(t, p)(t_out)
+    assert np.abs(_spline_interp(t, p, t_out, block = 1000) - reference).max() < 1e-9
+    with pytest.raises(ValueError):
+        _spline_interp(t[::-1], p, t_out, block = 1000)
+
+def test_iter_output_chunks():
+    ## output files must not depend on how the data are split into blocks
+    from gemlog.core import _iter_output_chunks
+    t0 = obspy.UTCDateTime('2022-01-01T00:10:00.37')
+    x = (np.arange(900000) % 1000).astype('int32')
+    def run(pieces, block_edges):
+        streams = []
+        for i1, i2 in block_edges:
+            st = obspy.Stream()
+            for j1, j2 in pieces:
+                if (j2 > i1) and (j1 < i2):
+                    tr = obspy.Trace(x[max(i1, j1):min(i2, j2)])
+                    tr.stats.starttime = t0 + max(i1, j1)/100
+                    tr.stats.delta = 0.01
+                    st += tr
+            streams.append(st)
+        t1 = obspy.UTCDateTime(np.ceil(float(t0)))
+        t2 = obspy.UTCDateTime('9999-12-31')
+        return [(str(tr.stats.starttime), tr.data.copy()) for tr in _iter_output_chunks(streams, t1, t2, 1800)]
+    ## 2.5 hours of data with a 10-minute gap
+    pieces = [(0, 600000), (660000, 900000)]
+    one_block = run(pieces, [(0, 900000)])
+    assert [t for t, d in one_block] == ['2022-01-01T00:10:01.000000Z', '2022-01-01T00:30:00.000000Z',
+                                         '2022-01-01T01:00:00.000000Z', '2022-01-01T01:30:00.000000Z',
+                                         '2022-01-01T02:00:00.370000Z', '2022-01-01T02:30:00.000000Z']
+    assert np.array_equal(np.concatenate([d for t, d in one_block]), np.concatenate([x[63:600000], x[660000:]]))
+    for block_edges in [[(0, 100000), (100000, 900000)], [(i, i + 7000) for i in range(0, 900000, 7000)]]:
+        many_blocks = run(pieces, block_edges)
+        assert [t for t, d in many_blocks] == [t for t, d in one_block]
+        assert all(np.array_equal(a[1], b[1]) for a, b in zip(many_blocks, one_block))
+    ## a gap of up to 3 samples between blocks is interpolated
+    gap_blocks = run([(0, 300000), (300002, 600000)], [(0, 300000), (300002, 600000)])
+    assert len(gap_blocks) == 4
+    assert len(gap_blocks[2][1]) == 180000
+    assert np.array_equal(gap_blocks[2][1][[35, 36, 39]], [998, 999, 2]) # 2022-01-01T01:00:00.37 is sample 300000
+    assert 2 < gap_blocks[2][1][38] < gap_blocks[2][1][37] < 999
+
+def test_write_traces_background():
+    from gemlog.core import _write_traces_background
+    traces = []
+    for i in range(6):
+        tr = obspy.Trace(np.arange(1000, dtype = 'int32') * i)
+        tr.stats.starttime = obspy.UTCDateTime('2022-01-01') + 3600 * i
+        tr.stats.delta = 0.01
+        tr.stats.station = 'TEST'
+        traces.append(tr)
+    os.makedirs('background', exist_ok = True)
+    written = _write_traces_background(iter(traces), 0.5, 'background', queue_size = 2)
+    assert written == [f'2022-01-01T{i:02}_00_00..TEST...mseed' for i in range(6)]
+    for i, fn in enumerate(written):
+        st = obspy.read('background/' + fn)
+        assert np.array_equal(st[0].data, traces[i].data)
+    ## errors in the writer thread are raised in the caller
+    with pytest.raises(Exception):
+        _write_traces_background(iter(traces), 0.5, 'nonexistent_directory')
+
+def test_write_mseed_steim1():
+    import io
+    from gemlog.core import write_mseed_steim1
+    rng = np.random.default_rng(0)
+    cases = [np.cumsum(rng.integers(-300, 300, 10000)), # mostly 8-bit differences
+             rng.choice([0, 1, -200, 40000, -2**31, 2**31-1], 5000), # all widths, with overflow
+             np.array([5]), np.arange(7)] # partial first frame
+    for data in cases:
+        for reclen in [512, 4096]:
+            tr = obspy.Trace(data.astype('int32'))
+            tr.stats.starttime = obspy.UTCDateTime('2022-01-01T01:02:03.45')
+            tr.stats.sampling_rate = 100
+            tr.stats.network, tr.stats.station, tr.stats.location = 'XX', 'TEST', '01'
+            obspy_buffer = io.BytesIO()
+            tr.copy().write(obspy_buffer, format = 'MSEED', encoding = 10, reclen = reclen)
+            buffer = io.BytesIO()
+            write_mseed_steim1(tr, buffer, reclen = reclen)
+            assert buffer.getvalue() == obspy_buffer.getvalue()
+            buffer.seek(0)
+            assert np.array_equal(obspy.read(buffer)[0].data, tr.data)
+    ## traces the encoder does not handle are written by obspy
+    tr = obspy.Trace(np.arange(100, dtype = 'int32'))
+    tr.stats.sampling_rate = 3
+    write_mseed_steim1(tr, 'steim1_fallback.mseed')
+    assert np.array_equal(obspy.read('steim1_fallback.mseed')[0].data, tr.data)